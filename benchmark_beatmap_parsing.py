@@ -0,0 +1,56 @@
+import argparse
+import os
+import time
+
+from osu.beatmap.beatmap import Beatmap
+from osu.training.utils import is_osu_file
+
+TEST_BEATMAPS_DIR = "osu/tests/resources/beatmaps/"
+
+
+def find_osu_files(dirs):
+    osu_files = []
+    for d in dirs:
+        for root, _, files in os.walk(d):
+            for file in sorted(files):
+                if is_osu_file(file):
+                    osu_files.append(os.path.join(root, file))
+    return osu_files
+
+
+def time_parse(path, repeat, columnar):
+    # Invalid beatmaps still go through the parser so time them as well.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            Beatmap.from_osu_file(path, columnar=columnar)
+        except Exception:
+            pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def set_and_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("dirs", nargs="*", help="directories to search for .osu files",
+                        default=[TEST_BEATMAPS_DIR])
+    parser.add_argument("--repeat", help="number of timed parses per file, the best is reported",
+                        type=int, default=20)
+    parser.add_argument("--columnar", help="store hit objects in a structured array",
+                        action="store_true")
+    return parser.parse_args()
+
+
+args = set_and_parse_args()
+osu_files = find_osu_files(args.dirs)
+total = 0
+for osu_file in osu_files:
+    elapsed = time_parse(osu_file, args.repeat, args.columnar)
+    total += elapsed
+    print(f"{elapsed * 1000:8.3f} ms  {osu_file}")
+if osu_files:
+    print(
+        f"{len(osu_files)} files, mean {total / len(osu_files) * 1000:.3f} ms per file.")
@@ -0,0 +1,171 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from osu.audio.audio_preprocessor import BEATROOT_BACKEND, BEATROOT_JAR_PATH, FFMPEG_PATH, NUMPY_BACKEND, ONSET_BACKENDS
+from osu.audio.beats_file import read_beats_dir, read_beats_file
+from osu.audio.decode_profile import DECODE_PROFILES
+from osu.audio.onset_detector import decode_audio_chunks, detect_beats_and_onsets
+from osu.audio.process_supervisor import ProcessSupervisor
+from osu.audio.scratch_dir import ScratchDir
+from osu.audio.streaming_beatroot import validate_driver_profile
+from osu.beatmap import beat_normalizer
+
+TEST_BEAT_DATA_DIR = "osu/tests/resources/beat_data/"
+
+# Profile the accuracy of the others is measured against.
+REFERENCE_PROFILE = "full"
+
+# Seconds within which a detected onset counts as matching a reference onset.
+ONSET_TOLERANCE = 0.02
+
+
+def click_audio(onsets, profile):
+    # A decaying noise burst at every onset, placed where the beat tracking offset correction expects it.
+    rng = np.random.default_rng(0)
+    click_length = int(0.05 * profile.sample_rate)
+    click = rng.normal(0, 0.3, click_length) * \
+        np.exp(-np.arange(click_length) / (0.01 * profile.sample_rate))
+    samples = rng.normal(0, 0.005, int(
+        (onsets[-1] + 1) * profile.sample_rate))
+    for onset in onsets - beat_normalizer.BEAT_TRACKING_TIMING_OFFSET:
+        first = max(int(round(onset * profile.sample_rate)), 0)
+        samples[first:first + click_length] += click[:samples.size - first]
+    if profile.sample_format == "s16le":
+        # Quantize as decoding to 16 bit would.
+        samples = np.round(np.clip(samples, -1, 1) * 32767) / 32768
+    return samples.astype(np.float32)
+
+
+def timing_error(reference, detected):
+    """Returns the bpm difference and the distance in ms of the detected offset from the reference beat grid."""
+    (reference_points, reference_bpm, _), (points, bpm, _) = reference, detected
+    offset, mpb = reference_points[0]
+    phase = (points[0][0] - offset) % mpb
+    return abs(bpm - reference_bpm), min(phase, mpb - phase)
+
+
+def onset_match_rate(reference, detected):
+    if reference.size == 0 or detected.size == 0:
+        return 0
+    indices = np.clip(np.searchsorted(detected, reference), 1, detected.size - 1)
+    distances = np.minimum(np.abs(detected[indices - 1] - reference),
+                           np.abs(detected[indices] - reference))
+    return float(np.mean(distances <= ONSET_TOLERANCE))
+
+
+def smoke_test_corpus(songs, profiles):
+    # The bundled corpus only holds beat tracking output, so click audio is synthesized from its onsets at every profile.
+    # Only the NumPy detector runs on it and nothing is decoded, so this checks the detector works at every profile
+    # but says little about the speed or accuracy of a profile on real songs.
+    rows = []
+    for name, beats, onsets in songs:
+        reference = beat_normalizer.get_timing_info(beats, onsets)
+        for profile_name in profiles:
+            profile = DECODE_PROFILES[profile_name]
+            samples = click_audio(onsets, profile)
+            start = time.perf_counter()
+            detected_beats, detected_onsets = detect_beats_and_onsets(
+                [samples], profile.sample_rate)
+            detection_time = time.perf_counter() - start
+            bpm_error, offset_error = timing_error(
+                reference, beat_normalizer.get_timing_info(detected_beats, detected_onsets))
+            rows.append((name, NUMPY_BACKEND, profile_name, None, detection_time, bpm_error, offset_error,
+                         onset_match_rate(onsets, detected_onsets)))
+    return rows
+
+
+def run_numpy(file, profile, supervisor):
+    start = time.perf_counter()
+    chunks = list(decode_audio_chunks(
+        FFMPEG_PATH, file, profile, supervisor=supervisor))
+    decode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    beats, onsets = detect_beats_and_onsets(chunks, profile.sample_rate)
+    return beats, onsets, decode_time, time.perf_counter() - start
+
+
+def run_beatroot(file, profile, supervisor):
+    # The path audio takes without BeatRoot workers: decoded to a WAV file, which the BeatRoot command line tool reads.
+    validate_driver_profile(profile)
+    with ScratchDir("benchmark") as scratch:
+        wav_file = scratch.file("audio.wav")
+        beats_file = scratch.file("beats.csv")
+        start = time.perf_counter()
+        if supervisor.run([FFMPEG_PATH, "-y"] + profile.input_args() + ["-i", file] + profile.output_args(raw=False) + [wav_file]) != 0:
+            raise Exception(f"Decoding {file} failed.")
+        decode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        if supervisor.run(supervisor.java_command(["-cp", BEATROOT_JAR_PATH, "at.ofai.music.beatroot.BeatRoot", "-x", beats_file, wav_file]),
+                          limit_memory=False) != 0:
+            raise Exception(f"BeatRoot failed on {file}.")
+        detection_time = time.perf_counter() - start
+        profile.shift_beats_file(beats_file)
+        beats, onsets = read_beats_file(beats_file)
+    return beats, onsets, decode_time, detection_time
+
+
+def benchmark_files(files, profiles, backends):
+    supervisor = ProcessSupervisor()
+    runners = {NUMPY_BACKEND: run_numpy, BEATROOT_BACKEND: run_beatroot}
+    rows = []
+    for file in files:
+        for backend in backends:
+            results = {}
+            for profile_name in [REFERENCE_PROFILE] + [p for p in profiles if p != REFERENCE_PROFILE]:
+                beats, onsets, decode_time, detection_time = runners[backend](
+                    file, DECODE_PROFILES[profile_name], supervisor)
+                results[profile_name] = (beat_normalizer.get_timing_info(beats, onsets), onsets,
+                                         decode_time, detection_time)
+            # Every profile is compared against the same detector on the full quality audio.
+            reference, reference_onsets, _, _ = results[REFERENCE_PROFILE]
+            for profile_name in profiles:
+                timing_info, onsets, decode_time, detection_time = results[profile_name]
+                bpm_error, offset_error = timing_error(reference, timing_info)
+                rows.append((os.path.basename(file), backend, profile_name, decode_time, detection_time, bpm_error, offset_error,
+                             onset_match_rate(reference_onsets, onsets)))
+    return rows
+
+
+def print_rows(rows, profiles):
+    print(f"{'song':24} {'backend':9} {'profile':10} {'decode':>9} {'detect':>9} {'bpm err':>8} {'offset err':>11} {'onsets':>7}")
+    for name, backend, profile_name, decode_time, detection_time, bpm_error, offset_error, match_rate in rows:
+        decode = "-" if decode_time is None else f"{decode_time * 1000:.0f} ms"
+        print(f"{name:24} {backend:9} {profile_name:10} {decode:>9} {detection_time * 1000:6.0f} ms {bpm_error:8.1f} {offset_error:8.1f} ms {match_rate:7.1%}")
+
+    print("Totals:")
+    for backend in dict.fromkeys(row[1] for row in rows):
+        for profile_name in profiles:
+            profile_rows = [row for row in rows if row[1]
+                            == backend and row[2] == profile_name]
+            decode_times = [row[3]
+                            for row in profile_rows if row[3] is not None]
+            decode = f"{sum(decode_times) * 1000:.0f} ms" if decode_times else "-"
+            exact_bpms = sum(1 for row in profile_rows if row[5] == 0)
+            print(f"{backend:9} {profile_name:10} decode {decode:>9}, detect {sum(row[4] for row in profile_rows) * 1000:6.0f} ms, "
+                  f"{exact_bpms}/{len(profile_rows)} exact bpms, median offset error {np.median([row[6] for row in profile_rows]):.1f} ms, "
+                  f"{np.mean([row[7] for row in profile_rows]):.1%} onsets matched")
+
+
+def set_and_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("files", nargs="*", help="audio files to decode with ffmpeg and run the onset detectors on, compared against the full profile. "
+                        "Without any, only a smoke test runs the NumPy detector on audio synthesized from the bundled beat data")
+    parser.add_argument("--profiles", nargs="+", help="decode profiles to measure",
+                        choices=list(DECODE_PROFILES), default=list(DECODE_PROFILES))
+    parser.add_argument("--backends", nargs="+", help="onset detectors to measure on the audio files",
+                        choices=ONSET_BACKENDS, default=ONSET_BACKENDS)
+    return parser.parse_args()
+
+
+args = set_and_parse_args()
+if args.files:
+    rows = benchmark_files(args.files, args.profiles, args.backends)
+else:
+    print("Smoke test on synthesized clicks, pass audio files to measure decoding and BeatRoot on real songs.")
+    rows = smoke_test_corpus(read_beats_dir(
+        TEST_BEAT_DATA_DIR), args.profiles)
+print_rows(rows, args.profiles)
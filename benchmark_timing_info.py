@@ -0,0 +1,121 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from osu.audio.beats_file import read_beats_dir
+from osu.beatmap import beat_normalizer
+
+TEST_BEAT_DATA_DIR = "osu/tests/resources/beat_data/"
+
+# Lengths in minutes of the synthetic mixes built by chaining the corpus songs.
+SYNTHETIC_MIX_MINUTES = [10, 30, 60]
+
+
+def synthetic_mix(songs, minutes):
+    # Chain the songs end to end until the mix is long enough.
+    target = minutes * 60
+    all_beats = []
+    all_onsets = []
+    shift = 0
+    while shift < target:
+        for _, beats, onsets in songs:
+            all_beats.append(beats + shift)
+            all_onsets.append(onsets + shift)
+            shift += max(beats[-1], onsets[-1]) + 1
+            if shift >= target:
+                break
+    return f"mix_{minutes}min", np.concatenate(all_beats), np.concatenate(all_onsets)
+
+
+def benchmark_song(beats, onsets, repeat, tempo_search):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        beat_normalizer.get_timing_info(beats, onsets, tempo_search)
+        latencies.append(time.perf_counter() - start)
+
+    # Measure memory in a separate run as tracing slows everything down.
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    timing_info = beat_normalizer.get_timing_info(beats, onsets, tempo_search)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del timing_info
+    # Blocks the call left allocated, including its result, leaving out the snapshots themselves.
+    # Blocks allocated and freed during the call are not seen here, peak_bytes covers those.
+    ignore_tracemalloc = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    differences = after.filter_traces(ignore_tracemalloc).compare_to(
+        before.filter_traces(ignore_tracemalloc), "filename")
+    return {
+        "latency_ms_min": min(latencies) * 1000,
+        "latency_ms_mean": sum(latencies) / len(latencies) * 1000,
+        "peak_bytes": peak_bytes,
+        "retained_blocks": sum(d.count_diff for d in differences),
+        "retained_bytes": sum(d.size_diff for d in differences)
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except Exception:
+        return None
+
+
+def print_comparison(results, previous):
+    previous_results = {r["name"]: r for r in previous["results"]}
+    for result in results:
+        old = previous_results.get(result["name"])
+        if old is None:
+            continue
+        ratio = result["latency_ms_min"] / old["latency_ms_min"]
+        print(f"{result['name']:24} {old['latency_ms_min']:9.3f} ms -> {result['latency_ms_min']:9.3f} ms ({ratio:.2f}x)")
+
+
+def set_and_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--repeat", help="number of timed runs per song",
+                        type=int, default=10)
+    parser.add_argument("--output", help="file to save the results to as JSON",
+                        default=None)
+    parser.add_argument("--compare", help="results file of a previous run to compare latencies against",
+                        default=None)
+    parser.add_argument("--tempo-search", help="search tempos with the onset autocorrelation",
+                        action="store_true")
+    parser.add_argument("--no-synthetic", help="only run the bundled songs",
+                        action="store_true")
+    return parser.parse_args()
+
+
+args = set_and_parse_args()
+songs = read_beats_dir(TEST_BEAT_DATA_DIR)
+cases = list(songs)
+if not args.no_synthetic:
+    cases.extend(synthetic_mix(songs, minutes)
+                 for minutes in SYNTHETIC_MIX_MINUTES)
+
+results = []
+for name, beats, onsets in cases:
+    result = {"name": name, "duration_s": float(beats[-1] - beats[0]),
+              "num_beats": int(beats.size), "num_onsets": int(onsets.size)}
+    result.update(benchmark_song(beats, onsets, args.repeat, args.tempo_search))
+    results.append(result)
+    print(f"{name:24} {result['latency_ms_min']:9.3f} ms  {result['peak_bytes'] / 1024:9.1f} KiB peak  "
+          f"{result['retained_blocks']:6} blocks {result['retained_bytes'] / 1024:9.1f} KiB retained")
+
+report = {"commit": current_commit(), "python": platform.python_version(),
+          "numpy": np.__version__, "results": results}
+if args.output:
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+if args.compare:
+    with open(args.compare, "r") as f:
+        print_comparison(results, json.load(f))
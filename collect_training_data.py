@@ -1,115 +1,196 @@
 import argparse
+from functools import partial
 from html.parser import HTMLParser
 import logging
 import os
-import shutil
 import signal
+import threading
 import zipfile
 
 import requests
 
-from osu.audio.audio_preprocessor import AudioPreprocessor
+from osu.audio.audio_preprocessor import BEATROOT_BACKEND, ONSET_BACKENDS, AudioPreprocessor
+from osu.audio.decode_profile import DECODE_PROFILES
+from osu.audio.onset_cache import DEFAULT_CACHE_DIR, OnsetCache
+from osu.audio.process_supervisor import DEFAULT_CPU_LIMIT, DEFAULT_MEMORY_LIMIT, DEFAULT_TIMEOUT, ProcessSupervisor
+from osu.audio.scratch_dir import ScratchDir
 from osu.beatmap.beatmap import Beatmap
+from osu.data_collection.beatmapset_downloader import DEFAULT_BURST, DEFAULT_CONCURRENCY, DEFAULT_DOWNLOAD_DIR, DEFAULT_RATE, DEFAULT_RETRIES, BeatmapsetDownloader
+from osu.data_collection.crawl_checkpoint import CRAWL_MODES, DEFAULT_CHECKPOINT_PATH, FULL_CRAWL, NEWER_CRAWL, RESUME_CRAWL, CrawlCheckpoint
+from osu.data_collection.pipeline import DEFAULT_QUEUE_SIZE, Pipeline
 from osu.difficulty.difficulty_properties import DifficultyProperties
 from osu.training.utils import is_osu_file, training_path
 
 OSU_SIGNIN_PAGE = "https://osu.ppy.sh/home"
-# Recently ranked beatmapsets with osu standard filter.
-BASE_SEARCH_URL = "https://osu.ppy.sh/beatmapsets/search?m=0&s=ranked"
 OSU_STANDARD_MODE = 0
 LOGIN_FORM_TOKEN_PARAM = "_token"
 
 
-def retrieve_beatmap_data(session, beatmapset_limit, logger, sigint_catcher):
+def retrieve_beatmap_data(downloader, beatmapset_limit, logger, sigint_catcher, checkpoint, crawl_mode=FULL_CRAWL,
+                          save_audio=AudioPreprocessor.save_training_audio, parse_workers=1, audio_workers=1, queue_size=DEFAULT_QUEUE_SIZE,
+                          scratch_root=None):
     if beatmapset_limit <= 0:
         return
-    count_beatmapsets_retrieved = 0
-    # Track pagination.
-    cursor_approved_date = None
-    cursor_id = None
-
-    while True:
-        # Match scrolling behavior of https://osu.ppy.sh/beatmapsets.
-        if cursor_approved_date and cursor_id:
-            request_url = f"{BASE_SEARCH_URL}&cursor%5Bapproved_date%5D={cursor_approved_date}&cursor%5B_id%5D={cursor_id}"
-        else:
-            request_url = BASE_SEARCH_URL
-
-        logger.debug(f"Retrieving listing: {request_url}.")
-        data = session.get(request_url).json()
-
-        # Extract cursor data for the next request.
-        cursor_data = data["cursor"]
-        cursor_approved_date = cursor_data["approved_date"]
-        cursor_id = cursor_data["_id"]
-
-        for beatmapset in data["beatmapsets"]:
-            if sigint_catcher.caught_sigint:
-                logger.debug("Caught SIGINT. Terminating gracefully.")
-                return
+    budget = BeatmapsetBudget(beatmapset_limit)
+    # Listing, downloading, parsing and audio processing overlap, each stage held back by a bounded queue to the next.
+    # The listing is told when the pipeline stops, so it does not walk on through pages of beatmapsets that are already done.
+    pipeline = Pipeline(partial(new_beatmapsets,
+                        downloader, logger, checkpoint, crawl_mode), queue_size)
+    pipeline.add_stage("download", partial(download_beatmapset, downloader, checkpoint, logger), downloader.concurrency,
+                       on_error=partial(fail_beatmapset, checkpoint, logger, "Download"))
+    pipeline.add_stage("parse", partial(parse_beatmapset, checkpoint, logger, scratch_root), parse_workers,
+                       on_error=partial(fail_beatmapset, checkpoint, logger, "Parsing"))
+    pipeline.add_stage("audio", partial(process_beatmapset, budget, checkpoint, logger, save_audio), audio_workers,
+                       discard=discard_beatmapset_job, on_error=partial(fail_beatmapset, checkpoint, logger, "Processing"))
+    for _ in pipeline.run(lambda: sigint_catcher.caught_sigint):
+        if budget.is_spent():
+            pipeline.stop()
+    if sigint_catcher.caught_sigint:
+        logger.debug(
+            "Caught SIGINT. Finished the beatmapsets in progress and terminated gracefully.")
+
 
-            saved_new = process_beatmapset(session, beatmapset, logger)
-            if saved_new:
-                count_beatmapsets_retrieved += 1
-                if count_beatmapsets_retrieved >= beatmapset_limit:
+def new_beatmapsets(downloader, logger, checkpoint, crawl_mode=FULL_CRAWL, should_stop=None):
+    start_cursor = None
+    if crawl_mode == RESUME_CRAWL:
+        if checkpoint.complete:
+            logger.debug(
+                "The last crawl reached the end of the listing, nothing to resume.")
+            return
+        start_cursor = checkpoint.cursor
+        logger.debug(f"Resuming the listing at {start_cursor}." if start_cursor is not None else
+                     "No crawl to resume, starting from the newest beatmapsets.")
+    # Only a walk that goes on from where the previous one stopped can be resumed.
+    if crawl_mode != NEWER_CRAWL:
+        checkpoint.begin_walk(start_cursor)
+
+    # The listing can shift while it is paged through, repeating beatmapsets.
+    seen_ids = set()
+    for cursor, beatmapsets, next_cursor in downloader.search_pages(start_cursor, should_stop):
+        checkpoint.add_page(
+            cursor, [beatmapset["id"] for beatmapset in beatmapsets], next_cursor)
+        for beatmapset in beatmapsets:
+            # Skipping beatmapsets that are done yields nothing for a long time, so stopping is checked for every one.
+            if should_stop is not None and should_stop():
+                return
+            validate_beatmapset(beatmapset)
+            beatmapset_id = beatmapset["id"]
+            if beatmapset_id in seen_ids:
+                continue
+            seen_ids.add(beatmapset_id)
+            # Check if we already have this beatmapset.
+            if checkpoint.is_done(beatmapset_id) or os.path.exists(training_folder(beatmapset)):
+                if crawl_mode == NEWER_CRAWL:
+                    logger.debug(
+                        f"Reached beatmapset {beatmapset_id} from an earlier crawl, stopping the listing.")
                     return
+                logger.debug(
+                    f"Beatmapset {beatmapset_id} is already part of the training data.")
+                checkpoint.mark_done(beatmapset_id, save=False)
+                continue
+            yield beatmapset
 
 
-def process_beatmapset(session, beatmapset, logger):
-    logger.debug("======================================")
-    validate_beatmapset(beatmapset)
-    # Check if we already have this beatmapset.
-    beatmapset_dir = training_folder(beatmapset)
-    if os.path.exists(beatmapset_dir):
-        beatmapset_id = beatmapset["id"]
-        logger.debug(
-            f"Beatmapset {beatmapset_id} is already part of the training data.")
-        return False
-    # Create the beatmapset training folder. Even if processing fails, we can use this as a marker to skip next time.
-    os.makedirs(beatmapset_dir)
+def download_beatmapset(downloader, checkpoint, logger, beatmapset):
+    beatmapset_id = beatmapset["id"]
+    try:
+        archive_path = downloader.download(beatmapset_id)
+    except Exception as e:
+        # Nothing is saved, so the beatmapset is tried again by the next crawl listing it.
+        logger.debug(f"Failed to download beatmapset {beatmapset_id}: {e}")
+        checkpoint.mark_failed(beatmapset_id)
+        return None
+    logger.debug(f"Downloaded beatmapset {beatmapset_id}.")
+    return beatmapset, archive_path
 
-    # Download the beatmap and extract it to a temporary directory.
-    temp_dir = "temp"
-    retrieve_beatmapset(session, beatmapset, temp_dir, logger)
 
-    successful = process_osu_folder(
-        beatmapset, temp_dir, beatmapset_dir, logger)
+def parse_beatmapset(checkpoint, logger, scratch_root, download):
+    beatmapset, archive_path = download
+    beatmapset_id = beatmapset["id"]
+    logger.debug(f"Parsing beatmapset {beatmapset_id}.")
+    # The scratch directory holds the extracted audio until the audio stage is done with it.
+    scratch = ScratchDir(f"beatmapset-{beatmapset_id}", scratch_root).create()
+    audio_path = None
+    try:
+        # Read the beatmaps straight from the downloaded archive, which is only needed until then.
+        with zipfile.ZipFile(archive_path, "r") as archive:
+            beatmap_infos = process_osu_members(archive, logger)
+            audio_member = get_audio_member(
+                beatmap_infos, archive, logger) if beatmap_infos else None
+            if audio_member:
+                # Only the audio file is extracted, backgrounds, hitsounds and storyboards stay in the archive.
+                audio_path = archive.extract(audio_member, scratch.path)
+    except Exception:
+        scratch.cleanup()
+        raise
+    os.remove(archive_path)
+
+    if audio_path is None:
+        if len(beatmap_infos) == 0:
+            logger.debug(
+                f"No valid beatmaps found, skipping beatmapset {beatmapset_id}.")
+        scratch.cleanup()
+        # Use the beatmapset training folder as a marker to skip it next time.
+        os.makedirs(training_folder(beatmapset))
+        checkpoint.mark_done(beatmapset_id)
+        return None
+    return beatmapset, beatmap_infos, audio_path, scratch
 
-    # Finished. Remove the temporary directory.
-    shutil.rmtree(temp_dir)
-    return successful
 
+def process_beatmapset(budget, checkpoint, logger, save_audio, job):
+    beatmapset, beatmap_infos, audio_path, scratch = job
+    beatmapset_id = beatmapset["id"]
+    try:
+        if not budget.reserve():
+            return None
+        saved = False
+        try:
+            # Create the beatmapset training folder. Even if processing fails, we can use this as a marker to skip next time.
+            training_dir = training_folder(beatmapset)
+            os.makedirs(training_dir)
+            logger.debug(f"Processing audio of beatmapset {beatmapset_id}.")
+            try:
+                save_audio(audio_path, training_dir)
+            except Exception as e:
+                logger.debug(
+                    f"Audio processing of beatmapset {beatmapset_id} failed: {e}")
+                return None
 
-def process_osu_folder(beatmapset, osu_dir, training_dir, logger):
-    beatmap_infos = process_osu_files(osu_dir, logger)
-    if len(beatmap_infos) == 0:
-        logger.debug("No valid beatmaps found, skipping beatmapset.")
-        return False
+            save_osu_files(beatmap_infos, training_dir)
+            save_difficulty_info(beatmapset, beatmap_infos, training_dir)
+            logger.debug(
+                f"New beatmapset {beatmapset_id} saved successfully.")
+            saved = True
+            return saved
+        finally:
+            budget.release(saved)
+            checkpoint.mark_done(beatmapset_id)
+    finally:
+        scratch.cleanup()
 
-    audio_path = get_audio_path(beatmap_infos, osu_dir, logger)
-    if not audio_path:
-        return False
-    logger.debug("Processing audio.")
-    try:
-        AudioPreprocessor.save_training_audio(audio_path, training_dir)
-    except Exception as e:
-        logger.debug(f"Audio processing failed: {e}")
-        return False
 
-    copy_osu_files(beatmap_infos, training_dir)
-    save_difficulty_info(beatmapset, beatmap_infos, training_dir)
-    logger.debug("New beatmapset saved successfully.")
-    return True
+def fail_beatmapset(checkpoint, logger, stage, item, error):
+    # Items are beatmapsets until they are downloaded, then tuples starting with the beatmapset.
+    beatmapset = item if isinstance(item, dict) else item[0]
+    logger.debug(f"{stage} of beatmapset {beatmapset['id']} failed: {error}")
+    # Lets a resumed crawl move past the beatmapset's page.
+    checkpoint.mark_failed(beatmapset["id"])
 
 
-def process_osu_files(osu_dir, logger):
+def discard_beatmapset_job(job):
+    # The beatmapset is left unmarked, so it is retrieved again next time.
+    job[3].cleanup()
+
+
+def process_osu_members(archive, logger):
     beatmap_infos = []
-    for file in os.listdir(osu_dir):
+    for member in archive.infolist():
+        file = member.filename
         if is_osu_file(file):
-            full_path = os.path.join(osu_dir, file)
             try:
-                beatmap = Beatmap.from_osu_file(full_path)
-                beatmap_infos.append((beatmap, full_path))
+                data = archive.read(member)
+                beatmap = Beatmap.from_bytes(data)
+                beatmap_infos.append((beatmap, data))
                 logger.debug(
                     f"Processed beatmap [{file}] successfully.")
             except Exception as e:
@@ -129,40 +210,31 @@ def save_difficulty_info(beatmapset, beatmap_infos, training_dir):
         diff_map, training_dir)
 
 
-def copy_osu_files(beatmap_infos, training_dir):
+def save_osu_files(beatmap_infos, training_dir):
     for beatmap_info in beatmap_infos:
         beatmap = beatmap_info[0]
-        full_path = beatmap_info[1]
+        data = beatmap_info[1]
         dest = os.path.join(training_dir, f"{beatmap.id}.osu")
-        os.rename(full_path, dest)
+        with open(dest, "wb") as f:
+            f.write(data)
 
 
 def training_folder(beatmapset):
     return training_path(str(beatmapset["id"]))
 
 
-def get_audio_path(beatmap_infos, osu_dir, logger):
+def get_audio_member(beatmap_infos, archive, logger):
     audio_paths = set(map(lambda b: b[0].audio_path, beatmap_infos))
     if len(audio_paths) != 1:
         logger.debug("Multiple audio paths found.")
         return None
-    return os.path.join(osu_dir, audio_paths.pop())
-
-
-def retrieve_beatmapset(session, beatmapset, out_dir, logger):
-    beatmapset_id = beatmapset["id"]
-    beatmapset_download_link = f"https://osu.ppy.sh/beatmapsets/{beatmapset_id}/download?noVideo=1"
-    logger.debug(
-        f"Retrieving beatmapset: {beatmapset_download_link}.")
-    response = session.get(beatmapset_download_link)
-    temp_file = "temp.zip"
-    with open(temp_file, "wb") as f:
-        f.write(response.content)
-    with zipfile.ZipFile(temp_file, "r") as zip_ref:
-        zip_ref.extractall(out_dir)
-    logger.debug(
-        "Download finished.")
-    os.remove(temp_file)
+    audio_path = audio_paths.pop()
+    # The game looks files up case-insensitively.
+    for member in archive.infolist():
+        if member.filename.lower() == audio_path.lower():
+            return member
+    logger.debug(f"Audio file [{audio_path}] not found in the archive.")
+    return None
 
 
 def validate_beatmapset(beatmapset):
@@ -184,6 +256,52 @@ def set_and_parse_args():
                         type=int, default=1000)
     parser.add_argument("--quiet", help="hide debug output",
                         action="store_true")
+    parser.add_argument("--crawl-mode", help="where to walk the beatmapset listing from: the newest beatmapsets, where the last walk stopped, "
+                        "or the newest until reaching beatmapsets from an earlier crawl", choices=CRAWL_MODES, default=FULL_CRAWL)
+    parser.add_argument("--checkpoint", help="file remembering how far the listing was walked and which beatmapsets are done",
+                        default=DEFAULT_CHECKPOINT_PATH)
+    parser.add_argument("--beatroot-workers", help="number of long-lived BeatRoot processes to reuse across beatmapsets, 0 starts one per beatmapset",
+                        type=int, default=0)
+    parser.add_argument("--streaming-beatroot", help="pipe decoded audio straight into BeatRoot instead of through a WAV file when no BeatRoot workers are used",
+                        action="store_true")
+    parser.add_argument("--onset-backend", help="onset detector to use, the NumPy one runs in process without Java",
+                        choices=ONSET_BACKENDS, default=BEATROOT_BACKEND)
+    parser.add_argument("--onset-cache-dir", help="directory of the onset cache shared by beatmapsets with the same audio",
+                        default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--onset-cache-mb", help="size the onset cache is kept within by evicting the least recently used entries",
+                        type=float, default=256)
+    parser.add_argument("--no-onset-cache", help="always run onset detection",
+                        action="store_true")
+    parser.add_argument("--decode-profile", help="channels and sample rate audio is decoded to for onset detection",
+                        choices=list(DECODE_PROFILES), default="full")
+    parser.add_argument("--decode-start", help="seconds of audio to skip before onset detection",
+                        type=float, default=None)
+    parser.add_argument("--decode-end", help="second of audio onset detection stops at",
+                        type=float, default=None)
+    parser.add_argument("--job-timeout", help="seconds an audio tool may run on one beatmapset before it is killed",
+                        type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument("--memory-limit-mb", help="memory an audio tool may use",
+                        type=int, default=DEFAULT_MEMORY_LIMIT >> 20)
+    parser.add_argument("--cpu-limit", help="seconds of CPU time an audio tool may use on one beatmapset",
+                        type=int, default=DEFAULT_CPU_LIMIT)
+    parser.add_argument("--download-workers", help="number of beatmapsets downloaded at once",
+                        type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests-per-second", help="rate requests to osu are limited to",
+                        type=float, default=DEFAULT_RATE)
+    parser.add_argument("--request-burst", help="number of requests that may be sent at once after a quiet spell",
+                        type=int, default=DEFAULT_BURST)
+    parser.add_argument("--download-retries", help="number of times a failed request is retried",
+                        type=int, default=DEFAULT_RETRIES)
+    parser.add_argument("--parse-workers", help="number of beatmapsets read from their archives at once",
+                        type=int, default=1)
+    parser.add_argument("--audio-workers", help="number of beatmapsets whose audio is processed at once, best matched to --beatroot-workers",
+                        type=int, default=1)
+    parser.add_argument("--queue-size", help="number of beatmapsets waiting between two stages of the collection",
+                        type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--scratch-dir", help="directory jobs keep their intermediate files in, best on a fast disk or tmpfs. "
+                        "Defaults to the system temporary directory")
+    parser.add_argument("--download-dir", help="directory archives are downloaded to, partial downloads in it are resumed",
+                        default=DEFAULT_DOWNLOAD_DIR)
     return parser.parse_args()
 
 
@@ -235,6 +353,33 @@ def create_logger(hide_debug):
     return logger
 
 
+class BeatmapsetBudget():
+    """Counts saved beatmapsets against the limit. Beatmapsets being processed hold a reservation, so concurrent workers never save more than it."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.saved = 0
+        self.reserved = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            if self.saved + self.reserved >= self.limit:
+                return False
+            self.reserved += 1
+            return True
+
+    def release(self, saved):
+        with self.lock:
+            self.reserved -= 1
+            if saved:
+                self.saved += 1
+
+    def is_spent(self):
+        with self.lock:
+            return self.saved >= self.limit
+
+
 class SigintCatcher():
     def __init__(self):
         self.caught_sigint = False
@@ -251,4 +396,45 @@ session = login_to_osu(args.username, args.password, logger)
 # Set up a handler for SIGINT so the process can terminate gracefully.
 sigint_catcher = SigintCatcher()
 signal.signal(signal.SIGINT, sigint_catcher.handle_sigint)
-retrieve_beatmap_data(session, args.limit, logger, sigint_catcher)
+checkpoint = CrawlCheckpoint(args.checkpoint)
+# Collectors that were killed cannot have cleaned up after themselves.
+stale_scratch_dirs = ScratchDir.clean_stale(args.scratch_dir)
+if stale_scratch_dirs > 0:
+    logger.debug(
+        f"Removed {stale_scratch_dirs} scratch directories left by earlier runs.")
+downloader = BeatmapsetDownloader(session, args.download_workers, args.requests_per_second,
+                                  args.request_burst, args.download_retries, download_dir=args.download_dir)
+use_beatroot_pool = args.onset_backend == BEATROOT_BACKEND and args.beatroot_workers > 0
+supervisor = ProcessSupervisor(
+    args.job_timeout, args.memory_limit_mb << 20, args.cpu_limit)
+beatroot_pool = AudioPreprocessor.create_beatroot_pool(
+    args.beatroot_workers, supervisor, args.scratch_dir) if use_beatroot_pool else None
+if use_beatroot_pool and beatroot_pool is None:
+    logger.debug(
+        "BeatRoot workers unavailable, starting BeatRoot for every beatmapset.")
+onset_cache = None if args.no_onset_cache else OnsetCache(
+    args.onset_cache_dir, int(args.onset_cache_mb * 1024 * 1024))
+decode_profile = DECODE_PROFILES[args.decode_profile].trimmed(
+    args.decode_start, args.decode_end)
+save_audio = partial(AudioPreprocessor.save_training_audio, streaming=args.streaming_beatroot, beatroot_pool=beatroot_pool,
+                     backend=args.onset_backend, onset_cache=onset_cache, decode_profile=decode_profile, supervisor=supervisor,
+                     scratch_root=args.scratch_dir)
+try:
+    retrieve_beatmap_data(downloader, args.limit, logger, sigint_catcher, checkpoint, args.crawl_mode,
+                          save_audio, args.parse_workers, args.audio_workers, args.queue_size, args.scratch_dir)
+finally:
+    checkpoint.save()
+    logger.debug(f"Retried {downloader.retry_count} requests.")
+    logger.debug(
+        f"{len(checkpoint.failed_ids)} beatmapsets failed, a full crawl tries them again.")
+    for tool, counts in supervisor.get_stats().items():
+        logger.debug(
+            f"{tool}: {counts['runs']} runs, {counts['timeouts']} timeouts.")
+    if onset_cache is not None:
+        stats = onset_cache.get_stats()
+        logger.debug(
+            f"Onset cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, {stats['hit_rate']:.1%} hit rate.")
+        onset_cache.flush_stats()
+    if beatroot_pool is not None:
+        logger.debug(f"BeatRoot worker stats: {beatroot_pool.get_stats()}.")
+        beatroot_pool.close()
@@ -0,0 +1,43 @@
+import argparse
+
+from osu.audio import onset_cache
+from osu.training import label_cache
+
+CACHES = {
+    "onsets": (onset_cache.OnsetCache, onset_cache.DEFAULT_CACHE_DIR),
+    "labels": (label_cache.LabelCache, label_cache.DEFAULT_CACHE_DIR)
+}
+
+
+def set_and_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("cache", choices=CACHES.keys(),
+                        help="the onset cache or the parsed beatmap and label cache")
+    parser.add_argument("command", choices=["stats", "clean", "clear"],
+                        help="show the cache size and, for onsets, the hit rate, evict old and least recently used entries, or remove everything")
+    parser.add_argument("--cache-dir", help="directory of the cache, by default the one the cache is created in",
+                        default=None)
+    parser.add_argument("--max-mb", help="size to evict down to when cleaning",
+                        type=float, default=None)
+    return parser.parse_args()
+
+
+args = set_and_parse_args()
+cache_class, default_cache_dir = CACHES[args.cache]
+cache = cache_class(args.cache_dir or default_cache_dir)
+if args.command == "clean":
+    max_bytes = None if args.max_mb is None else int(args.max_mb * 1024 * 1024)
+    removed = cache.clean(max_bytes)
+    print(f"Removed {removed} entries.")
+elif args.command == "clear":
+    cache.clear()
+num_entries, num_bytes = cache.disk_usage()
+print(f"{num_entries} entries using {num_bytes} bytes.")
+# Only the onset cache keeps its hit rate across sessions.
+if args.cache == "onsets":
+    stats = cache.saved_stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups > 0 else 0
+    print(
+        f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, {hit_rate:.1%} hit rate.")
@@ -0,0 +1,27 @@
+import argparse
+import os
+
+from osu.audio.audio_preprocessor import AudioPreprocessor
+from osu.training.utils import training_path
+
+
+def set_and_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--training-dir", help="directory of the collected training data",
+                        default=training_path())
+    return parser.parse_args()
+
+
+args = set_and_parse_args()
+migrated = 0
+for beatmapset_id in sorted(os.listdir(args.training_dir)):
+    beatmapset_path = os.path.join(args.training_dir, beatmapset_id)
+    if not os.path.isdir(beatmapset_path):
+        continue
+    try:
+        if AudioPreprocessor.migrate_training_audio(beatmapset_path):
+            migrated += 1
+    except Exception as e:
+        print(f"Skipped [{beatmapset_path}]: {e}")
+print(f"Migrated the onsets of {migrated} beatmapsets.")
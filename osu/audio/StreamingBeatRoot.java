@@ -0,0 +1,170 @@
+package at.ofai.music.beatroot;
+
+import java.io.BufferedReader;
+import java.io.FileInputStream;
+import java.io.FilterInputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.util.Arrays;
+
+import javax.sound.sampled.AudioFormat;
+import javax.sound.sampled.AudioInputStream;
+import javax.sound.sampled.AudioSystem;
+
+import at.ofai.music.util.EventList;
+
+/**
+ * Runs BeatRoot on raw 16 bit little endian PCM read from standard input so
+ * decoded audio never has to be written to disk.
+ *
+ * Usage: StreamingBeatRoot -r sampleRate -c channels -o outputFile [-O]
+ *
+ * The output file holds a line of comma separated beat times followed by a
+ * line of onset times, or only the onset times with -O.
+ *
+ * With -w the process instead stays alive as a worker reading one tab
+ * separated job per line from standard input and answering each on standard
+ * output, so the JVM start up and warm up are only paid once:
+ *
+ * PING answers PONG.
+ * TRACK sampleRate channels onsetOnly inputFile outputFile reads raw PCM from
+ * the input file, which may be a named pipe, and answers OK or ERROR message.
+ * QUIT exits.
+ */
+public class StreamingBeatRoot extends AudioProcessor {
+
+	/** Reads until the buffer is full or the stream ends as a pipe may return short reads. */
+	static class FullReadInputStream extends FilterInputStream {
+		FullReadInputStream(InputStream in) {
+			super(in);
+		}
+
+		@Override
+		public int read(byte[] b, int off, int len) throws IOException {
+			int total = 0;
+			while (total < len) {
+				int n = in.read(b, off + total, len - total);
+				if (n < 0)
+					return total == 0 ? -1 : total;
+				total += n;
+			}
+			return total;
+		}
+	}
+
+	public void setInputStream(InputStream in, float rate, int numChannels) {
+		audioFileName = "<stdin>";
+		sampleRate = rate;
+		channels = numChannels;
+		audioFormat = new AudioFormat(AudioFormat.Encoding.PCM_SIGNED, sampleRate, 16, channels,
+				channels * 2, sampleRate, false);
+		// Without a separate raw stream, init() sizes its buffers for the maximum length instead of the frame length.
+		rawInputStream = null;
+		pcmInputStream = new AudioInputStream(new FullReadInputStream(in), audioFormat,
+				AudioSystem.NOT_SPECIFIED);
+		init();
+	}
+
+	/**
+	 * With the length of the input unknown, init() sizes the spectral flux for
+	 * the longest input allowed, and the trailing zeros would change how it is
+	 * normalised for peak picking. Trimming it to the frames read gives the same
+	 * onsets as reading the audio from a file.
+	 */
+	@Override
+	public void processFile() {
+		while (pcmInputStream != null)
+			processFrame();
+		totalFrames = frameCount;
+		spectralFlux = Arrays.copyOf(spectralFlux, frameCount);
+		super.processFile();
+	}
+
+	private static void writeTimes(PrintStream out, double[] times) {
+		for (int i = 0; i < times.length; i++)
+			out.printf("%5.3f%c", times[i], i == times.length - 1 ? '\n' : ',');
+		if (times.length == 0)
+			out.println();
+	}
+
+	public static void track(InputStream in, float rate, int numChannels, String outputFile, boolean onsetOnly)
+			throws IOException {
+		StreamingBeatRoot processor = new StreamingBeatRoot();
+		processor.setInputStream(in, rate, numChannels);
+		processor.processFile();
+		EventList onsets = processor.onsetList;
+
+		PrintStream out = new PrintStream(outputFile);
+		try {
+			if (!onsetOnly)
+				writeTimes(out, BeatTrackDisplay.beatTrack(onsets).toOnsetArray());
+			writeTimes(out, onsets.toOnsetArray());
+		} finally {
+			out.close();
+		}
+	}
+
+	public static void serve() throws IOException {
+		// Keep standard output for replies only.
+		PrintStream replies = System.out;
+		System.setOut(System.err);
+		BufferedReader jobs = new BufferedReader(new InputStreamReader(System.in));
+		String line;
+		while ((line = jobs.readLine()) != null) {
+			String[] job = line.split("\t");
+			if (job[0].equals("PING")) {
+				replies.println("PONG");
+			} else if (job[0].equals("QUIT")) {
+				break;
+			} else if (job[0].equals("TRACK") && job.length == 6) {
+				try {
+					InputStream in = new FileInputStream(job[4]);
+					try {
+						track(in, Float.parseFloat(job[1]), Integer.parseInt(job[2]), job[5], job[3].equals("1"));
+					} finally {
+						in.close();
+					}
+					replies.println("OK");
+				} catch (Exception e) {
+					replies.println("ERROR " + String.valueOf(e).replace('\n', ' '));
+				}
+			} else {
+				replies.println("ERROR Unrecognized job: " + line);
+			}
+			replies.flush();
+		}
+	}
+
+	public static void main(String[] args) throws Exception {
+		float rate = 44100;
+		int numChannels = 2;
+		String outputFile = null;
+		boolean onsetOnly = false;
+		boolean worker = false;
+		for (int i = 0; i < args.length; i++) {
+			if (args[i].equals("-r"))
+				rate = Float.parseFloat(args[++i]);
+			else if (args[i].equals("-c"))
+				numChannels = Integer.parseInt(args[++i]);
+			else if (args[i].equals("-o"))
+				outputFile = args[++i];
+			else if (args[i].equals("-O"))
+				onsetOnly = true;
+			else if (args[i].equals("-w"))
+				worker = true;
+			else
+				throw new IllegalArgumentException("Illegal command line argument: " + args[i]);
+		}
+
+		silent = true;
+		if (worker) {
+			serve();
+			return;
+		}
+		if (outputFile == null)
+			throw new IllegalArgumentException("No output file specified");
+		track(System.in, rate, numChannels, outputFile, onsetOnly);
+	}
+}
@@ -1,35 +1,128 @@
 import os
-import subprocess
 
 import numpy as np
 
+from osu.audio.beatroot_pool import BeatRootPool
+from osu.audio.decode_profile import DEFAULT_DECODE_PROFILE
+from osu.audio.beats_file import read_beats_file
+from osu.audio.onset_detector import run_onset_detector
+from osu.audio.process_supervisor import ProcessSupervisor
+from osu.audio.scratch_dir import ScratchDir
+from osu.audio.streaming_beatroot import run_streaming_beatroot, streaming_classpath, validate_driver_profile
+
 FFMPEG_PATH = "osu/audio/ffmpeg.exe"
 BEATROOT_JAR_PATH = "osu/audio/beatroot.jar"
-OUTPUT_FILE_NAME = "audio.csv"
+OUTPUT_FILE_NAME = "audio.npy"
+
+# Onsets used to be saved as a comma separated line, which is still read and can be migrated.
+LEGACY_OUTPUT_FILE_NAME = "audio.csv"
+
+# Onset detection backends. BeatRoot runs in Java, the NumPy detector in process.
+BEATROOT_BACKEND = "beatroot"
+NUMPY_BACKEND = "numpy"
+ONSET_BACKENDS = [BEATROOT_BACKEND, NUMPY_BACKEND]
 
 
 class AudioPreprocessor:
     @staticmethod
-    def save_training_audio(audio_path, output_dir):
-        output_wav = os.path.join(output_dir, "audio.wav")
-        subprocess.run(
-            [FFMPEG_PATH, "-i", audio_path, output_wav], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if not os.path.exists(output_wav):
-            raise Exception("MP3 -> WAV conversion failed.")
-
-        output_csv = os.path.join(output_dir, OUTPUT_FILE_NAME)
-        subprocess.run(["java", "-cp", BEATROOT_JAR_PATH,
-                        "at.ofai.music.beatroot.BeatRoot", "-O", "-o", output_csv, output_wav], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        os.remove(output_wav)
+    def create_beatroot_pool(size=1, supervisor=None, scratch_root=None):
+        """Starts long-lived BeatRoot workers to pass to save_training_audio, or returns None if they are unavailable."""
+        return BeatRootPool.create(BEATROOT_JAR_PATH, FFMPEG_PATH, size, supervisor, scratch_root)
+
+    @staticmethod
+    def save_training_audio(audio_path, output_dir, streaming=False, beatroot_pool=None, backend=BEATROOT_BACKEND, onset_cache=None,
+                            decode_profile=DEFAULT_DECODE_PROFILE, supervisor=None, scratch_root=None):
+        """Saves the onsets of an audio file to the output directory.
+
+        With the NumPy backend the onsets are detected in process.
+        With BeatRoot, jobs go to the worker pool when one is given.
+        Otherwise with streaming set, the decoded audio is piped straight into a new BeatRoot process when the streaming driver can be built.
+        Streaming is off by default, its onsets match those of the BeatRoot command line tool reading a WAV file.
+        Failing both, it is decoded to a WAV file in a scratch directory under scratch_root first.
+        If an OnsetCache is given, audio it has seen before is not processed again.
+        The audio is decoded as described by the DecodeProfile and the onsets are saved as a .npy file.
+        The onsets file written by the detector stays in a scratch directory under scratch_root.
+        ffmpeg and BeatRoot run under the ProcessSupervisor, which kills them if they run past its timeout."""
+        supervisor = supervisor or ProcessSupervisor()
+
+        def track(output_path):
+            AudioPreprocessor._track_onsets(
+                audio_path, output_path, streaming, beatroot_pool, backend, decode_profile, supervisor, scratch_root)
+        with ScratchDir("onsets", scratch_root) as scratch:
+            output_csv = scratch.file("onsets.csv")
+            if onset_cache is None:
+                track(output_csv)
+            else:
+                onset_cache.track(audio_path, output_csv,
+                                  backend, True, track, decode_profile)
+            _, onsets = read_beats_file(output_csv, onsets_only=True)
+        _save_onsets(os.path.join(output_dir, OUTPUT_FILE_NAME), onsets)
+
+    @staticmethod
+    def _track_onsets(audio_path, output_csv, streaming, beatroot_pool, backend, profile, supervisor, scratch_root):
+        if backend == NUMPY_BACKEND:
+            run_onset_detector(FFMPEG_PATH, audio_path, output_csv,
+                               onsets_only=True, profile=profile, supervisor=supervisor)
+            return
+        if backend != BEATROOT_BACKEND:
+            raise Exception(f"Unknown onset backend: {backend}.")
+
+        validate_driver_profile(profile)
+        if beatroot_pool is not None:
+            beatroot_pool.track(audio_path, output_csv,
+                                onsets_only=True, profile=profile)
+            return
+
+        classpath = streaming_classpath(
+            BEATROOT_JAR_PATH) if streaming else None
+        if classpath is not None:
+            run_streaming_beatroot(FFMPEG_PATH, audio_path, classpath, output_csv,
+                                   onsets_only=True, profile=profile, supervisor=supervisor)
+            return
+
+        # Removing the scratch directory also removes a partial file left by a killed ffmpeg.
+        with ScratchDir("beatroot", scratch_root) as scratch:
+            output_wav = scratch.file("audio.wav")
+            supervisor.run([FFMPEG_PATH] + profile.input_args() + [
+                           "-i", audio_path] + profile.output_args(raw=False) + [output_wav])
+            if not os.path.exists(output_wav):
+                raise Exception("MP3 -> WAV conversion failed.")
+
+            supervisor.run(supervisor.java_command(["-cp", BEATROOT_JAR_PATH,
+                                                    "at.ofai.music.beatroot.BeatRoot", "-O", "-o", output_csv, output_wav]), limit_memory=False)
         if not os.path.exists(output_csv):
             raise Exception("Onset processing failed.")
+        profile.shift_beats_file(output_csv, onsets_only=True)
 
     @staticmethod
-    def read_training_audio(dir):
+    def read_training_audio(dir, mmap_mode="r"):
+        """Reads the onsets saved by save_training_audio, memory mapped by default.
+
+        Falls back to the legacy comma separated file of beatmapsets that have not been migrated."""
         onsets_file = os.path.join(dir, OUTPUT_FILE_NAME)
-        with open(onsets_file, "r") as f:
-            onsets = f.readline().split(",")
-            # Get rid of the newline.
-            onsets[-1] = onsets[-1][:-1]
-            onsets = list(map(lambda o: float(o), onsets))
-            return np.array(onsets)
+        if os.path.exists(onsets_file):
+            return np.load(onsets_file, mmap_mode=mmap_mode)
+        _, onsets = read_beats_file(os.path.join(
+            dir, LEGACY_OUTPUT_FILE_NAME), onsets_only=True)
+        return onsets
+
+    @staticmethod
+    def migrate_training_audio(dir):
+        """Converts the legacy onsets file of a beatmapset collected before onsets were saved as .npy files.
+
+        Returns whether there was a file to convert."""
+        csv_file = os.path.join(dir, LEGACY_OUTPUT_FILE_NAME)
+        if not os.path.exists(csv_file):
+            return False
+        _, onsets = read_beats_file(csv_file, onsets_only=True)
+        _save_onsets(os.path.join(dir, OUTPUT_FILE_NAME), onsets)
+        os.remove(csv_file)
+        return True
+
+
+def _save_onsets(onsets_file, onsets):
+    # Write to a temporary file first so an interrupted save never leaves a partial file.
+    temp_file = f"{onsets_file}.{os.getpid()}.tmp"
+    with open(temp_file, "wb") as f:
+        np.save(f, onsets.astype(np.float64))
+    os.replace(temp_file, onsets_file)
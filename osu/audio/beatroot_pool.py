@@ -0,0 +1,246 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+
+from osu.audio.decode_profile import DEFAULT_DECODE_PROFILE
+from osu.audio.process_supervisor import ProcessSupervisor
+from osu.audio.scratch_dir import ScratchDir
+from osu.audio.streaming_beatroot import DECODER_EXIT_TIMEOUT, DRIVER_CLASS_NAME, streaming_classpath, validate_driver_profile
+
+# Seconds a worker gets to answer a health check, which includes JVM start up after a restart.
+HEALTH_CHECK_TIMEOUT = 30
+
+# Seconds a worker may sit idle before it is health checked ahead of its next job.
+HEALTH_CHECK_INTERVAL = 60
+
+# Seconds a worker gets to exit after being asked to quit.
+WORKER_EXIT_TIMEOUT = 5
+
+# Seconds between attempts to release a pipe nobody opened for reading.
+WATCHER_POLL_INTERVAL = 0.1
+
+# Number of times a job is retried on a restarted worker after its worker crashed.
+JOB_RETRIES = 1
+
+
+class BeatRootWorker:
+    """A long-lived BeatRoot process answering one job per line over its standard input and output."""
+
+    def __init__(self, command, supervisor):
+        self.command = command
+        self.supervisor = supervisor
+        self.process = None
+        self.timed_out = False
+        self.last_used = time.monotonic()
+        self.start()
+
+    def start(self):
+        # Jobs are timed individually, so the CPU time of the whole process is not limited.
+        self.process = self.supervisor.popen(self.command, limit_memory=False, limit_cpu=False, stdin=subprocess.PIPE,
+                                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self.timed_out = False
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def request(self, line, timeout):
+        """Sends a line and returns the reply, or None if the worker died or did not answer in time. A timeout of None waits forever."""
+        if not self.is_alive():
+            return None
+        # Kill a hung worker so the blocking read returns.
+        timer = threading.Timer(
+            timeout, self._kill_hung) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            self.process.stdin.write(line + "\n")
+            self.process.stdin.flush()
+            reply = self.process.stdout.readline()
+        except OSError:
+            reply = ""
+        finally:
+            if timer is not None:
+                timer.cancel()
+        self.last_used = time.monotonic()
+        return reply.rstrip("\n") or None
+
+    def is_healthy(self):
+        return self.request("PING", HEALTH_CHECK_TIMEOUT) == "PONG"
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self.process.stdin.write("QUIT\n")
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=WORKER_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def _kill_hung(self):
+        self.timed_out = True
+        self.process.kill()
+
+
+class BeatRootPool:
+    """A pool of long-lived BeatRoot workers so the JVM start up and warm up are paid once rather than per song.
+
+    Workers run command, which speaks the worker protocol of the streaming driver. create starts the driver itself.
+    Audio is decoded by ffmpeg into a named pipe read by the worker, which is made in a scratch directory under scratch_root.
+    Workers idle for a while are health checked before their next job, and crashed workers or workers running past the job timeout of the ProcessSupervisor are restarted.
+    The pool may be shared between threads."""
+
+    def __init__(self, command, ffmpeg_path, size=1, supervisor=None, scratch_root=None):
+        self.command = command
+        self.ffmpeg_path = ffmpeg_path
+        self.scratch_root = scratch_root
+        self.supervisor = supervisor or ProcessSupervisor()
+        self.workers = [BeatRootWorker(self.command, self.supervisor)
+                        for _ in range(size)]
+        self._idle = queue.Queue()
+        for worker in self.workers:
+            self._idle.put(worker)
+        self._stats_lock = threading.Lock()
+        self.jobs = 0
+        self.restarts = 0
+
+    @staticmethod
+    def create(jar_path, ffmpeg_path, size=1, supervisor=None, scratch_root=None):
+        """Starts a pool of workers, or returns None if named pipes are unavailable or the worker driver cannot be built or started."""
+        if not hasattr(os, "mkfifo"):
+            return None
+        classpath = streaming_classpath(jar_path)
+        if classpath is None:
+            return None
+        supervisor = supervisor or ProcessSupervisor()
+        command = supervisor.java_command(
+            ["-Djava.awt.headless=true", "-cp", classpath, DRIVER_CLASS_NAME, "-w"])
+        try:
+            pool = BeatRootPool(command, ffmpeg_path, size,
+                                supervisor, scratch_root)
+        except FileNotFoundError:
+            return None
+        if not all(worker.is_healthy() for worker in pool.workers):
+            pool.close()
+            return None
+        return pool
+
+    def track(self, audio_path, output_path, onsets_only=False, profile=DEFAULT_DECODE_PROFILE):
+        """Tracks the beats and onsets of an audio file decoded as described by the decode profile, writing them to output_path in the same format as the streaming driver."""
+        validate_driver_profile(profile)
+        worker = self._idle.get()
+        try:
+            for _ in range(JOB_RETRIES + 1):
+                if not worker.is_alive() or (time.monotonic() - worker.last_used > HEALTH_CHECK_INTERVAL and not worker.is_healthy()):
+                    self._restart(worker)
+                reply, decoded = self._run_job(
+                    worker, audio_path, output_path, onsets_only, profile)
+                if reply is not None:
+                    break
+                timed_out = worker.timed_out
+                self._restart(worker)
+                if timed_out:
+                    self.supervisor.record_timeout(self.command)
+                    raise Exception(
+                        f"Onset processing timed out after {self.supervisor.timeout} seconds.")
+            else:
+                raise Exception("Onset processing failed: worker crashed.")
+        finally:
+            self._idle.put(worker)
+
+        with self._stats_lock:
+            self.jobs += 1
+        if not decoded:
+            raise Exception("Audio decoding failed.")
+        if reply != "OK":
+            raise Exception(
+                f"Onset processing failed: {reply[len('ERROR '):]}")
+        profile.shift_beats_file(output_path, onsets_only)
+
+    def check_health(self):
+        """Health checks every idle worker, restarting unhealthy ones. Returns the number restarted."""
+        workers = []
+        while True:
+            try:
+                workers.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        restarted = 0
+        try:
+            for worker in workers:
+                if not worker.is_healthy():
+                    self._restart(worker)
+                    restarted += 1
+        finally:
+            for worker in workers:
+                self._idle.put(worker)
+        return restarted
+
+    def get_stats(self):
+        return {"workers": len(self.workers), "jobs": self.jobs, "restarts": self.restarts}
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _restart(self, worker):
+        worker.restart()
+        with self._stats_lock:
+            self.restarts += 1
+
+    def _run_job(self, worker, audio_path, output_path, onsets_only, profile):
+        with ScratchDir("beatroot-job", self.scratch_root) as job_dir:
+            input_path = job_dir.file("audio.pcm")
+            os.mkfifo(input_path)
+            decoder = self.supervisor.popen([self.ffmpeg_path, "-v", "error", "-y"] + profile.input_args() + ["-i", audio_path] +
+                                            profile.output_args() + [input_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            # If decoding fails before the pipe is opened for writing, open it ourselves so the worker is not left waiting.
+            watcher = threading.Thread(
+                target=_release_pipe_on_failure, args=(decoder, input_path), daemon=True)
+            watcher.start()
+            try:
+                job = "\t".join(["TRACK", str(profile.sample_rate), str(profile.channels),
+                                "1" if onsets_only else "0", input_path, output_path])
+                reply = worker.request(job, self.supervisor.timeout)
+            finally:
+                # The decoder can be left blocked opening the pipe if the worker never read it.
+                try:
+                    decoder.wait(timeout=DECODER_EXIT_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    decoder.kill()
+                    decoder.wait()
+                # The watcher can be left blocked the same way, until the pipe is opened for reading.
+                while watcher.is_alive():
+                    reader = os.open(input_path, os.O_RDONLY | os.O_NONBLOCK)
+                    try:
+                        watcher.join(WATCHER_POLL_INTERVAL)
+                    finally:
+                        os.close(reader)
+            return reply, decoder.returncode == 0
+
+
+def _release_pipe_on_failure(decoder, pipe_path):
+    if decoder.wait() == 0:
+        return
+    # Blocks until the worker opens the pipe for reading, which then reads nothing.
+    os.close(os.open(pipe_path, os.O_WRONLY))
@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+
+
+def write_beats_file(path, beats, onsets):
+    """Writes a line of beat times, unless beats is None, followed by a line of onset times in the format of BeatRoot."""
+    with open(path, "w") as f:
+        if beats is not None:
+            f.write(",".join(f"{b:5.3f}" for b in beats) + "\n")
+        f.write(",".join(f"{o:5.3f}" for o in onsets) + "\n")
+
+
+def read_beats_file(path, onsets_only=False):
+    """Reads the beat and onset times written by BeatRoot or write_beats_file. Beats are None with onsets_only set."""
+    with open(path, "r") as f:
+        beats = None if onsets_only else _parse_times(f.readline())
+        onsets = _parse_times(f.readline())
+    return beats, onsets
+
+
+def _parse_times(line):
+    line = line.strip()
+    if not line:
+        return np.zeros(0)
+    return np.array([float(t) for t in line.split(",")])
+
+
+def read_beats_dir(dir):
+    """Reads every beats file in a directory, returning the name, beats and onsets of each, sorted by name."""
+    return [(os.path.splitext(file)[0],) + read_beats_file(os.path.join(dir, file))
+            for file in sorted(os.listdir(dir))]
@@ -0,0 +1,93 @@
+import numpy as np
+
+from osu.audio.beats_file import read_beats_file, write_beats_file
+
+# Raw sample formats audio can be decoded to, with the ffmpeg codec and NumPy type of each.
+SAMPLE_FORMATS = {
+    "s16le": ("pcm_s16le", "<i2"),
+    "f32le": ("pcm_f32le", "<f4")
+}
+
+
+class DecodeProfile:
+    """How audio is decoded for onset detection: channels, sample rate, raw sample format, and an optional trim in seconds.
+
+    Onset detection only needs mono audio at a modest rate, which is much cheaper to decode and process than the source.
+    Times detected in trimmed audio are shifted back so they stay relative to the start of the song.
+    With keep_source_format set, audio decoded to a file keeps the channels and sample rate of the source,
+    and only raw audio, which carries no header describing it, is converted."""
+
+    def __init__(self, channels=2, sample_rate=44100, sample_format="s16le", start=None, end=None, keep_source_format=False):
+        if channels < 1:
+            raise Exception("Decode profile needs at least one channel.")
+        if sample_rate <= 0:
+            raise Exception("Decode profile needs a positive sample rate.")
+        if sample_format not in SAMPLE_FORMATS:
+            raise Exception(f"Unknown sample format: {sample_format}.")
+        if start is not None and end is not None and end <= start:
+            raise Exception("Decode profile trim ends before it starts.")
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_format = sample_format
+        self.start = start
+        self.end = end
+        self.keep_source_format = keep_source_format
+
+    @staticmethod
+    def from_name(name):
+        if name not in DECODE_PROFILES:
+            raise Exception(f"Unknown decode profile: {name}.")
+        return DECODE_PROFILES[name]
+
+    def input_args(self):
+        """ffmpeg arguments going before the input file."""
+        # Seeking the input skips decoding the trimmed audio entirely.
+        return [] if self.start is None else ["-ss", str(self.start)]
+
+    def output_args(self, raw=True):
+        """ffmpeg arguments going before the output file. Without raw the container is left to the output file extension."""
+        args = []
+        if self.end is not None:
+            args += ["-t", str(self.end - (self.start or 0))]
+        if raw:
+            args += ["-f", self.sample_format]
+        elif self.keep_source_format:
+            return args
+        return args + ["-acodec", SAMPLE_FORMATS[self.sample_format][0],
+                       "-ac", str(self.channels), "-ar", str(self.sample_rate)]
+
+    def sample_dtype(self):
+        return np.dtype(SAMPLE_FORMATS[self.sample_format][1])
+
+    def trimmed(self, start, end):
+        """Returns the same profile trimmed to start and end."""
+        return DecodeProfile(self.channels, self.sample_rate, self.sample_format, start, end, self.keep_source_format)
+
+    def time_offset(self):
+        return self.start or 0
+
+    def shift_beats_file(self, path, onsets_only=False):
+        """Shifts the times in a file written from trimmed audio so they are relative to the start of the song."""
+        if self.start is None:
+            return
+        beats, onsets = read_beats_file(path, onsets_only)
+        write_beats_file(path, None if onsets_only else beats +
+                         self.start, onsets + self.start)
+
+    def key(self):
+        """Identifies the decoded audio, for caching what is detected in it."""
+        trim = "" if self.start is None and self.end is None else f"_{self.start or 0}-{self.end or ''}"
+        return f"{self.channels}ch_{self.sample_rate}hz_{self.sample_format}{trim}"
+
+    def __repr__(self):
+        return f"DecodeProfile({self.key()})"
+
+
+# Named profiles from the full quality audio BeatRoot was tuned on to the cheapest.
+DECODE_PROFILES = {
+    "full": DecodeProfile(2, 44100, keep_source_format=True),
+    "mono": DecodeProfile(1, 44100),
+    "mono_22k": DecodeProfile(1, 22050),
+    "mono_11k": DecodeProfile(1, 11025)
+}
+DEFAULT_DECODE_PROFILE = DECODE_PROFILES["full"]
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from osu.audio.beats_file import read_beats_file, write_beats_file
+from osu.npz_cache import NpzCache
+
+DEFAULT_CACHE_DIR = "osu/onset_cache"
+
+# Bump whenever the onset detection output changes so stale entries are never read.
+ONSET_CACHE_VERSION = 2
+
+STATS_FILE_NAME = "stats.json"
+
+# Bytes of the audio file hashed at a time.
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class OnsetCache(NpzCache):
+    """Caches the beats and onsets of audio files on disk keyed by the audio file contents, the onset backend, and the decode profile.
+
+    The same song is shared by remaps and regenerated beatmapsets, so it only goes through onset detection once.
+    Entries hold the onsets and, if they were tracked, the beats. With max_bytes set the least recently used entries are evicted whenever the cache outgrows it.
+    The cache may be shared between threads."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=None):
+        super().__init__(cache_dir, ONSET_CACHE_VERSION)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def track(self, audio_path, output_path, backend, onsets_only, tracker, decode_profile=None):
+        """Writes the beats and onsets of an audio file to output_path in the format of BeatRoot.
+
+        On a miss tracker(output_path) is called to write them and the result is cached."""
+        variant = backend if decode_profile is None else f"{backend}/{decode_profile.key()}"
+        entry_path = self._entry_path(_audio_key(audio_path, variant))
+        entry = self._read_entry(entry_path)
+        if entry is not None and (onsets_only or entry[0] is not None):
+            with self._lock:
+                self.hits += 1
+            beats, onsets = entry
+            write_beats_file(output_path, None if onsets_only else beats, onsets)
+            return
+        with self._lock:
+            self.misses += 1
+
+        tracker(output_path)
+        beats, onsets = read_beats_file(output_path, onsets_only)
+        self._write_entry(entry_path, beats, onsets)
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0}
+
+    def flush_stats(self):
+        """Adds the statistics of this session to the totals saved in the cache directory and resets them."""
+        totals = self.saved_stats()
+        totals["hits"] += self.hits
+        totals["misses"] += self.misses
+        totals["evictions"] += self.evictions
+        os.makedirs(self.cache_dir, exist_ok=True)
+        stats_path = os.path.join(self.cache_dir, STATS_FILE_NAME)
+        temp_path = f"{stats_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(totals, f)
+        os.replace(temp_path, stats_path)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def saved_stats(self):
+        """Returns the statistics totalled over every session that flushed them."""
+        try:
+            with open(os.path.join(self.cache_dir, STATS_FILE_NAME), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _read_entry(self, entry_path):
+        try:
+            with np.load(entry_path) as entry:
+                beats = entry["beats"] if entry["has_beats"] else None
+                onsets = entry["onsets"]
+        except FileNotFoundError:
+            return None
+        self._mark_used(entry_path)
+        return beats, onsets
+
+    def _write_entry(self, entry_path, beats, onsets):
+        temp_path = self._temp_path(entry_path)
+        with open(temp_path, "wb") as f:
+            np.savez(f, has_beats=beats is not None, beats=np.zeros(0) if beats is None else beats,
+                     onsets=onsets)
+        with self._lock:
+            old_size = os.path.getsize(
+                entry_path) if os.path.exists(entry_path) else 0
+            os.replace(temp_path, entry_path)
+            if self.max_bytes is None:
+                return
+
+            if self._total_bytes is None:
+                self.clean()
+            else:
+                self._total_bytes += os.path.getsize(entry_path) - old_size
+            if self._total_bytes > self.max_bytes:
+                self.evictions += self.clean(self.max_bytes)
+
+
+def _audio_key(audio_path, variant):
+    # Different backends and decodings detect different onsets in the same audio.
+    digest = hashlib.sha1(f"{variant}\0".encode())
+    with open(audio_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,239 @@
+import math
+import subprocess
+
+import numpy as np
+
+from osu.audio.beats_file import write_beats_file
+from osu.audio.decode_profile import DEFAULT_DECODE_PROFILE
+from osu.audio.process_supervisor import ProcessSupervisor
+from osu.beatmap.beat_normalizer import BEAT_TRACKING_TIMING_OFFSET
+
+# Sample rate assumed for audio given without one.
+DETECTION_SAMPLE_RATE = 44100
+
+# Number of sample frames decoded and transformed at a time, which bounds the memory used for long tracks.
+CHUNK_SIZE = 1 << 18
+
+# STFT frame and hop lengths in seconds, matching the 2048 sample frames and 10 ms hops of BeatRoot at 44.1 kHz.
+FRAME_TIME = 0.04644
+HOP_TIME = 0.01
+
+# Scale of the logarithmic magnitude compression applied before the spectral flux.
+MAGNITUDE_COMPRESSION = 1
+
+# Number of frames either side a peak must be the maximum of.
+PEAK_WINDOW = 3
+
+# Multiple of the peak window looked back over for the local mean a peak must exceed.
+PEAK_MEAN_WINDOW = 3
+
+# Amount in standard deviations of the spectral flux a peak must exceed its local mean by.
+PEAK_THRESHOLD = 1.0
+
+# Range of tempos considered by the beat tracker.
+MIN_BPM = 60
+MAX_BPM = 240
+
+# Tempo, in bpm, the tempo estimate is biased towards, and the width of that bias in octaves.
+PREFERRED_BPM = 120
+PREFERRED_BPM_OCTAVES = 1
+
+# Weight of the penalty for beat intervals deviating from the estimated beat period.
+BEAT_TIGHTNESS = 100
+
+
+def decode_audio_chunks(ffmpeg_path, audio_path, profile=DEFAULT_DECODE_PROFILE, chunk_size=CHUNK_SIZE, supervisor=None):
+    """Decodes an audio file with ffmpeg as described by the decode profile, yielding mono samples in chunks of at most chunk_size samples.
+
+    The decoder is killed if decoding, including the processing of the chunks, runs past the timeout of the ProcessSupervisor."""
+    supervisor = supervisor or ProcessSupervisor()
+    decoder = supervisor.popen([ffmpeg_path, "-v", "error"] + profile.input_args() + ["-i", audio_path] + profile.output_args() + ["-"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    dtype = profile.sample_dtype()
+    frame_bytes = profile.channels * dtype.itemsize
+    try:
+        with supervisor.watch(decoder):
+            while True:
+                data = decoder.stdout.read(chunk_size * frame_bytes)
+                if not data:
+                    break
+                # A read can end in the middle of a sample frame when the stream ends.
+                data = data[:len(data) - len(data) % frame_bytes]
+                samples = np.frombuffer(data, dtype=dtype).reshape(
+                    -1, profile.channels).mean(axis=1, dtype=np.float32)
+                if dtype.kind == "i":
+                    samples /= -np.iinfo(dtype).min
+                yield samples
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+    if decoder.returncode != 0:
+        raise Exception("Audio decoding failed.")
+
+
+def frame_sizes(sample_rate):
+    """Returns the STFT frame and hop sizes in samples at a sample rate."""
+    return 1 << int(round(math.log2(FRAME_TIME * sample_rate))), int(round(HOP_TIME * sample_rate))
+
+
+def spectral_flux(chunks, sample_rate=DETECTION_SAMPLE_RATE):
+    """Returns the spectral flux of mono audio given as an iterable of sample chunks, one value per hop.
+
+    Frame i ends a quarter frame after hop i, where the window rises fastest, so an attack at the start of the hop peaks the flux at frame i.
+    Only one chunk of audio and its spectrum are held in memory at a time."""
+    frame_size, hop_size = frame_sizes(sample_rate)
+    window = np.hanning(frame_size).astype(np.float32)
+    leftover = np.zeros(frame_size - frame_size // 4, dtype=np.float32)
+    previous = None
+    flux = []
+    for chunk, last in _with_last(chunks):
+        if last:
+            chunk = np.concatenate(
+                (chunk, np.zeros(frame_size // 4, dtype=np.float32)))
+        samples = np.concatenate((leftover, chunk))
+        num_frames = (samples.size - frame_size) // hop_size + 1
+        if num_frames <= 0:
+            leftover = samples
+            continue
+        frames = np.lib.stride_tricks.sliding_window_view(
+            samples, frame_size)[::hop_size][:num_frames]
+        magnitudes = np.log1p(MAGNITUDE_COMPRESSION *
+                              np.abs(np.fft.rfft(frames * window, axis=1)))
+        if previous is None:
+            previous = magnitudes[:1]
+        differences = np.diff(np.concatenate((previous, magnitudes)), axis=0)
+        flux.append(np.maximum(differences, 0).sum(axis=1))
+        previous = magnitudes[-1:]
+        leftover = samples[num_frames * hop_size:]
+    if not flux:
+        return np.zeros(0)
+    return np.concatenate(flux)
+
+
+def pick_onsets(flux, hop_time):
+    """Returns the times of the peaks in the spectral flux that are local maxima exceeding their local mean by a threshold."""
+    if flux.size == 0:
+        return np.zeros(0)
+    deviation = flux.std()
+    normalized = (flux - flux.mean()) / (deviation if deviation > 0 else 1)
+
+    back = PEAK_MEAN_WINDOW * PEAK_WINDOW
+    padded = np.pad(normalized, (back, PEAK_WINDOW),
+                    mode="constant", constant_values=-np.inf)
+    windows = np.lib.stride_tricks.sliding_window_view(
+        padded, back + PEAK_WINDOW + 1)
+    is_maximum = normalized >= windows[:, back - PEAK_WINDOW:].max(axis=1)
+
+    # Local means over the frames that exist, ignoring the padding.
+    sums = np.concatenate(([0], np.cumsum(normalized)))
+    indices = np.arange(normalized.size)
+    starts = np.maximum(indices - back, 0)
+    ends = np.minimum(indices + PEAK_WINDOW + 1, normalized.size)
+    means = (sums[ends] - sums[starts]) / (ends - starts)
+
+    peaks = np.flatnonzero(is_maximum & (
+        normalized >= means + PEAK_THRESHOLD))
+    return peaks * hop_time
+
+
+def estimate_beat_period(flux, hop_time):
+    """Estimates the beat period in frames from the autocorrelation of the spectral flux, biased towards moderate tempos."""
+    envelope = flux - flux.mean()
+    fft_size = 1 << int(math.ceil(math.log2(2 * max(envelope.size, 1))))
+    spectrum = np.fft.rfft(envelope, fft_size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), fft_size)[
+        :envelope.size]
+
+    min_lag = int(math.floor(60 / MAX_BPM / hop_time))
+    max_lag = min(int(math.ceil(60 / MIN_BPM / hop_time)),
+                  autocorrelation.size - 2)
+    if max_lag <= min_lag:
+        return 60 / PREFERRED_BPM / hop_time
+    lags = np.arange(min_lag, max_lag + 1)
+    preferred_lag = 60 / PREFERRED_BPM / hop_time
+    weights = np.exp(-0.5 * (np.log2(lags / preferred_lag) /
+                     PREFERRED_BPM_OCTAVES) ** 2)
+    lag = lags[np.argmax(autocorrelation[lags] * weights)]
+
+    # Refine the period between frames with a parabola through the peak.
+    before, peak, after = autocorrelation[lag - 1:lag + 2]
+    curvature = before - 2 * peak + after
+    if curvature < 0:
+        return lag + 0.5 * (before - after) / curvature
+    return float(lag)
+
+
+def track_beats(flux, hop_time):
+    """Returns beat times found by dynamic programming over the spectral flux.
+
+    Each frame is scored by its flux plus the best score of a previous beat, penalised by how far the interval between them strays from the estimated beat period."""
+    if flux.size == 0:
+        return np.zeros(0)
+    deviation = flux.std()
+    envelope = flux / (deviation if deviation > 0 else 1)
+    period = estimate_beat_period(flux, hop_time)
+
+    # Offsets to the previous beat that are considered, from two periods back to half a period back.
+    offsets = np.arange(-int(round(2 * period)), -
+                        int(round(period / 2)) + 1)
+    penalties = -BEAT_TIGHTNESS * np.log(-offsets / period) ** 2
+
+    scores = envelope.copy()
+    previous = np.full(envelope.size, -1)
+    for frame in range(-offsets[-1], envelope.size):
+        candidates = frame + offsets
+        valid = candidates >= 0
+        candidate_scores = scores[candidates[valid]] + penalties[valid]
+        best = int(np.argmax(candidate_scores))
+        if candidate_scores[best] > 0:
+            scores[frame] += candidate_scores[best]
+            previous[frame] = candidates[valid][best]
+
+    # Trace back from the best scoring frame in the last beat period.
+    last_frames = max(envelope.size - int(round(period)), 0)
+    frame = last_frames + int(np.argmax(scores[last_frames:]))
+    beats = []
+    while frame >= 0:
+        beats.append(frame)
+        frame = previous[frame]
+    return np.array(beats[::-1]) * hop_time
+
+
+def detect_beats_and_onsets(chunks, sample_rate=DETECTION_SAMPLE_RATE):
+    """Returns the beat and onset times of mono audio given as an iterable of sample chunks.
+
+    Times are delayed by the latency of BeatRoot so they can be used wherever BeatRoot output is expected."""
+    hop_time = frame_sizes(sample_rate)[1] / sample_rate
+    flux = spectral_flux(chunks, sample_rate)
+    onsets = pick_onsets(flux, hop_time)
+    beats = track_beats(flux, hop_time)
+    if onsets.size > 0:
+        # Beats carried on through silence before the first or after the last onset are not in the music.
+        beats = beats[(beats >= onsets[0]) & (beats <= onsets[-1])]
+    return beats + BEAT_TRACKING_TIMING_OFFSET, onsets + BEAT_TRACKING_TIMING_OFFSET
+
+
+def run_onset_detector(ffmpeg_path, audio_path, output_path, onsets_only=False, profile=DEFAULT_DECODE_PROFILE, supervisor=None):
+    """Detects beats and onsets in process and writes them in the same format as BeatRoot.
+
+    The output file holds a line of beat times followed by a line of onset times, or only the onset times with onsets_only set."""
+    beats, onsets = detect_beats_and_onsets(
+        decode_audio_chunks(ffmpeg_path, audio_path, profile, supervisor=supervisor), profile.sample_rate)
+    if onsets.size == 0:
+        raise Exception("Onset processing failed: no onsets detected.")
+    offset = profile.time_offset()
+    write_beats_file(output_path, None if onsets_only else beats +
+                     offset, onsets + offset)
+
+
+def _with_last(iterable):
+    # Yields each item with whether it is the last one.
+    iterator = iter(iterable)
+    try:
+        current = next(iterator)
+    except StopIteration:
+        return
+    for item in iterator:
+        yield current, False
+        current = item
+    yield current, True
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+import os
+import subprocess
+import threading
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where only timeouts are enforced.
+    resource = None
+if resource is not None and not hasattr(resource, "prlimit"):
+    # Limits can only be set on another process on Linux.
+    resource = None
+
+# Seconds of wall clock time a job may take before it is killed.
+DEFAULT_TIMEOUT = 600
+
+# Bytes of address space a tool may use, enforced for the JVM through its maximum heap size instead.
+DEFAULT_MEMORY_LIMIT = 2 << 30
+
+# Seconds of CPU time a tool may use.
+DEFAULT_CPU_LIMIT = 600
+
+
+class ProcessSupervisor:
+    """Runs external tools such as ffmpeg and BeatRoot with a wall clock timeout and resource limits, counting runs and timeouts per tool.
+
+    A job running past its timeout is killed and an exception raised so one bad file cannot stall a long crawl.
+    Memory and CPU limits are applied with rlimits on Linux, set on the process right after it starts. A limit of None disables it.
+    Whatever a tool allocates before its limits are set, such as during ffmpeg's startup, is not capped.
+    The supervisor may be shared between threads."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, memory_limit=DEFAULT_MEMORY_LIMIT, cpu_limit=DEFAULT_CPU_LIMIT):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    def popen(self, command, limit_memory=True, limit_cpu=True, **kwargs):
+        """Starts a process with the resource limits applied. Long-lived processes should not have their CPU time limited."""
+        memory_limit = self.memory_limit if limit_memory else None
+        cpu_limit = self.cpu_limit if limit_cpu else None
+        # Keep Ctrl+C in the terminal from reaching the tool, so an interrupted crawl can let the jobs in progress finish.
+        kwargs.setdefault("start_new_session", True)
+        process = subprocess.Popen(command, **kwargs)
+        if resource is not None:
+            _set_limits(process.pid, memory_limit, cpu_limit)
+        self._count(command, "runs")
+        return process
+
+    @contextmanager
+    def watch(self, process, timeout=None):
+        """Kills the process if the block is still running after the timeout, raising an exception in place of whatever the kill caused."""
+        timeout = self.timeout if timeout is None else timeout
+        killed = threading.Event()
+
+        def kill():
+            killed.set()
+            process.kill()
+        timer = threading.Timer(timeout, kill) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            yield
+        except Exception:
+            if not killed.is_set():
+                raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if killed.is_set():
+            self.record_timeout(process.args)
+            raise Exception(
+                f"{_tool_name(process.args)} timed out after {timeout} seconds.")
+
+    def run(self, command, timeout=None, limit_memory=True, limit_cpu=True, **kwargs):
+        """Runs a process to completion, returning its exit code. Output is discarded unless redirected."""
+        kwargs.setdefault("stdout", subprocess.DEVNULL)
+        kwargs.setdefault("stderr", subprocess.DEVNULL)
+        process = self.popen(command, limit_memory, limit_cpu, **kwargs)
+        try:
+            with self.watch(process, timeout):
+                process.wait()
+        finally:
+            # Reap the process, which may have just been killed.
+            process.wait()
+        return process.returncode
+
+    def java_command(self, args):
+        """Returns the command to run the JVM with, its heap bounded by the memory limit as address space limits break the JVM."""
+        command = ["java"]
+        if self.memory_limit is not None:
+            command.append(f"-Xmx{self.memory_limit >> 20}m")
+        return command + args
+
+    def record_timeout(self, command):
+        self._count(command, "timeouts")
+
+    def get_stats(self):
+        """Returns the number of runs and timeouts of every tool by name."""
+        with self._stats_lock:
+            return {tool: dict(counts) for tool, counts in self._stats.items()}
+
+    def _count(self, command, key):
+        tool = _tool_name(command)
+        with self._stats_lock:
+            counts = self._stats.setdefault(tool, {"runs": 0, "timeouts": 0})
+            counts[key] += 1
+
+
+def _tool_name(command):
+    return os.path.splitext(os.path.basename(command[0]))[0]
+
+
+def _set_limits(pid, memory_limit, cpu_limit):
+    # Set from the parent, as code run in the child between fork and exec is unsafe with threads.
+    # The tool may run briefly before its limits are set, which the timeout still covers.
+    try:
+        if memory_limit is not None:
+            resource.prlimit(pid, resource.RLIMIT_AS,
+                             (memory_limit, memory_limit))
+        if cpu_limit is not None:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_limit, cpu_limit))
+    except ProcessLookupError:
+        # Already exited.
+        pass
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+
+# Start of the name of every scratch directory, followed by the id of the process owning it.
+SCRATCH_DIR_PREFIX = "osu-scratch-"
+
+
+class ScratchDir:
+    """A uniquely named directory for the intermediate files of one job, removed with everything in it once the job is done.
+
+    Used as a context manager the directory is removed even if the job fails. Every job gets its own directory,
+    so jobs on several threads or in several processes never overwrite each other's files.
+    Directories are created under root, which defaults to the system temporary directory and is best put on a fast disk or tmpfs."""
+
+    def __init__(self, name="job", root=None):
+        self.name = name
+        self.root = root
+        self.path = None
+
+    def create(self):
+        if self.root is not None:
+            os.makedirs(self.root, exist_ok=True)
+        self.path = tempfile.mkdtemp(
+            prefix=f"{SCRATCH_DIR_PREFIX}{os.getpid()}-{self.name}-", dir=self.root)
+        return self
+
+    def file(self, name):
+        """Returns the path of a file in the directory."""
+        return os.path.join(self.path, name)
+
+    def cleanup(self):
+        if self.path is not None:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self.path = None
+
+    def __enter__(self):
+        return self.create()
+
+    def __exit__(self, *args):
+        self.cleanup()
+
+    @staticmethod
+    def clean_stale(root=None):
+        """Removes scratch directories left behind by processes that are no longer running, such as ones that were killed.
+
+        Returns the number of directories removed. Does nothing where it cannot tell whether a process is running."""
+        if os.name != "posix":
+            return 0
+        root = tempfile.gettempdir() if root is None else root
+        if not os.path.isdir(root):
+            return 0
+        removed = 0
+        for name in os.listdir(root):
+            if not name.startswith(SCRATCH_DIR_PREFIX):
+                continue
+            pid = name[len(SCRATCH_DIR_PREFIX):].split("-", 1)[0]
+            if pid.isdigit() and not _is_running(int(pid)):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, but owned by another user.
+        return True
+    return True
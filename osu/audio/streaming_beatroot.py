@@ -0,0 +1,89 @@
+import glob
+import os
+import shutil
+import subprocess
+import tempfile
+
+from osu.audio.decode_profile import DEFAULT_DECODE_PROFILE
+from osu.audio.process_supervisor import ProcessSupervisor
+
+# Java driver running BeatRoot on raw PCM read from standard input, compiled on first use.
+DRIVER_SOURCE_PATH = "osu/audio/StreamingBeatRoot.java"
+DRIVER_CLASSES_DIR = "osu/audio/classes"
+DRIVER_CLASS_NAME = "at.ofai.music.beatroot.StreamingBeatRoot"
+
+# Raw sample format the driver reads.
+DRIVER_SAMPLE_FORMAT = "s16le"
+
+# Seconds the decoder gets to exit once BeatRoot has finished.
+DECODER_EXIT_TIMEOUT = 5
+
+
+def streaming_classpath(jar_path, source_path=DRIVER_SOURCE_PATH, classes_dir=DRIVER_CLASSES_DIR):
+    """Returns the classpath to run the streaming driver with, compiling the driver if it is missing or out of date.
+
+    Returns None if the driver cannot be compiled, in which case audio should be decoded to a temporary file instead."""
+    if not os.path.exists(source_path) or not os.path.exists(jar_path):
+        return None
+    class_path = os.path.join(
+        classes_dir, *DRIVER_CLASS_NAME.split(".")) + ".class"
+    if not os.path.exists(class_path) or os.path.getmtime(class_path) < os.path.getmtime(source_path):
+        if not _compile_driver(jar_path, source_path, class_path):
+            return None
+    return os.pathsep.join([jar_path, classes_dir])
+
+
+def _compile_driver(jar_path, source_path, class_path):
+    if shutil.which("javac") is None:
+        return False
+    with tempfile.TemporaryDirectory() as build_dir:
+        result = subprocess.run(["javac", "-cp", jar_path, "-d", build_dir, source_path],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if result.returncode != 0:
+            return False
+        # Move the nested classes first so the main class only appears once the driver is complete.
+        package_dir = os.path.dirname(class_path)
+        os.makedirs(package_dir, exist_ok=True)
+        built = sorted(glob.glob(os.path.join(build_dir, *DRIVER_CLASS_NAME.split(".")[:-1], "*.class")),
+                       key=lambda path: os.path.basename(path) == os.path.basename(class_path))
+        for path in built:
+            os.replace(path, os.path.join(package_dir, os.path.basename(path)))
+    return True
+
+
+def validate_driver_profile(profile):
+    if profile.sample_format != DRIVER_SAMPLE_FORMAT:
+        raise Exception(
+            f"BeatRoot only reads {DRIVER_SAMPLE_FORMAT} audio, not {profile.sample_format}.")
+
+
+def run_streaming_beatroot(ffmpeg_path, audio_path, classpath, output_path, onsets_only=False, profile=DEFAULT_DECODE_PROFILE, supervisor=None):
+    """Decodes the audio with ffmpeg as described by the decode profile and pipes it straight into BeatRoot without writing the decoded audio to disk.
+
+    The output file holds a line of beat times followed by a line of onset times, or only the onset times with onsets_only set.
+    Both processes run under the ProcessSupervisor, which kills them if the job runs past its timeout."""
+    validate_driver_profile(profile)
+    supervisor = supervisor or ProcessSupervisor()
+    decoder = supervisor.popen([ffmpeg_path, "-v", "error"] + profile.input_args() + ["-i", audio_path] + profile.output_args() + ["-"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    command = supervisor.java_command(["-Djava.awt.headless=true", "-cp", classpath, DRIVER_CLASS_NAME,
+                                       "-r", str(profile.sample_rate), "-c", str(profile.channels), "-o", output_path])
+    if onsets_only:
+        command.append("-O")
+    try:
+        with supervisor.watch(decoder):
+            tracker_returncode = supervisor.run(
+                command, stdin=decoder.stdout, limit_memory=False)
+    finally:
+        # Closing our end lets ffmpeg exit if BeatRoot stopped reading early.
+        decoder.stdout.close()
+        try:
+            decoder.wait(timeout=DECODER_EXIT_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            decoder.kill()
+            decoder.wait()
+    if decoder.returncode != 0:
+        raise Exception("Audio decoding failed.")
+    if tracker_returncode != 0 or not os.path.exists(output_path):
+        raise Exception("Onset processing failed.")
+    profile.shift_beats_file(output_path, onsets_only)
@@ -1,7 +1,10 @@
+from functools import partial
 import math
+from multiprocessing import Pool
 
 import numpy as np
-from sklearn.linear_model import LinearRegression
+
+from osu.beatmap.tempo_segmentation import segment_beats
 
 # Timing offset to handle a beat tracker's consistent deviation.
 BEAT_TRACKING_TIMING_OFFSET = 0.039
@@ -19,16 +22,164 @@ CLOSEST_ONSETS_EVALUATION_FRACTION = 0.9
 START_BEAT_FIT_FRACTION = 0.1
 
 
-def get_timing_info(beats, onsets):
+# Resolution in seconds of the onset envelope used for tempo search.
+TEMPO_SEARCH_RESOLUTION = 0.005
+
+# Standard deviation in envelope bins of the gaussian smoothing applied to each onset.
+TEMPO_SEARCH_SMOOTHING = 2
+
+# Number of multiples of a tempo's beat period whose autocorrelation is summed when scoring it, acting as a comb filter.
+TEMPO_SEARCH_HARMONICS = 4
+
+# Range of tempos searched relative to the bpm measured from the beat tracker.
+# Slower tempos are left out as the sequence scoring favours them whenever they are a subdivision of the true tempo.
+TEMPO_SEARCH_MIN_RATIO = 0.9
+TEMPO_SEARCH_MAX_RATIO = 2.1
+
+# Number of the best scoring tempos passed on to be fitted and scored against the onsets.
+TEMPO_SEARCH_CANDIDATES = 4
+
+# Number of songs whose candidate beat sequences are evaluated together, bounding the size of the padded arrays.
+TIMING_BATCH_SIZE = 32
+
+
+def get_timing_info(beats, onsets, tempo_search=False, variable_bpm=False):
     """Extracts beatmap timing info from beat tracking data.
 
-    Returns a list of timing points, the beatmap bpm, and the offset of the last beat."""
+    With tempo_search set, candidate bpms come from an autocorrelation of the onsets over a wide range instead of only around the beat tracker's bpm.
+    With variable_bpm set, the beats are split into regions of constant tempo which each get their own timing point.
+    Returns a list of timing points, the beatmap bpm, and the offset of the last beat.
+    The beatmap bpm is that of the longest timing point when there are several."""
+    if variable_bpm:
+        return _variable_timing_info(beats, onsets, tempo_search)
+    return _timing_info_batch([(beats, onsets)], tempo_search)[0]
+
+
+def get_timing_info_batch(songs, processes=1, batch_size=TIMING_BATCH_SIZE, tempo_search=False):
+    """Extracts beatmap timing info for many songs at once.
+
+    Takes (beats, onsets) pairs and returns the same tuples as get_timing_info for each of them, in order.
+    The candidate bpms of every song in a batch are evaluated together with padded array operations.
+    Batches are spread across a pool of processes unless processes is 1, None uses every core."""
+    songs = list(songs)
+    # Batch songs of similar length together to keep padding small.
+    order = sorted(range(len(songs)), key=lambda i: songs[i][0].size)
+    batches = [[songs[i] for i in order[start:start + batch_size]]
+               for start in range(0, len(order), batch_size)]
+    evaluate = partial(_timing_info_batch, tempo_search=tempo_search)
+    if processes == 1 or len(batches) <= 1:
+        results = map(evaluate, batches)
+    else:
+        with Pool(processes) as pool:
+            results = pool.map(evaluate, batches)
+
+    timing_infos = [None] * len(songs)
+    sorted_timing_infos = (
+        timing_info for batch_results in results for timing_info in batch_results)
+    for i, timing_info in zip(order, sorted_timing_infos):
+        timing_infos[i] = timing_info
+    return timing_infos
+
+
+def _timing_info_batch(songs, tempo_search=False):
+    prepared = [_prepare_song(beats, onsets, tempo_search)
+                for beats, onsets in songs]
+    results = []
+    for (beats, _, _, _), (best_bpm, best_start) in zip(prepared, _best_sequences(prepared)):
+        first_beat = _sec_to_rounded_milis(best_start)
+        last_beat = _last_beat(best_bpm, best_start, beats[-1])
+        interval_ms = 60000 / best_bpm
+        timing_points = [(first_beat, interval_ms)]
+        results.append((timing_points, best_bpm, last_beat))
+    return results
+
+
+def _variable_timing_info(beats, onsets, tempo_search):
+    beats = beats - BEAT_TRACKING_TIMING_OFFSET
+    onsets = onsets - BEAT_TRACKING_TIMING_OFFSET
+    beats = _filter_edge_beats(beats, onsets)
+    segments = segment_beats(beats)
+
+    # Fit every constant tempo segment as its own song, against the onsets around it.
+    prepared = []
+    for first, last in segments:
+        segment = beats[first:last + 1]
+        if len(segments) > 1:
+            half_interval = (segment[-1] - segment[0]) / \
+                (segment.size - 1) / 2
+            onsets_start, onsets_end = np.searchsorted(
+                onsets, [segment[0] - half_interval, segment[-1] + half_interval])
+            # Segments too quiet to fit against fall back to every onset.
+            segment_onsets = onsets[onsets_start:onsets_end] if onsets_end - \
+                onsets_start >= 2 else onsets
+            # Quiet edges between segments are not mapped either.
+            segment = _filter_edge_beats(segment, segment_onsets)
+        else:
+            segment_onsets = onsets
+        prepared.append(_prepare_beats(
+            segment, segment_onsets, tempo_search))
+
+    if not prepared:
+        raise Exception("No beats to extract timing info from.")
+    sequences = list(_best_sequences(prepared))
+    timing_points = []
+    bpms = []
+    durations = []
+    for (segment, _, _, _), (best_bpm, best_start) in zip(prepared, sequences):
+        timing_points.append(
+            (_sec_to_rounded_milis(best_start), 60000 / best_bpm))
+        bpms.append(best_bpm)
+        durations.append(segment[-1] - segment[0])
+    # The song ends in the tempo of its last segment.
+    last_segment, (last_bpm, last_start) = prepared[-1][0], sequences[-1]
+    last_beat = _last_beat(last_bpm, last_start, last_segment[-1])
+    return timing_points, bpms[int(np.argmax(durations))], last_beat
+
+
+def _best_sequences(prepared):
+    # One row per candidate bpm of every song.
+    candidate_bpms = [bpm for _, _, _, bpms in prepared for bpm in bpms]
+    row_songs = np.repeat(np.arange(len(prepared)), [
+                          len(bpms) for _, _, _, bpms in prepared])
+    starts = np.array([start for _, _, start, _ in prepared])[row_songs]
+    ends = np.array([beats[-1] for beats, _, _, _ in prepared])[row_songs]
+    sequences, lengths = _generate_candidate_beats(
+        np.array(candidate_bpms), starts, ends)
+    valid = np.arange(sequences.shape[1]) < lengths[:, np.newaxis]
+
+    # Shift the beats to fit well with the observed onsets and calculate a score.
+    closest_onsets = _closest_onsets(
+        sequences, row_songs, [onsets for _, onsets, _, _ in prepared])
+    sequences = _fit_beats_to_closest_onsets(
+        sequences, closest_onsets, valid, lengths)
+    scores = _score_beats_to_onsets(sequences, closest_onsets, valid, lengths)
+
+    best = []
+    first_row = 0
+    for _, _, _, bpms in prepared:
+        # Find the best sequence. Ties go to the earliest candidate.
+        best_row = first_row + \
+            int(np.argmin(scores[first_row:first_row + len(bpms)]))
+        first_row += len(bpms)
+        best.append((candidate_bpms[best_row], sequences[best_row, 0]))
+    return best
+
+
+def _last_beat(bpm, start, end):
+    # Regenerate the sequence with the shifted start to calculate the correct last beat.
+    return _sec_to_rounded_milis(_generate_beats(bpm, start, end)[-1])
+
 
+def _prepare_song(beats, onsets, tempo_search):
     beats = beats - BEAT_TRACKING_TIMING_OFFSET
     onsets = onsets - BEAT_TRACKING_TIMING_OFFSET
 
     # Ignore starting and ending beats found to be devoid of onsets as we do not want those sections to be mapped.
     beats = _filter_edge_beats(beats, onsets)
+    return _prepare_beats(beats, onsets, tempo_search)
+
+
+def _prepare_beats(beats, onsets, tempo_search):
     intervals = np.diff(beats)
 
     # Single bpm case. Calculate the overall bpm from the detected beats.
@@ -36,6 +187,12 @@ def get_timing_info(beats, onsets):
     total_time = beats[-1] - beats[0]
     bpm = num_intervals / total_time * 60
 
+    candidate_bpms = _searched_bpms(
+        bpm, onsets) if tempo_search else _guessed_bpms(bpm)
+    return beats, onsets, _candidate_start_beat(beats), candidate_bpms
+
+
+def _guessed_bpms(bpm):
     # The true bpm is assumed to be a whole number. Consider bpm's corresponding to the ceiling and floor as well as one right outside of the range.
     candidate_bpms = []
     ceil_bpm = math.ceil(bpm)
@@ -49,31 +206,48 @@ def get_timing_info(beats, onsets):
     multiplied_bpm = bpm * 1.5
     candidate_bpms.append(math.ceil(multiplied_bpm))
     candidate_bpms.append(math.floor(multiplied_bpm))
-
-    # Find the best sequence.
-    best_score = math.inf
-    best_sequence = None
-    best_bpm = None
-    start_beat = _candidate_start_beat(beats)
-    for candidate_bpm in candidate_bpms:
-        sequence = _generate_beats(candidate_bpm, start_beat, beats[-1])
-        # Shift the beats to fit well with the observed onsets.
-        closest_onsets = _closest_onsets(sequence, onsets)
-        sequence = _fit_beats_to_closest_onsets(sequence, closest_onsets)
-        # Calculate a score.
-        score = _score_beats_to_onsets(sequence, closest_onsets)
-        if score < best_score:
-            best_score = score
-            best_sequence = sequence
-            best_bpm = candidate_bpm
-
-    first_beat = _sec_to_rounded_milis(best_sequence[0])
-    # Regenerate the sequence with the shifted start to calculate the correct last beat.
-    last_beat = _sec_to_rounded_milis(_generate_beats(
-        best_bpm, best_sequence[0], beats[-1])[-1])
-    interval_ms = 60000 / best_bpm
-    timing_points = [(first_beat, interval_ms)]
-    return timing_points, best_bpm, last_beat
+    return candidate_bpms
+
+
+def _searched_bpms(bpm, onsets):
+    # Score every whole bpm in the search range at once and keep the best local peaks.
+    candidate_bpms = np.arange(max(math.floor(bpm * TEMPO_SEARCH_MIN_RATIO), 1),
+                               math.ceil(bpm * TEMPO_SEARCH_MAX_RATIO) + 1)
+    autocorrelation = _onset_autocorrelation(onsets)
+    scores = np.zeros(candidate_bpms.size)
+    lags = np.arange(autocorrelation.size)
+    for harmonic in range(1, TEMPO_SEARCH_HARMONICS + 1):
+        period_bins = harmonic * 60 / candidate_bpms / TEMPO_SEARCH_RESOLUTION
+        scores += np.interp(period_bins, lags, autocorrelation, right=0)
+
+    padded = np.concatenate(([-np.inf], scores, [-np.inf]))
+    peaks = np.flatnonzero((scores >= padded[:-2]) & (scores >= padded[2:]))
+    if peaks.size == 0:
+        return _guessed_bpms(bpm)
+    best_peaks = peaks[np.argsort(-scores[peaks],
+                                  kind="stable")[:TEMPO_SEARCH_CANDIDATES]]
+    return [int(candidate) for candidate in candidate_bpms[best_peaks]]
+
+
+def _onset_autocorrelation(onsets):
+    # Build an envelope with a smoothed pulse per onset.
+    bins = np.round((onsets - onsets[0]) /
+                    TEMPO_SEARCH_RESOLUTION).astype(np.int64)
+    envelope = np.bincount(bins).astype(float)
+    kernel_offsets = np.arange(-3 * TEMPO_SEARCH_SMOOTHING,
+                               3 * TEMPO_SEARCH_SMOOTHING + 1)
+    kernel = np.exp(-0.5 * (kernel_offsets / TEMPO_SEARCH_SMOOTHING) ** 2)
+    envelope = np.convolve(envelope, kernel, mode="same")
+    envelope -= envelope.mean()
+
+    # Autocorrelation through the FFT, padded to avoid circular wrap around.
+    fft_size = 1 << int(math.ceil(math.log2(2 * envelope.size)))
+    spectrum = np.fft.rfft(envelope, fft_size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), fft_size)[
+        :envelope.size]
+    if autocorrelation[0] > 0:
+        autocorrelation /= autocorrelation[0]
+    return autocorrelation
 
 
 def _sec_to_rounded_milis(milis):
@@ -91,57 +265,37 @@ def _filter_edge_beats(beats, onsets):
 
 
 def _filtered_beats_start(beats, onsets):
-    num_beats = beats.shape[0]
-    for start_index in range(num_beats - EDGE_FILTER_WINDOW_SIZE):
-        start = beats[start_index]
-        end_index = start_index + EDGE_FILTER_WINDOW_SIZE
-        end = beats[end_index]
-        num_between = _num_between(onsets, start, end, True, False)
-        if num_between >= EDGE_FILTER_WINDOW_SIZE:
-            return _beat_start_index_with_onset(beats, onsets, start_index)
-    return 0
+    # Number of onsets before each beat. Differences give the onsets within [start, end) beat windows.
+    onsets_before = np.searchsorted(onsets, beats, side="left")
+    window_counts = onsets_before[EDGE_FILTER_WINDOW_SIZE:] - \
+        onsets_before[:-EDGE_FILTER_WINDOW_SIZE]
+    dense_windows = np.flatnonzero(window_counts >= EDGE_FILTER_WINDOW_SIZE)
+    if dense_windows.size == 0:
+        return 0
+    start_index = dense_windows[0]
+    # Move up to the first beat interval containing an onset.
+    interval_counts = np.diff(onsets_before[start_index:])
+    with_onset = np.flatnonzero(interval_counts >= 1)
+    if with_onset.size == 0:
+        return start_index
+    return start_index + with_onset[0]
 
 
 def _filtered_beats_end(beats, onsets):
-    num_beats = beats.shape[0]
-    for end_index in range(num_beats - 1, EDGE_FILTER_WINDOW_SIZE - 1, -1):
-        start_index = end_index - EDGE_FILTER_WINDOW_SIZE
-        start = beats[start_index]
-        end = beats[end_index]
-        num_between = _num_between(onsets, start, end, False, True)
-        if num_between >= EDGE_FILTER_WINDOW_SIZE:
-            return _beat_end_index_with_onset(beats, onsets, end_index)
-    return beats.shape[0] - 1
-
-
-def _num_between(a, start, end, inclusive_left, inclusive_right):
-    left_side = "left" if inclusive_left else "right"
-    right_side = "right" if inclusive_right else "left"
-    start_index = np.searchsorted(a, start, side=left_side)
-    end_index = np.searchsorted(a, end, side=right_side)
-    return end_index - start_index
-
-
-def _beat_start_index_with_onset(beats, onsets, left_index):
-    num_beats = beats.shape[0]
-    for start_index in range(left_index, num_beats - 1):
-        start = beats[start_index]
-        end = beats[start_index + 1]
-        num_between = _num_between(onsets, start, end, True, False)
-        if num_between >= 1:
-            return start_index
-    return left_index
-
-
-def _beat_end_index_with_onset(beats, onsets, right_index):
-    num_beats = beats.shape[0]
-    for end_index in range(right_index, 0, -1):
-        start = beats[end_index - 1]
-        end = beats[end_index]
-        num_between = _num_between(onsets, start, end, False, True)
-        if num_between >= 1:
-            return end_index
-    return right_index
+    # Number of onsets up to and including each beat. Differences give the onsets within (start, end] beat windows.
+    onsets_until = np.searchsorted(onsets, beats, side="right")
+    window_counts = onsets_until[EDGE_FILTER_WINDOW_SIZE:] - \
+        onsets_until[:-EDGE_FILTER_WINDOW_SIZE]
+    dense_windows = np.flatnonzero(window_counts >= EDGE_FILTER_WINDOW_SIZE)
+    if dense_windows.size == 0:
+        return beats.shape[0] - 1
+    end_index = dense_windows[-1] + EDGE_FILTER_WINDOW_SIZE
+    # Move back to the last beat interval containing an onset.
+    interval_counts = np.diff(onsets_until[:end_index + 1])
+    with_onset = np.flatnonzero(interval_counts >= 1)
+    if with_onset.size == 0:
+        return end_index
+    return with_onset[-1] + 1
 
 
 def _generate_beats(bpm, start, end):
@@ -151,42 +305,76 @@ def _generate_beats(bpm, start, end):
     return np.arange(num_intervals_within + 1) * interval + start
 
 
-def _closest_onsets(beats, onsets):
-    idx = np.searchsorted(onsets, beats, side="left")
+def _generate_candidate_beats(bpms, starts, ends):
+    # Generate one sequence per row as in _generate_beats, padded to the longest sequence.
+    intervals = 60 / bpms
+    lengths = ((ends - starts) / intervals).astype(int) + 1
+    # Scoring needs at least two beats per row.
+    num_columns = max(lengths.max(), 2)
+    sequences = np.arange(num_columns) * \
+        intervals[:, np.newaxis] + starts[:, np.newaxis]
+    return sequences, lengths
+
+
+def _closest_onsets(sequences, row_songs, onsets_per_song):
+    # Rows of the same song are contiguous, search each song's onsets once for all of its rows.
+    idx = np.empty(sequences.shape, dtype=np.int64)
+    song_starts = np.searchsorted(row_songs, np.arange(len(onsets_per_song)))
+    song_ends = np.append(song_starts[1:], row_songs.size)
+    for onsets, start, end in zip(onsets_per_song, song_starts, song_ends):
+        idx[start:end] = np.searchsorted(
+            onsets, sequences[start:end], side="left")
+
+    # Index the concatenated onsets of all songs.
+    sizes = np.array([onsets.size for onsets in onsets_per_song])
+    offsets = (np.cumsum(sizes) - sizes)[row_songs][:, np.newaxis]
+    row_sizes = sizes[row_songs][:, np.newaxis]
+    onsets = np.concatenate(onsets_per_song)
     # The closest is at either idx or idx - 1.
-    idx1 = np.clip(idx, None, onsets.size - 1)
-    idx2 = np.clip(idx - 1, 0, None)
-    diff1 = np.abs(onsets[idx1] - beats)
-    diff2 = np.abs(onsets[idx2] - beats)
+    idx1 = np.minimum(idx, row_sizes - 1) + offsets
+    idx2 = np.maximum(idx - 1, 0) + offsets
+    diff1 = np.abs(onsets[idx1] - sequences)
+    diff2 = np.abs(onsets[idx2] - sequences)
     needs_adjustment = diff2 < diff1
     return onsets[idx1 - needs_adjustment]
 
 
-def _fit_beats_to_closest_onsets(beats, closest_onsets):
+def _fit_beats_to_closest_onsets(sequences, closest_onsets, valid, lengths):
     # Shift the sequence to fit with the very nearest onsets. The hope is that for the correct bpm case, these onsets fall on true beats.
-    num_to_fit = max(int(beats.size * CLOSEST_ONSETS_FIT_FRACTION), 1)
-    diff = closest_onsets - beats
-    dist = np.abs(diff)
-    idx = np.argpartition(dist, num_to_fit - 1)[:num_to_fit]
+    num_to_fit = np.maximum(
+        (lengths * CLOSEST_ONSETS_FIT_FRACTION).astype(int), 1)
+    diff = closest_onsets - sequences
+    dist = np.where(valid, np.abs(diff), np.inf)
+    # A stable sort with padding at the end selects the same onsets however long the padded rows are.
+    order = np.argsort(dist, axis=1, kind="stable")
+    fit_sums = np.cumsum(np.take_along_axis(diff, order, axis=1), axis=1)
     # Fit the beat sequence line by minimizing the squared distances.
-    adjustment = np.mean(diff[idx])
-    return beats + adjustment
+    rows = np.arange(sequences.shape[0])
+    adjustments = fit_sums[rows, num_to_fit - 1] / num_to_fit
+    return sequences + adjustments[:, np.newaxis]
 
 
-def _score_beats_to_onsets(beats, closest_onsets):
+def _score_beats_to_onsets(sequences, closest_onsets, valid, lengths):
     # Score by average distance to the nearest onsets normalized by interval length.
-    num_to_eval = max(int(beats.size * CLOSEST_ONSETS_EVALUATION_FRACTION), 1)
-    dist = np.abs(closest_onsets - beats)
-    dist = np.partition(dist, num_to_eval - 1)[:num_to_eval]
-    interval = beats[1] - beats[0]
-    return np.mean(dist) / interval
+    num_to_eval = np.maximum(
+        (lengths * CLOSEST_ONSETS_EVALUATION_FRACTION).astype(int), 1)
+    dist = np.where(valid, np.abs(closest_onsets - sequences), np.inf)
+    eval_sums = np.cumsum(np.sort(dist, axis=1), axis=1)
+    rows = np.arange(sequences.shape[0])
+    intervals = sequences[:, 1] - sequences[:, 0]
+    return eval_sums[rows, num_to_eval - 1] / num_to_eval / intervals
 
 
 def _candidate_start_beat(beats):
     # Naively using the first beat when generating sequences can lead to incorrect results if it's a big outlier.
     # Instead, fit a line through a fraction of the starting beats.
     num_to_eval = max(int(beats.size * START_BEAT_FIT_FRACTION), 1)
-    X = np.arange(num_to_eval).reshape(-1, 1)
     y = beats[:num_to_eval]
-    reg = LinearRegression().fit(X, y)
-    return reg.intercept_
+    if num_to_eval == 1:
+        return y[0]
+    # Ordinary least squares intercept against the beat indices.
+    x = np.arange(num_to_eval)
+    x_centered = x - x.mean()
+    y_mean = y.mean()
+    slope = np.dot(x_centered, y - y_mean) / np.dot(x_centered, x_centered)
+    return y_mean - slope * x.mean()
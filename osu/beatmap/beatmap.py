@@ -1,37 +1,85 @@
-import configparser
+import numpy as np
 
 from osu.beatmap.break_event import BreakEvent
 from osu.beatmap.divisor_section import DivisorSection
-from osu.beatmap.hit_object import HitObject
+from osu.beatmap.hit_object import hit_object_array_from_config_lines, HitObject
+from osu.beatmap.osu_file import OsuFile
 from osu.beatmap.timing_point import TimingPoint
 
 DEFAULT_SLIDER_MULTIPLIER = 1.4
 
 
 class Beatmap:
+    def __init__(self):
+        self._divisor_sections = None
+        self._pending_hit_objects = None
+
+    @staticmethod
+    def from_osu_file(path, columnar=False, lazy=False):
+        """Parses a .osu file.
+
+        With columnar set, hit objects are stored in a structured array instead of as HitObject instances.
+        With lazy set, only the metadata, breaks and timing points are parsed up front. Hit objects and divisor sections are parsed when first accessed."""
+        with open(path, "rb") as f:
+            return Beatmap.from_stream(f, columnar, lazy)
+
+    @staticmethod
+    def from_stream(stream, columnar=False, lazy=False):
+        """Parses a .osu file from a binary stream such as an open archive member."""
+        return Beatmap.from_bytes(stream.read(), columnar, lazy)
+
     @staticmethod
-    def from_osu_file(path):
+    def from_bytes(data, columnar=False, lazy=False):
+        """Parses the raw contents of a .osu file."""
         beatmap = Beatmap()
-        with open(path, "r", encoding="utf-8") as f:
-            parse_general(f, beatmap)
-            parse_metadata(f, beatmap)
-            slider_multiplier = parse_difficulty(f, beatmap)
+        f = OsuFile(data)
+        parse_general(f, beatmap)
+        parse_metadata(f, beatmap)
+        slider_multiplier = parse_difficulty(f, beatmap)
+
+        breaks = parse_breaks(f)
+        timing_points = parse_timing_points(f)
+        beatmap._pending_hit_objects = (
+            f, breaks, timing_points, slider_multiplier, columnar)
+        if not lazy:
+            beatmap.divisor_sections
+        return beatmap
+
+    @staticmethod
+    def peek_mode(path):
+        """Reads only the [General] section to return the game mode of a .osu file."""
+        props = OsuFile.from_path_until(
+            path, ["General"]).key_value_section("General")
+        return int(props["Mode"])
 
-            breaks = parse_breaks(f)
-            timing_points = parse_timing_points(f)
-            hit_objects = parse_hit_objects(f)
+    @staticmethod
+    def peek_metadata(path):
+        """Reads only the sections before [Events] and returns their key/value properties by section name."""
+        sections = ["General", "Metadata", "Difficulty"]
+        f = OsuFile.from_path_until(path, sections)
+        return {section: f.key_value_section(section) for section in sections}
+
+    @property
+    def divisor_sections(self):
+        if self._divisor_sections is None:
+            f, breaks, timing_points, slider_multiplier, columnar = self._pending_hit_objects
+            hit_objects = parse_hit_objects(f, columnar)
 
             # Split hit objects into sections separated by the breaks.
             hit_objects_sections = partition_hit_objects(hit_objects, breaks)
-            beatmap.divisor_sections = [DivisorSection(
+            self._divisor_sections = [DivisorSection(
                 timing_points, hit_objects, slider_multiplier) for hit_objects in hit_objects_sections]
-        return beatmap
+            # The file contents are no longer needed.
+            self._pending_hit_objects = None
+        return self._divisor_sections
 
     def get_training_labels(self):
         return [ds.get_training_labels() for ds in self.divisor_sections]
 
 
 def partition_hit_objects(hit_objects, breaks):
+    if isinstance(hit_objects, np.ndarray):
+        return partition_hit_object_array(hit_objects, breaks)
     sections = [[] for i in range(len(breaks) + 1)]
     section_index = 0
     for hit_object in hit_objects:
@@ -43,6 +91,26 @@ def partition_hit_objects(hit_objects, breaks):
     return sections
 
 
+def partition_hit_object_array(hit_objects, breaks):
+    offsets = hit_objects["offset"]
+    starts = np.array([b.start for b in breaks], dtype=np.int64)
+    ends = np.array([b.end for b in breaks], dtype=np.int64)
+    # The section of each hit object is the number of breaks starting at or before it.
+    section_indices = np.searchsorted(starts, offsets, side="right")
+    if breaks:
+        previous_break = np.maximum(section_indices - 1, 0)
+        during_break = (section_indices > 0) & (
+            offsets <= ends[previous_break])
+        if np.any(during_break):
+            offset = int(offsets[np.argmax(during_break)])
+            raise Exception(
+                f"Hit object {HitObject(offset)} located during break.")
+    counts = np.bincount(section_indices, minlength=len(breaks) + 1)
+    if np.any(counts == 0):
+        raise Exception("Empty section between breaks.")
+    return np.split(hit_objects, np.cumsum(counts)[:-1])
+
+
 def find_break_section(hit_object, breaks, start_index):
     offset = hit_object.offset
     while True:
@@ -56,13 +124,15 @@ def find_break_section(hit_object, breaks, start_index):
         start_index += 1
 
 
-def parse_hit_objects(f):
-    entries = read_list_section(f, "HitObjects", last_section=True)
+def parse_hit_objects(f, columnar=False):
+    entries = f.list_section("HitObjects", last_section=True)
+    if columnar:
+        return hit_object_array_from_config_lines(entries)
     return [HitObject.from_config_line(entry) for entry in entries]
 
 
 def parse_timing_points(f):
-    event_lines = read_list_section(f, "TimingPoints")
+    event_lines = f.list_section("TimingPoints")
     timing_points = [TimingPoint.from_config_line(
         line) for line in event_lines]
     validate_timing_points(timing_points)
@@ -70,17 +140,14 @@ def parse_timing_points(f):
 
 
 def validate_timing_points(timing_points):
+    # Several uninherited timing points are allowed, divisor sections follow each of their grids.
     if timing_points[0].is_inherited():
         raise Exception("Invalid starting timing point.")
-    millis_per_beat = timing_points[0].millis_per_beat
-    if any(
-            tp.millis_per_beat != millis_per_beat and not tp.is_inherited() for tp in timing_points):
-        raise Exception("Must be single bpm.")
 
 
 def parse_breaks(f):
     breaks = []
-    event_lines = read_list_section(f, "Events")
+    event_lines = f.list_section("Events")
     for event_line in event_lines:
         break_event = BreakEvent.from_config_line(event_line)
         if break_event:
@@ -89,19 +156,19 @@ def parse_breaks(f):
 
 
 def parse_general(f, beatmap):
-    props = parse_section(f, "General")
+    props = f.key_value_section("General")
     if props["Mode"] != "0":
         raise Exception("Not an osu standard beatmap.")
     beatmap.audio_path = props["AudioFilename"]
 
 
 def parse_metadata(f, beatmap):
-    props = parse_section(f, "Metadata")
+    props = f.key_value_section("Metadata")
     beatmap.id = int(props["BeatmapID"])
 
 
 def parse_difficulty(f, beatmap):
-    props = parse_section(f, "Difficulty")
+    props = f.key_value_section("Difficulty")
     beatmap.hp = float(props["HPDrainRate"])
     beatmap.cs = float(props["CircleSize"])
     beatmap.od = float(props["OverallDifficulty"])
@@ -109,46 +176,3 @@ def parse_difficulty(f, beatmap):
     slider_multiplier = props.get("SliderMultiplier")
     return DEFAULT_SLIDER_MULTIPLIER if slider_multiplier is None else float(slider_multiplier)
 
-
-def parse_section(f, target):
-    seek_until_target_section_passed(f, target)
-    dummy_key = "a"
-    config_string = f"[{dummy_key}]\n"
-    while True:
-        line = f.readline()
-        if not line:
-            raise Exception(
-                "Unexpected end of file while searching for the end of the section.")
-        if line == "\n":
-            break
-        config_string += line
-    config = configparser.ConfigParser()
-    config.read_string(config_string)
-    return config[dummy_key]
-
-
-def read_list_section(f, target, last_section=False):
-    seek_until_target_section_passed(f, target)
-    entries = []
-    while True:
-        line = f.readline()
-        if not line:
-            if last_section:
-                return entries
-            raise Exception(
-                "Unexpected end of file while searching for the end of the section.")
-        if line == "\n":
-            return entries
-        elif not line.startswith("//"):
-            entries.append(line[:-1])
-
-
-def seek_until_target_section_passed(f, target):
-    target = f"[{target}]"
-    while True:
-        line = f.readline()
-        if not line:
-            raise Exception(
-                f"Unexpected end of file while searching for {target}.")
-        if line == f"{target}\n":
-            return
@@ -1,58 +1,97 @@
 import os
 import shutil
-from subprocess import call
-import time
-
-import numpy as np
 
 from .beat_normalizer import get_timing_info
+from ..audio.beatroot_pool import BeatRootPool
+from ..audio.beats_file import read_beats_file
+from ..audio.decode_profile import DEFAULT_DECODE_PROFILE
+from ..audio.onset_detector import run_onset_detector
+from ..audio.process_supervisor import ProcessSupervisor
+from ..audio.scratch_dir import ScratchDir
+from ..audio.streaming_beatroot import run_streaming_beatroot, streaming_classpath, validate_driver_profile
 from models import metadata_predictor
 
 FFMPEG_EXE_PATH = "ffmpeg/bin/ffmpeg.exe"
 BEATROOT_JAR_PATH = "beatroot/beatroot.jar"
 
+# Onset detection backends. BeatRoot runs in Java, the NumPy detector in process.
+BEATROOT_BACKEND = "beatroot"
+NUMPY_BACKEND = "numpy"
+
 MP3_NAME = "audio.mp3"
 CREATOR = "Skynet"
 
-def create_beatmapset(audio_file, dst_file, target_diffs, title, artist):
-	# Use current time to generate unique file names for temporary files.
-	current_time = str(int(time.time()))
-
-	# Convert mp3 to a temporary wav file for audio processing.
-	temp_wav_name = f"{current_time}.wav"
-	call([FFMPEG_EXE_PATH, "-i", audio_file, temp_wav_name])
-	print(f"Temporary wav file created: {temp_wav_name}.")
-	
-	# Track beats.
-	print("Tracking beats...")
-	beats_filename = f"{current_time}.csv"
-	call(["java", "-cp", BEATROOT_JAR_PATH, "at.ofai.music.beatroot.BeatRoot", "-x", beats_filename, temp_wav_name])
+def create_beatmapset(audio_file, dst_file, target_diffs, title, artist, beatroot_pool=None, onset_backend=BEATROOT_BACKEND, onset_cache=None, decode_profile=DEFAULT_DECODE_PROFILE, supervisor=None, scratch_root=None, streaming=False):
+	# Temporary files go to a directory of their own, so generating several beatmapsets at once is safe.
+	with ScratchDir("beatmapset", scratch_root) as scratch:
+		# Track beats.
+		print("Tracking beats...")
+		beats_filename = scratch.file("beats.csv")
+		# Audio tools are killed if they hang on a bad file.
+		supervisor = supervisor or ProcessSupervisor()
+		if onset_cache is None:
+			_track_beats(audio_file, beats_filename, beatroot_pool, onset_backend, decode_profile, supervisor, streaming)
+		else:
+			# Regenerating the same song reuses its tracked beats.
+			onset_cache.track(audio_file, beats_filename, onset_backend, False, lambda path: _track_beats(audio_file, path, beatroot_pool, onset_backend, decode_profile, supervisor, streaming), decode_profile)
+			stats = onset_cache.get_stats()
+			print(f"Onset cache: {stats['hits']} hits, {stats['misses']} misses.")
+		
+		# Read the generated beat timing file.
+		beats, onsets = read_beats_file(beats_filename)
+		
+		timing_points, map_bpm, last_beat = get_timing_info(beats, onsets, variable_bpm=True)
+		num_timing_points = len(timing_points)
+		if num_timing_points == 1:
+			print(f"Single timing point created. Offset: {timing_points[0][0]}.")
+		else:
+			print(f"{num_timing_points} timing points created for tempo changes. Offsets: {', '.join(str(tp[0]) for tp in timing_points)}.")
+			print("Possible poor results if the tempo changes were caused by beat tracking encountering difficulties. For best performance, use songs with distinctive percussive onsets and a lack of heavy syncopation." )
+		print(f"Calculated beatmap bpm: {map_bpm}.")
+		
+		# Directory to zip for osz file.
+		beatmapset_dir = scratch.file("beatmapset")
+		os.makedirs(beatmapset_dir)
+		shutil.copyfile(audio_file, os.path.join(beatmapset_dir, MP3_NAME))
+		
+		# Create beatmaps for each target difficulty.
+		for diff in target_diffs:
+			_create_beatmap(diff, beatmapset_dir, timing_points, map_bpm, title, artist)
+		
+		archive = shutil.make_archive(beatmapset_dir, "zip", beatmapset_dir)
+		shutil.move(archive, dst_file)
 	
-	# Read the generated beat timing file.
-	beats, onsets = _read_and_delete_beats_file(beats_filename)
+def create_beatroot_pool(size=1, supervisor=None, scratch_root=None):
+	# Generating several beatmapsets in one session can share long-lived beat trackers.
+	return BeatRootPool.create(BEATROOT_JAR_PATH, FFMPEG_EXE_PATH, size, supervisor, scratch_root)
 	
-	timing_points, map_bpm, last_beat = get_timing_info(beats, onsets)
-	num_timing_points = len(timing_points)
-	if num_timing_points == 1:
-		print(f"Single timing point created. Offset: {timing_points[0][0]}.")
+def _track_beats(audio_file, beats_filename, beatroot_pool, onset_backend, decode_profile, supervisor, streaming):
+	use_beatroot = onset_backend == BEATROOT_BACKEND
+	if not use_beatroot and onset_backend != NUMPY_BACKEND:
+		raise Exception(f"Unknown onset backend: {onset_backend}.")
+	if use_beatroot:
+		validate_driver_profile(decode_profile)
+	classpath = streaming_classpath(BEATROOT_JAR_PATH) if streaming and use_beatroot and beatroot_pool is None else None
+	if not use_beatroot:
+		# Detect beats in process without Java.
+		run_onset_detector(FFMPEG_EXE_PATH, audio_file, beats_filename, profile=decode_profile, supervisor=supervisor)
+	elif beatroot_pool is not None:
+		# Reuse a running beat tracker.
+		beatroot_pool.track(audio_file, beats_filename, profile=decode_profile)
+	elif classpath is not None:
+		# Pipe the decoded audio straight into the beat tracker.
+		run_streaming_beatroot(FFMPEG_EXE_PATH, audio_file, classpath, beats_filename, profile=decode_profile, supervisor=supervisor)
 	else:
-		print("Possible poor results due to beat tracking encountering difficulties. For best performance, use single bpm songs with distinctive percussive onsets and a lack of heavy syncopation." )
-	print(f"Calculated beatmap bpm: {map_bpm}.")
-	
-	# Temporary directory to zip for osz file.
-	temp_dir = current_time
-	os.makedirs(temp_dir)
-	shutil.copyfile(audio_file, os.path.join(temp_dir, MP3_NAME))
-	
-	# Create beatmaps for each target difficulty.
-	for diff in target_diffs:
-		_create_beatmap(diff, temp_dir, timing_points, map_bpm, title, artist)
-	
-	shutil.make_archive(temp_dir, "zip", temp_dir)
-	shutil.move(f"{temp_dir}.zip", dst_file)
-	
-	os.remove(temp_wav_name)
-	shutil.rmtree(temp_dir)
+		# Convert mp3 to a temporary wav file for audio processing.
+		temp_wav_name = f"{os.path.splitext(beats_filename)[0]}.wav"
+		try:
+			supervisor.run([FFMPEG_EXE_PATH] + decode_profile.input_args() + ["-i", audio_file] + decode_profile.output_args(raw=False) + [temp_wav_name], stdout=None, stderr=None)
+			print(f"Temporary wav file created: {temp_wav_name}.")
+			supervisor.run(supervisor.java_command(["-cp", BEATROOT_JAR_PATH, "at.ofai.music.beatroot.BeatRoot", "-x", beats_filename, temp_wav_name]), limit_memory=False, stdout=None, stderr=None)
+		finally:
+			if os.path.exists(temp_wav_name):
+				os.remove(temp_wav_name)
+		decode_profile.shift_beats_file(beats_filename)
 	
 def _create_beatmap(diff, dir, timing_points, map_bpm, title, artist):
 	title_ascii = _remove_non_ascii(title)
@@ -114,24 +153,5 @@ SliderTickRate:1
 		for tp in timing_points:
 			file.write(f"{tp[0]},{tp[1]},4,2,22,40,1,0\n")
 	
-def _read_and_delete_beats_file(filename):
-	with open(filename, mode="r") as csv_file:
-		beat_contents = csv_file.readline()
-		onset_contents = csv_file.readline()
-	
-	beats = _parse_to_np_array(beat_contents)
-	onsets = _parse_to_np_array(onset_contents)
-		
-	os.remove(filename)
-	return beats, onsets
-	
-def _parse_to_np_array(s):
-	data = s.split(",")
-	a = np.empty(len(data))
-	
-	for idx, value in enumerate(data):
-		a[idx] = float(value)
-	return a
-
 def _remove_non_ascii(s):
 	return s.encode("ascii", errors="ignore").decode()
\ No newline at end of file
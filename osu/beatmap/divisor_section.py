@@ -1,82 +1,182 @@
-from osu.beatmap.hit_object import HitObjectType
+import numpy as np
+
+from osu.beatmap.hit_object import as_hit_object_array, HitObject, HitObjectType
 
 DIVISOR_LEEWAY_MS = 1
 
 
 class DivisorSection:
     def __init__(self, timing_points, hit_objects, slider_multiplier):
-        self.divisors = []
-        self.offset = hit_objects[0].offset
-
-        starting_point = reference_timing_point(timing_points, hit_objects)
-        start = starting_point.offset
-        millis_per_beat_divisor = starting_point.millis_per_beat / 4
-
-        # Process the events of each beat divisor from the first hit object to the last.
-        divisor_start_offset = int(
-            round((self.offset - start) / millis_per_beat_divisor))
-        hit_object_index = 0
-        timing_point_index = find_associated_timing_point(
-            hit_objects[hit_object_index], timing_points, 0)
-        while True:
-            predicted_offset = int(
-                round(start + (divisor_start_offset + len(self.divisors)) * millis_per_beat_divisor))
-            hit_object = hit_objects[hit_object_index]
-            if falls_on_divisor(predicted_offset, hit_object):
-                add_hit_object_to_divisors(
-                    self.divisors, hit_object, timing_points[timing_point_index], starting_point.millis_per_beat, slider_multiplier)
-                hit_object_index += 1
-                if hit_object_index > len(hit_objects) - 1:
-                    return
-                timing_point_index = find_associated_timing_point(
-                    hit_objects[hit_object_index], timing_points, timing_point_index)
-            elif hit_object.offset < predicted_offset:
-                raise create_offset_error(
-                    self.divisors, hit_object, predicted_offset)
-            else:
-                self.divisors.append(HitObjectType.SILENCE.value)
+        # Work on the columnar form so no per-object instances are needed.
+        hit_objects = as_hit_object_array(hit_objects)
+        offsets = hit_objects["offset"].astype(np.int64)
+        self.offset = int(offsets[0])
+
+        # Divisors are indexed across the grids of every uninherited timing point, starting at the one closest to the first hit object.
+        grid = DivisorGrid(timing_points, self.offset)
+
+        # Number of divisors taken up by each hit object.
+        beat_durations = associated_beat_durations(offsets, timing_points)
+        durations = hit_object_durations(
+            hit_objects, beat_durations, slider_multiplier)
+        num_divisors = np.maximum(
+            1, np.round(durations / grid.millis_per_divisor(offsets))).astype(np.int64)
+
+        # Each hit object lands on the first divisor within the leeway that comes after the previous hit object ends.
+        # Subtracting the divisors used by preceding hit objects turns that into a running maximum.
+        earliest = grid.earliest_divisors(offsets - (1 + DIVISOR_LEEWAY_MS))
+        used_before = np.concatenate(([0], np.cumsum(num_divisors)[:-1]))
+        relative = np.maximum.accumulate(
+            np.maximum(earliest - used_before, 0))
+        divisor_indices = relative + used_before
+
+        predicted = grid.predicted_offsets(divisor_indices)
+        misplaced = ~falls_on_divisor(predicted, offsets)
+        if np.any(misplaced):
+            index = int(np.argmax(misplaced))
+            raise create_offset_error(
+                hit_objects, divisor_indices, num_divisors, index, int(predicted[index]))
+
+        # Scatter every hit object's label over its divisors. The remaining divisors are silence.
+        ends = divisor_indices + num_divisors
+        self.divisors = np.full(
+            ends[-1], HitObjectType.SILENCE.value, dtype=np.uint8)
+        positions = np.repeat(relative, num_divisors) + \
+            np.arange(used_before[-1] + num_divisors[-1])
+        self.divisors[positions] = np.repeat(hit_objects["type"], num_divisors)
 
     def get_training_labels(self):
-        return self.divisors
-
-
-def falls_on_divisor(predicted_offset, hit_object):
-    millis_diff = abs(predicted_offset - hit_object.offset)
+        return self.divisors.tolist()
+
+
+class DivisorGrid:
+    """The 1/4 beat divisors of consecutive uninherited timing points numbered as one sequence.
+
+    Each timing point's divisors continue until the next one begins. Index 0 is the divisor closest to the start offset."""
+
+    def __init__(self, timing_points, start):
+        uninherited = uninherited_timing_points(timing_points, start)
+        self.offsets = np.array([tp.offset for tp in uninherited])
+        self.divisor_lengths = np.array(
+            [tp.millis_per_beat / 4 for tp in uninherited])
+
+        # Index of the first divisor used from each timing point relative to its own offset.
+        self.first_divisors = np.zeros(self.offsets.size, dtype=np.int64)
+        self.first_divisors[0] = int(
+            round((start - self.offsets[0]) / self.divisor_lengths[0]))
+        # A timing point's divisors stop short of the next timing point, allowing for the leeway.
+        limits = self.offsets[1:] - (1 + DIVISOR_LEEWAY_MS)
+        counts = divisors_before(
+            self.offsets[:-1], self.divisor_lengths[:-1], limits) - self.first_divisors[:-1]
+        # Index of the first divisor of each timing point in the combined sequence.
+        self.starts = np.concatenate(
+            ([0], np.cumsum(np.maximum(counts, 0))))
+
+    def predicted_offsets(self, divisor_indices):
+        segments = self._segments(divisor_indices)
+        local = self.first_divisors[segments] + \
+            divisor_indices - self.starts[segments]
+        return np.round(self.offsets[segments] + local * self.divisor_lengths[segments]).astype(np.int64)
+
+    def earliest_divisors(self, lower_bounds):
+        """Returns the index of the first divisor whose predicted offset is not before each lower bound."""
+        segments = np.maximum(np.searchsorted(
+            self.offsets, lower_bounds, side="right") - 1, 0)
+        local = divisors_before(
+            self.offsets[segments], self.divisor_lengths[segments], lower_bounds)
+        indices = self.starts[segments] + local - \
+            self.first_divisors[segments]
+        # Divisors cut short by the next timing point belong to it.
+        indices = np.clip(indices, self.starts[segments], np.append(
+            self.starts[1:], np.iinfo(np.int64).max)[segments])
+        # Correct for the predicted offsets being rounded.
+        indices -= self.predicted_offsets(indices - 1) >= lower_bounds
+        indices += self.predicted_offsets(indices) < lower_bounds
+        return indices
+
+    def millis_per_divisor(self, offsets):
+        segments = np.maximum(np.searchsorted(
+            self.offsets, offsets, side="right") - 1, 0)
+        return self.divisor_lengths[segments]
+
+    def _segments(self, divisor_indices):
+        # Divisors before the start still follow the first timing point.
+        return np.searchsorted(self.starts[1:], divisor_indices, side="right")
+
+
+def divisors_before(offsets, divisor_lengths, limits):
+    # Number of divisors from each offset whose rounded offset is before the limit.
+    counts = np.ceil((limits - offsets) / divisor_lengths).astype(np.int64)
+    counts -= np.round(offsets + (counts - 1) * divisor_lengths) >= limits
+    counts += np.round(offsets + counts * divisor_lengths) < limits
+    return counts
+
+
+def falls_on_divisor(predicted_offset, offset):
+    millis_diff = np.abs(predicted_offset - offset)
     # The editor appears to always round down but we can remove that assumption by checking if within one millisecond.
     # There have also been unexplainable observed rounding errors. Add a leeway to compensate.
     return millis_diff <= 1 + DIVISOR_LEEWAY_MS
 
 
-def add_hit_object_to_divisors(divisors, hit_object, timing_point, millis_per_beat, slider_multiplier):
-    duration = hit_object.get_duration(
-        timing_point.get_beat_duration(millis_per_beat), slider_multiplier)
-    num_divisors = max(1, int(round(duration / (millis_per_beat / 4))))
-    for i in range(num_divisors):
-        divisors.append(hit_object.get_type_enum().value)
-
-
-def create_offset_error(divisors, hit_object, predicted_offset):
-    if len(divisors) > 0 and divisors[-1] != HitObjectType.SILENCE.value and divisors[-1] != HitObjectType.HIT_CIRCLE.value:
-        return Exception(
-            f"Hit object {hit_object} intersects with previous hit object.")
+def associated_beat_durations(offsets, timing_points):
+    timing_point_offsets = np.array([tp.offset for tp in timing_points])
+    # Inherited timing points scale the beat duration of the uninherited timing point they follow.
+    beat_durations = []
+    millis_per_beat = timing_points[0].millis_per_beat
+    for tp in timing_points:
+        if not tp.is_inherited():
+            millis_per_beat = tp.millis_per_beat
+        beat_durations.append(tp.get_beat_duration(millis_per_beat))
+    beat_durations = np.array(beat_durations)
+    # Hit objects before the first timing point still use it.
+    indices = np.maximum(np.searchsorted(
+        timing_point_offsets, offsets, side="right") - 1, 0)
+    return beat_durations[indices]
+
+
+def hit_object_durations(hit_objects, beat_durations, slider_multiplier):
+    object_types = hit_objects["type"]
+    durations = np.zeros(hit_objects.size)
+    sliders = object_types == HitObjectType.SLIDER.value
+    durations[sliders] = hit_objects["pixel_length"][sliders] / \
+        (100.0 * slider_multiplier) * beat_durations[sliders]
+    spinners = object_types == HitObjectType.SPINNER.value
+    durations[spinners] = hit_objects["end_time"][spinners].astype(
+        np.int64) - hit_objects["offset"][spinners]
+    return durations
+
+
+def create_offset_error(hit_objects, divisor_indices, num_divisors, index, predicted_offset):
+    hit_object = HitObject(int(hit_objects["offset"][index]))
+    # The previous hit object only intersects if it runs right up to the expected divisor.
+    if index > 0 and divisor_indices[index - 1] + num_divisors[index - 1] == divisor_indices[index]:
+        previous_type = hit_objects["type"][index - 1]
+        if previous_type != HitObjectType.HIT_CIRCLE.value:
+            return Exception(
+                f"Hit object {hit_object} intersects with previous hit object.")
     return Exception(
         f"Hit object {hit_object} doesn't fall on a 1/4 beat divisor, expected ~{predicted_offset}.")
 
 
-def reference_timing_point(timing_points, hit_objects):
-    start = hit_objects[0].offset
+def reference_timing_point(timing_points, start):
     for timing_point in reversed(timing_points):
         if not timing_point.is_inherited() and timing_point.offset <= start:
             return timing_point
     return timing_points[0]
 
 
-def find_associated_timing_point(hit_object, timing_points, start_index):
-    index = start_index + 1
-    while True:
-        if index > len(timing_points) - 1:
-            return index - 1
-        timing_point = timing_points[index]
-        if timing_point.offset > hit_object.offset:
-            return index - 1
-        index += 1
+def uninherited_timing_points(timing_points, start):
+    """Returns the uninherited timing point in effect at start followed by every later one.
+
+    Of several uninherited timing points at the same offset, only the last takes effect."""
+    reference = reference_timing_point(timing_points, start)
+    later = [tp for tp in timing_points if not tp.is_inherited()
+             and tp.offset > reference.offset]
+    points = [reference]
+    for tp in later:
+        if tp.offset == points[-1].offset:
+            points[-1] = tp
+        else:
+            points.append(tp)
+    return points
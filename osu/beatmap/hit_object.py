@@ -1,5 +1,7 @@
 from enum import Enum
 
+import numpy as np
+
 
 class HitObjectType(Enum):
     SILENCE = 0
@@ -8,6 +10,17 @@ class HitObjectType(Enum):
     SPINNER = 3
 
 
+# Columnar layout used to store a beatmap's hit objects without creating an instance per object.
+HIT_OBJECT_DTYPE = np.dtype([
+    ("offset", np.int32),
+    ("x", np.int16),
+    ("y", np.int16),
+    ("type", np.uint8),
+    ("pixel_length", np.float64),
+    ("end_time", np.int32)
+])
+
+
 class HitObject:
     def __init__(self, offset):
         self.offset = offset
@@ -46,6 +59,9 @@ class HitCircle(HitObject):
     def get_type_enum(self):
         return HitObjectType.HIT_CIRCLE
 
+    def to_record(self):
+        return (self.offset, self.x, self.y, HitObjectType.HIT_CIRCLE.value, 0, 0)
+
 
 class Slider(HitObject):
     def __init__(self, x, y, offset, pixel_length):
@@ -60,6 +76,9 @@ class Slider(HitObject):
     def get_type_enum(self):
         return HitObjectType.SLIDER
 
+    def to_record(self):
+        return (self.offset, self.x, self.y, HitObjectType.SLIDER.value, self.pixel_length, 0)
+
 
 class Spinner(HitObject):
     def __init__(self, offset, end_time):
@@ -72,6 +91,68 @@ class Spinner(HitObject):
     def get_type_enum(self):
         return HitObjectType.SPINNER
 
+    def to_record(self):
+        return (self.offset, 0, 0, HitObjectType.SPINNER.value, 0, self.end_time)
+
 
 def is_bit_set(n, bit):
     return n & 1 << bit != 0
+
+
+def hit_object_array_from_config_lines(lines):
+    """Parses [HitObjects] lines straight into a structured array with HIT_OBJECT_DTYPE."""
+    # Only the first 8 fields are ever needed, leave the rest of the slider definition unsplit.
+    fields = [line.split(",", 8) for line in lines]
+    hit_objects = np.zeros(len(fields), dtype=HIT_OBJECT_DTYPE)
+    if len(fields) == 0:
+        return hit_objects
+    head = _parse_number_column(
+        ",".join([",".join(f[:4]) for f in fields]), np.int64).reshape(-1, 4)
+    object_types = head[:, 3]
+    circles = object_types & 1 << 0 != 0
+    sliders = ~circles & (object_types & 1 << 1 != 0)
+    spinners = ~circles & ~sliders & (object_types & 1 << 3 != 0)
+    unrecognized = ~(circles | sliders | spinners)
+    if np.any(unrecognized):
+        object_type = object_types[np.argmax(unrecognized)]
+        raise Exception(f"Unrecognized hit object type: {object_type}.")
+
+    hit_objects["offset"] = head[:, 2]
+    positioned = ~spinners
+    hit_objects["x"][positioned] = head[positioned, 0]
+    hit_objects["y"][positioned] = head[positioned, 1]
+    hit_objects["type"][circles] = HitObjectType.HIT_CIRCLE.value
+    hit_objects["type"][sliders] = HitObjectType.SLIDER.value
+    hit_objects["type"][spinners] = HitObjectType.SPINNER.value
+    slider_indices = np.flatnonzero(sliders)
+    hit_objects["pixel_length"][slider_indices] = _parse_number_column(
+        ",".join([fields[i][7] for i in slider_indices]), np.float64)
+    spinner_indices = np.flatnonzero(spinners)
+    hit_objects["end_time"][spinner_indices] = _parse_number_column(
+        ",".join([fields[i][5] for i in spinner_indices]), np.int64)
+    return hit_objects
+
+
+def _parse_number_column(joined, dtype):
+    if not joined:
+        return np.empty(0, dtype=dtype)
+    values = np.fromstring(joined, dtype=dtype, sep=",")
+    if values.size != joined.count(",") + 1:
+        raise Exception(f"Invalid hit object values: {joined[:50]}.")
+    return values
+
+
+def as_hit_object_array(hit_objects):
+    """Returns the columnar form of either a list of hit objects or an existing hit object array."""
+    if isinstance(hit_objects, np.ndarray):
+        return hit_objects
+    return np.array([hit_object.to_record() for hit_object in hit_objects], dtype=HIT_OBJECT_DTYPE)
+
+
+def hit_object_duration(record, beat_duration, slider_multiplier):
+    object_type = record["type"]
+    if object_type == HitObjectType.SLIDER.value:
+        return record["pixel_length"] / (100.0 * slider_multiplier) * beat_duration
+    elif object_type == HitObjectType.SPINNER.value:
+        return int(record["end_time"]) - int(record["offset"])
+    return 0
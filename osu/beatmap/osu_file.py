@@ -0,0 +1,81 @@
+import re
+
+# Section headers such as [General] must start at the beginning of a line.
+SECTION_HEADER = re.compile(rb"^\[(\w+)\][ \t]*$", re.MULTILINE)
+
+
+class OsuFile:
+    """Tokenizes the contents of a .osu file in a single pass.
+
+    Every section is indexed by its byte range so individual sections can be decoded and parsed on demand."""
+
+    def __init__(self, data):
+        # Normalize line endings so a blank line always appears as two consecutive newlines.
+        self.data = data.replace(b"\r\n", b"\n")
+        self.sections = {}
+        for match in SECTION_HEADER.finditer(self.data):
+            name = match.group(1).decode("utf-8")
+            if name in self.sections:
+                continue
+            self.sections[name] = self._section_range(match.end() + 1)
+
+    @staticmethod
+    def from_path_until(path, targets):
+        """Reads a .osu file only up to the end of the last of the target sections."""
+        remaining = set(targets)
+        current = None
+        lines = []
+        with open(path, "rb") as f:
+            for line in f:
+                lines.append(line)
+                content = line.rstrip(b"\r\n")
+                if current is None:
+                    match = SECTION_HEADER.match(content)
+                    if match:
+                        name = match.group(1).decode("utf-8")
+                        current = name if name in remaining else None
+                elif not content:
+                    remaining.discard(current)
+                    current = None
+                    if not remaining:
+                        break
+        return OsuFile(b"".join(lines))
+
+    def _section_range(self, start):
+        # A section ends at the first blank line following its header.
+        if start >= len(self.data) or self.data[start:start + 1] == b"\n":
+            return start, start, start < len(self.data)
+        end = self.data.find(b"\n\n", start)
+        if end == -1:
+            return start, len(self.data), False
+        return start, end + 1, True
+
+    def key_value_section(self, target):
+        props = {}
+        for line in self._section_lines(target, last_section=False):
+            if line.startswith("//") or not line.strip():
+                continue
+            key, sep, value = line.partition(":")
+            if not sep:
+                raise Exception(
+                    f"Invalid line in [{target}] section: {line}.")
+            props[key.strip()] = value.strip()
+        return props
+
+    def list_section(self, target, last_section=False):
+        return [line for line in self._section_lines(target, last_section) if not line.startswith("//")]
+
+    def _section_lines(self, target, last_section):
+        section_range = self.sections.get(target)
+        if section_range is None:
+            raise Exception(
+                f"Unexpected end of file while searching for [{target}].")
+        start, end, terminated = section_range
+        if not terminated and not last_section:
+            raise Exception(
+                "Unexpected end of file while searching for the end of the section.")
+        lines = self.data[start:end].decode("utf-8").split("\n")
+        # Drop the empty string following the final newline.
+        if lines and not lines[-1]:
+            lines.pop()
+        return lines
@@ -0,0 +1,107 @@
+import math
+
+import numpy as np
+
+# Minimum number of beat intervals in a constant tempo segment.
+MIN_SEGMENT_INTERVALS = 16
+
+# Number of neighbouring intervals whose median replaces an outlying interval.
+OUTLIER_WINDOW_SIZE = 9
+
+# Relative deviation from the local median beyond which an interval is treated as a beat tracking error.
+OUTLIER_THRESHOLD = 0.15
+
+# Smallest relative standard deviation assumed for beat intervals so perfectly regular beats are not split on rounding noise.
+MIN_INTERVAL_DEVIATION = 0.02
+
+# Scale of the BIC style penalty paid for every additional segment.
+SEGMENT_PENALTY_SCALE = 8
+
+
+def segment_beats(beats):
+    """Splits a beat track into regions of constant tempo.
+
+    Returns the indices of the first and last beat of every segment as rows of an array.
+    Irregular intervals at a tempo change, such as a gap between songs, are left out of both segments.
+    Uses an optimal partitioning of the beat intervals with pruning, which runs in time linear in the number of beats."""
+    beats = np.asarray(beats, dtype=float)
+    num_intervals = beats.size - 1
+    if num_intervals < 2 * MIN_SEGMENT_INTERVALS:
+        return np.array([[0, max(num_intervals, 0)]])
+
+    intervals = np.diff(beats)
+    # Work with intervals relative to the typical interval so the penalty does not depend on the tempo.
+    intervals, outliers = _replace_outliers(intervals / np.median(intervals))
+    change_points = _optimal_partition(
+        intervals, _segment_penalty(intervals))
+
+    segments = []
+    for i, first in enumerate(change_points):
+        # Every beat but the last belongs to the segment of the interval following it.
+        last = change_points[i + 1] - \
+            1 if i + 1 < len(change_points) else num_intervals
+        if i > 0:
+            while first < last and outliers[first]:
+                first += 1
+        if i + 1 < len(change_points):
+            while last > first and outliers[last - 1]:
+                last -= 1
+        segments.append((first, last))
+    return np.array(segments)
+
+
+def _replace_outliers(intervals):
+    # Beat trackers occasionally merge or split single beats. Replace such isolated intervals with the local median.
+    half_window = OUTLIER_WINDOW_SIZE // 2
+    padded = np.pad(intervals, half_window, mode="edge")
+    medians = np.median(np.lib.stride_tricks.sliding_window_view(
+        padded, OUTLIER_WINDOW_SIZE), axis=1)
+    outliers = np.abs(intervals - medians) > OUTLIER_THRESHOLD * medians
+    return np.where(outliers, medians, intervals), outliers
+
+
+def _segment_penalty(intervals):
+    # Estimate the interval noise from successive differences, which are unaffected by tempo changes.
+    deviation = np.median(np.abs(np.diff(intervals))) / \
+        (0.6745 * math.sqrt(2))
+    deviation = max(deviation, MIN_INTERVAL_DEVIATION)
+    return SEGMENT_PENALTY_SCALE * deviation ** 2 * math.log(intervals.size)
+
+
+def _optimal_partition(intervals, penalty):
+    # Segment cost is the squared deviation of its intervals from their mean, computed in constant time with prefix sums.
+    sums = np.concatenate(([0], np.cumsum(intervals)))
+    square_sums = np.concatenate(([0], np.cumsum(intervals ** 2)))
+
+    def segment_costs(starts, end):
+        lengths = end - starts
+        segment_sums = sums[end] - sums[starts]
+        return square_sums[end] - square_sums[starts] - segment_sums ** 2 / lengths
+
+    # best_costs[t] is the minimum cost of partitioning the first t intervals.
+    n = intervals.size
+    best_costs = np.full(n + 1, np.inf)
+    best_costs[0] = -penalty
+    last_change = np.zeros(n + 1, dtype=np.int64)
+    candidates = np.empty(0, dtype=np.int64)
+    for end in range(MIN_SEGMENT_INTERVALS, n + 1):
+        # Segment starts become available once they are far enough behind.
+        new_start = end - MIN_SEGMENT_INTERVALS
+        if np.isfinite(best_costs[new_start]):
+            candidates = np.append(candidates, new_start)
+        if candidates.size == 0:
+            continue
+        costs = best_costs[candidates] + segment_costs(candidates, end)
+        best = int(np.argmin(costs))
+        best_costs[end] = costs[best] + penalty
+        last_change[end] = candidates[best]
+        # Starts that can no longer beat the optimum never will, as the segment cost only grows as it is extended.
+        candidates = candidates[costs <= costs[best] + penalty]
+
+    # Returns the first interval of every segment.
+    change_points = []
+    end = n
+    while end > 0:
+        end = int(last_change[end])
+        change_points.append(end)
+    return change_points[::-1]
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+import zipfile
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+OSU_BASE_URL = "https://osu.ppy.sh"
+# Recently ranked beatmapsets with osu standard filter.
+SEARCH_PATH = "/beatmapsets/search?m=0&s=ranked"
+
+# Number of threads downloading beatmapsets at once, which the connection pool is sized for.
+DEFAULT_CONCURRENCY = 4
+
+# Requests per second sent to osu, and how many may be sent at once after a quiet spell.
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 4
+
+# Number of times a failed request is retried, waiting twice as long before every retry starting from the backoff.
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 2.0
+
+# Seconds to wait for osu to connect and to send each part of a response.
+REQUEST_TIMEOUT = 60
+
+# Responses worth retrying, as the server is only overloaded or throttling.
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Response to a range starting past the end of the archive, when a partial download is somehow longer than the archive.
+RANGE_NOT_SATISFIABLE = 416
+
+DEFAULT_DOWNLOAD_DIR = "downloads"
+
+# Extension of archives still being downloaded, which are resumed where they stopped.
+PARTIAL_FILE_EXT = ".part"
+
+# Bytes read from the network and written to disk at a time.
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+
+class TokenBucket:
+    """Limits how often something happens to a steady rate, allowing short bursts. May be shared between threads."""
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise Exception("Token bucket needs a positive rate.")
+        if capacity < 1:
+            raise Exception("Token bucket needs a capacity of at least one.")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, sleeping until one is available."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens +
+                              (now - self.updated) * self.rate)
+            self.updated = now
+            # Going into debt reserves the next token for this caller, so waiting callers are served in order.
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BeatmapsetDownloader:
+    """Lists ranked beatmapsets and downloads their archives from osu over a shared connection pool.
+
+    The downloader may be shared between threads so waiting on the network overlaps, while every request goes through one rate limiter.
+    Connection errors and overload responses are retried with exponential backoff.
+    Archives are streamed to the download directory and resumed with range requests after a failure, even in a later crawl."""
+
+    def __init__(self, session, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, base_url=OSU_BASE_URL, download_dir=DEFAULT_DOWNLOAD_DIR):
+        if concurrency < 1:
+            raise Exception("Downloader needs at least one thread.")
+        self.session = session
+        self.concurrency = concurrency
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.base_url = base_url
+        self.download_dir = download_dir
+        self.retry_count = 0
+        self.retry_count_lock = threading.Lock()
+        # Keep a connection open for every thread instead of the default pool of ten shared by all hosts.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def get(self, url):
+        """Returns the response to a GET request once it succeeds, retrying connection errors and overload responses."""
+        return self._retry(url, lambda: self._send(url))
+
+    def search(self, cursor=None):
+        """Yields ranked beatmapsets from the cursor on, None being the most recently ranked."""
+        for _, beatmapsets, _ in self.search_pages(cursor):
+            yield from beatmapsets
+
+    def search_pages(self, cursor=None, should_stop=None):
+        """Yields pages of the listing as (cursor requesting the page, beatmapsets, cursor of the next page), following them from the cursor on.
+
+        The last page has no next cursor. Stops before requesting a page once should_stop returns True."""
+        # Match scrolling behavior of https://osu.ppy.sh/beatmapsets.
+        while True:
+            if should_stop is not None and should_stop():
+                return
+            request_url = self.base_url + SEARCH_PATH
+            if cursor is not None:
+                request_url += f"&cursor%5Bapproved_date%5D={cursor['approved_date']}&cursor%5B_id%5D={cursor['_id']}"
+            data = self.get(request_url).json()
+            next_cursor = data["cursor"]
+            yield cursor, data["beatmapsets"], next_cursor
+            if next_cursor is None:
+                return
+            cursor = next_cursor
+
+    def download(self, beatmapset_id, progress=None):
+        """Downloads the archive of a beatmapset without its video and returns its path, once it is known to be a valid zip file.
+
+        The optional progress callback is passed the bytes downloaded so far and the size of the archive, if the server sent it."""
+        path = self.archive_path(beatmapset_id)
+        if os.path.exists(path):
+            # Left by a crawl that stopped before processing it.
+            return path
+        os.makedirs(self.download_dir, exist_ok=True)
+        url = f"{self.base_url}/beatmapsets/{beatmapset_id}/download?noVideo=1"
+        partial_path = path + PARTIAL_FILE_EXT
+        self._retry(url, lambda: self._download_to(
+            url, partial_path, progress))
+        if not _is_valid_zip(partial_path):
+            # Downloading it again would only resume past the corruption.
+            os.remove(partial_path)
+            raise Exception(
+                f"Downloaded archive of beatmapset {beatmapset_id} is not a valid zip file.")
+        os.replace(partial_path, path)
+        return path
+
+    def archive_path(self, beatmapset_id):
+        return os.path.join(self.download_dir, f"{beatmapset_id}.osz")
+
+    def _retry(self, url, attempt):
+        # Runs the attempt until it stops failing with a connection or retryable error.
+        for attempt_number in range(self.retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return attempt()
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error, delay = e, None
+            except RetryableError as e:
+                error, delay = e, e.delay
+            if attempt_number == self.retries:
+                break
+            with self.retry_count_lock:
+                self.retry_count += 1
+            time.sleep(self.backoff * 2 **
+                       attempt_number if delay is None else delay)
+        raise Exception(
+            f"Request failed after {self.retries + 1} attempts ({error}): {url}.")
+
+    def _send(self, url, headers=None, stream=False, allowed_status_codes=()):
+        response = self.session.get(
+            url, headers=headers, stream=stream, timeout=REQUEST_TIMEOUT)
+        if response.status_code < 400 or response.status_code in allowed_status_codes:
+            return response
+        response.close()
+        if response.status_code not in RETRY_STATUS_CODES:
+            raise Exception(
+                f"Request failed with status {response.status_code}: {url}.")
+        raise RetryableError(
+            f"status {response.status_code}", _retry_after(response))
+
+    def _download_to(self, url, partial_path, progress):
+        downloaded = os.path.getsize(
+            partial_path) if os.path.exists(partial_path) else 0
+        headers = {"Range": f"bytes={downloaded}-"} if downloaded else None
+        with self._send(url, headers, True, (RANGE_NOT_SATISFIABLE,)) as response:
+            if response.status_code == RANGE_NOT_SATISFIABLE:
+                os.remove(partial_path)
+                raise RetryableError("partial download too long", 0)
+            if response.status_code != 206:
+                # The server sent the whole archive, ignoring the range.
+                downloaded = 0
+            length = response.headers.get("Content-Length")
+            total = downloaded + int(length) if length is not None else None
+            with open(partial_path, "ab" if downloaded else "wb") as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    downloaded += len(chunk)
+                    if progress is not None:
+                        progress(downloaded, total)
+        if total is not None and downloaded < total:
+            raise RetryableError(
+                f"connection closed after {downloaded} of {total} bytes", None)
+
+
+class RetryableError(Exception):
+    """A request failure worth retrying, after the given delay in seconds or the backoff if None."""
+
+    def __init__(self, message, delay):
+        Exception.__init__(self, message)
+        self.delay = delay
+
+
+def _is_valid_zip(path):
+    try:
+        with zipfile.ZipFile(path, "r") as archive:
+            return archive.testzip() is None
+    except (zipfile.BadZipFile, zlib.error, EOFError):
+        return False
+
+
+def _retry_after(response):
+    # Only the number of seconds form of the header is used, osu does not send dates.
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
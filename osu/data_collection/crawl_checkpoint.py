@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+
+DEFAULT_CHECKPOINT_PATH = "osu/crawl_checkpoint.json"
+
+# Bump whenever the checkpoint format changes so an old checkpoint is never misread.
+CRAWL_CHECKPOINT_VERSION = 1
+
+# Walk the listing from the newest beatmapsets, from where the last walk stopped, or from the newest until reaching beatmapsets seen before.
+FULL_CRAWL = "full"
+RESUME_CRAWL = "resume"
+NEWER_CRAWL = "newer"
+CRAWL_MODES = [FULL_CRAWL, RESUME_CRAWL, NEWER_CRAWL]
+
+
+class CrawlCheckpoint:
+    """Remembers how far down the beatmapset listing a crawl got and every beatmapset it is done with, so the next crawl can skip them.
+
+    The cursor only moves past a listing page once every beatmapset on it is done or failed, so beatmapsets still queued or
+    dropped when the crawl stopped are listed again on resume. Failed beatmapsets, such as ones that could not be downloaded,
+    are remembered apart from done ones so a beatmapset that always fails cannot hold the cursor back, while a full crawl still retries them. Saving writes a temporary file and renames it, so an
+    interrupted save never leaves a broken checkpoint. The checkpoint may be shared between threads."""
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self.cursor = None
+        # Whether the last walk reached the end of the listing.
+        self.complete = False
+        self.done_ids = set()
+        self.failed_ids = set()
+        self.lock = threading.Lock()
+        # Pages of the current walk with beatmapsets not done yet, oldest first, as [cursor requesting the page, ids left].
+        self._pages = []
+        self._walking = False
+        self._next_cursor = None
+        self._load()
+
+    def begin_walk(self, cursor=None):
+        """Starts tracking a walk down the listing from the cursor, None being the newest beatmapsets."""
+        with self.lock:
+            self._walking = True
+            self._pages = []
+            self.cursor = self._next_cursor = cursor
+            self.complete = False
+
+    def add_page(self, cursor, beatmapset_ids, next_cursor):
+        """Records a listing page requested with cursor before its beatmapsets are handed out. The last page has no next cursor."""
+        with self.lock:
+            if not self._walking:
+                return
+            self._pages.append([cursor, set(beatmapset_ids) - self.done_ids])
+            self._next_cursor = next_cursor
+            self._advance()
+
+    def is_done(self, beatmapset_id):
+        with self.lock:
+            return beatmapset_id in self.done_ids
+
+    def mark_done(self, beatmapset_id, save=True):
+        """Records that a beatmapset needs no more work, whether it was saved or skipped.
+
+        The checkpoint is saved if asked to or if the cursor moved on, which keeps skipping many known beatmapsets cheap."""
+        with self.lock:
+            self.done_ids.add(beatmapset_id)
+            self.failed_ids.discard(beatmapset_id)
+            self._finish(beatmapset_id, save)
+
+    def mark_failed(self, beatmapset_id, save=True):
+        """Records that a beatmapset failed in this crawl, so the cursor can move past its page. It is not done, so it is tried again by later crawls that list it."""
+        with self.lock:
+            if beatmapset_id in self.done_ids:
+                return
+            self.failed_ids.add(beatmapset_id)
+            self._finish(beatmapset_id, save)
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+    def _finish(self, beatmapset_id, save):
+        for _, ids in self._pages:
+            ids.discard(beatmapset_id)
+        cursor = self.cursor
+        self._advance()
+        if save or self.cursor != cursor:
+            self._save()
+
+    def _advance(self):
+        while self._pages and not self._pages[0][1]:
+            self._pages.pop(0)
+        if not self._walking:
+            return
+        if self._pages:
+            self.cursor = self._pages[0][0]
+        else:
+            self.cursor = self._next_cursor
+            self.complete = self._next_cursor is None
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        if data.get("version") != CRAWL_CHECKPOINT_VERSION:
+            return
+        self.cursor = data["cursor"]
+        self.complete = data["complete"]
+        self.done_ids = set(data["done_ids"])
+        # Checkpoints saved before failures were recorded have none.
+        self.failed_ids = set(data.get("failed_ids", []))
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": CRAWL_CHECKPOINT_VERSION, "cursor": self.cursor, "complete": self.complete,
+                       "done_ids": sorted(self.done_ids), "failed_ids": sorted(self.failed_ids)}, f)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,166 @@
+import queue
+import threading
+
+# Number of items waiting between two stages, which holds a stage back until the next catches up.
+DEFAULT_QUEUE_SIZE = 4
+
+# Seconds a blocked thread waits before checking whether the pipeline is stopping.
+POLL_INTERVAL = 0.1
+
+
+class Pipeline:
+    """Passes items from a source through stages of worker threads connected by bounded queues, so slow stages hold back fast ones.
+
+    The source is an iterable, or a function returning one when called with a check of whether the pipeline is stopping,
+    so a source waiting on something slow can give up early.
+    Every stage calls its function on the items of the stage before it, passing on whatever is not None.
+    Stopping lets every item a worker already started on finish while queued items are passed to the discard function of the stage they were queued for.
+    An exception raised by a stage function is passed to the on_error function of the stage with the item, after which the stage moves on to the next item.
+    An exception raised by the source or by a stage without on_error stops the pipeline and is raised again by run."""
+
+    def __init__(self, source, queue_size=DEFAULT_QUEUE_SIZE):
+        self.source = source
+        self.queue_size = queue_size
+        self.stages = []
+        self.stopping = threading.Event()
+        self.error = None
+        self.error_lock = threading.Lock()
+
+    def add_stage(self, name, function, workers=1, discard=None, on_error=None):
+        if workers < 1:
+            raise Exception(f"Pipeline stage {name} needs at least one worker.")
+        self.stages.append((name, function, workers, discard, on_error))
+        return self
+
+    def stop(self):
+        self.stopping.set()
+
+    def is_stopping(self):
+        return self.stopping.is_set()
+
+    def run(self, should_stop=None):
+        """Yields the results of the last stage as they finish until every item has passed through, checking should_stop while waiting."""
+        if not self.stages:
+            raise Exception("Pipeline has no stages.")
+        queues = [queue.Queue(self.queue_size) for _ in self.stages]
+        # Results are collected by the caller, so nothing finished is lost to a full queue.
+        queues.append(queue.Queue())
+        # Set once nothing more is put into the queue of the same index.
+        finished = [threading.Event() for _ in queues]
+        threads = [threading.Thread(target=self._produce, args=(
+            queues[0], finished[0]), name="pipeline source", daemon=True)]
+        for i, (name, function, workers, _, on_error) in enumerate(self.stages):
+            remaining = _Counter(workers)
+            threads += [threading.Thread(target=self._work, args=(i, function, on_error, queues[i], finished[i], queues[i + 1], finished[i + 1], remaining),
+                                         name=f"pipeline {name} {j}", daemon=True) for j in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                if should_stop is not None and should_stop():
+                    self.stop()
+                result = _get(queues[-1], finished[-1])
+                if result is _FINISHED:
+                    break
+                if result is not _EMPTY:
+                    yield result
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            for i in range(len(self.stages)):
+                while not queues[i].empty():
+                    self._discard(i, queues[i].get_nowait())
+        if self.error is not None:
+            raise self.error
+
+    def _produce(self, output, output_finished):
+        try:
+            source = self.source(self.is_stopping) if callable(
+                self.source) else self.source
+            for item in source:
+                if self.stopping.is_set() or not self._put(output, item):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            output_finished.set()
+
+    def _work(self, stage_index, function, on_error, input, input_finished, output, output_finished, remaining):
+        try:
+            while not self.stopping.is_set():
+                item = _get(input, input_finished)
+                if item is _FINISHED:
+                    break
+                if item is _EMPTY:
+                    continue
+                try:
+                    result = function(item)
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    # One bad item does not stop the others.
+                    on_error(item, e)
+                    continue
+                if result is not None and not self._put(output, result):
+                    self._discard(stage_index + 1, result)
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            if remaining.decrement() == 0:
+                output_finished.set()
+
+    def _put(self, output, item):
+        # Returns whether the item was put before the pipeline stopped. Results of the last stage always are.
+        while True:
+            try:
+                output.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if self.stopping.is_set():
+                    return False
+
+    def _discard(self, stage_index, item):
+        # Results of the last stage are never discarded.
+        discard = self.stages[stage_index][3] if stage_index < len(
+            self.stages) else None
+        if discard is not None:
+            discard(item)
+
+    def _fail(self, error):
+        with self.error_lock:
+            if self.error is None:
+                self.error = error
+        self.stop()
+
+
+class _Counter:
+    def __init__(self, value):
+        self.value = value
+        self.lock = threading.Lock()
+
+    def decrement(self):
+        with self.lock:
+            self.value -= 1
+            return self.value
+
+
+# Returned when nothing arrived within the poll interval.
+_EMPTY = object()
+
+# Returned when nothing more will arrive.
+_FINISHED = object()
+
+
+def _get(input, input_finished):
+    # Everything is put before the input is marked finished, so an empty input that was already finished stays empty.
+    if input_finished.is_set():
+        try:
+            return input.get_nowait()
+        except queue.Empty:
+            return _FINISHED
+    try:
+        return input.get(timeout=POLL_INTERVAL)
+    except queue.Empty:
+        return _EMPTY
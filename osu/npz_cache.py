@@ -0,0 +1,104 @@
+import os
+import shutil
+import threading
+import time
+
+CACHE_FILE_EXT = ".npz"
+TEMP_FILE_EXT = ".tmp"
+
+# Temporary files older than this in seconds are left over from writers that died and are removed when cleaning.
+ORPHANED_TEMP_FILE_AGE = 60 * 60
+
+
+class NpzCache:
+    """Base of the on disk caches keeping every entry as an .npz file named by its key.
+
+    Entries live in a directory per cache version so bumping the version never reads stale entries, and clean removes the old ones.
+    Subclasses read and write the entries themselves, going through _temp_path and _mark_used."""
+
+    def __init__(self, cache_dir, version):
+        self.cache_dir = cache_dir
+        self.version = version
+        self._total_bytes = None
+
+    def disk_usage(self):
+        """Returns the number of entries and bytes used by the current cache version."""
+        num_entries = 0
+        num_bytes = 0
+        for _, size, _ in self._entries():
+            num_entries += 1
+            num_bytes += size
+        return num_entries, num_bytes
+
+    def clean(self, max_bytes=None):
+        """Removes entries of old cache versions, orphaned temporary files and, if needed, the least recently used entries until the cache fits within max_bytes.
+
+        Returns the number of entries removed."""
+        removed = 0
+        if os.path.isdir(self.cache_dir):
+            current = self._version_dir_name()
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                # Other files, such as saved statistics, are kept.
+                if name != current and os.path.isdir(path):
+                    removed += sum(1 for _, _, files in os.walk(path)
+                                   for file in files if file.endswith(CACHE_FILE_EXT))
+                    shutil.rmtree(path)
+        self._remove_orphaned_temp_files()
+
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        if max_bytes is not None:
+            for entry_path, size, _ in entries:
+                if total <= max_bytes:
+                    break
+                os.remove(entry_path)
+                total -= size
+                removed += 1
+        self._total_bytes = total
+        return removed
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        self._total_bytes = None
+
+    def _version_dir_name(self):
+        return f"v{self.version}"
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, self._version_dir_name(), key[:2], key + CACHE_FILE_EXT)
+
+    def _entries(self):
+        version_dir = os.path.join(self.cache_dir, self._version_dir_name())
+        for root, _, files in os.walk(version_dir):
+            for file in files:
+                if file.endswith(CACHE_FILE_EXT):
+                    entry_path = os.path.join(root, file)
+                    stat = os.stat(entry_path)
+                    yield entry_path, stat.st_size, stat.st_mtime
+
+    def _remove_orphaned_temp_files(self):
+        # Temporary files still being written by another thread or process are younger than the cutoff.
+        cutoff = time.time() - ORPHANED_TEMP_FILE_AGE
+        version_dir = os.path.join(self.cache_dir, self._version_dir_name())
+        for root, _, files in os.walk(version_dir):
+            for file in files:
+                temp_path = os.path.join(root, file)
+                try:
+                    if file.endswith(TEMP_FILE_EXT) and os.stat(temp_path).st_mtime < cutoff:
+                        os.remove(temp_path)
+                except FileNotFoundError:
+                    pass
+
+    def _temp_path(self, entry_path):
+        # Entries are written to a temporary file first so concurrent readers never see a partial entry.
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        return f"{entry_path}.{os.getpid()}.{threading.get_ident()}{TEMP_FILE_EXT}"
+
+    def _mark_used(self, entry_path):
+        # Mark the entry as recently used for eviction, unless another thread just evicted it.
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
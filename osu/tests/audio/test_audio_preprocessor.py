@@ -0,0 +1,54 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from osu.audio.audio_preprocessor import AudioPreprocessor
+from osu.audio.beats_file import write_beats_file
+
+
+class StubOnsetCache:
+    """Answers every lookup with the same onsets, as the OnsetCache does on a hit."""
+
+    def track(self, audio_path, output_path, backend, onsets_only, tracker, decode_profile=None):
+        write_beats_file(output_path, None, [0.25, 0.75])
+
+
+class TestAudioPreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, "audio.csv"), "w") as f:
+            f.write("0.500,1.000,1.250\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_read_legacy(self):
+        onsets = AudioPreprocessor.read_training_audio(self.dir)
+        self.assertEqual([0.5, 1.0, 1.25], onsets.tolist())
+
+    def test_save(self):
+        output_dir = tempfile.mkdtemp(dir=self.dir)
+        scratch_root = tempfile.mkdtemp(dir=self.dir)
+        AudioPreprocessor.save_training_audio(
+            "audio.mp3", output_dir, onset_cache=StubOnsetCache(), scratch_root=scratch_root)
+        # No comma separated file is left to migrate.
+        self.assertEqual(["audio.npy"], os.listdir(output_dir))
+        self.assertEqual([], os.listdir(scratch_root))
+        self.assertEqual([0.25, 0.75], AudioPreprocessor.read_training_audio(
+            output_dir).tolist())
+
+    def test_migrate(self):
+        self.assertTrue(AudioPreprocessor.migrate_training_audio(self.dir))
+        self.assertEqual(["audio.npy"], os.listdir(self.dir))
+        self.assertFalse(AudioPreprocessor.migrate_training_audio(self.dir))
+
+        onsets = AudioPreprocessor.read_training_audio(self.dir)
+        self.assertIsInstance(onsets, np.memmap)
+        self.assertEqual([0.5, 1.0, 1.25], onsets.tolist())
+        onsets = AudioPreprocessor.read_training_audio(
+            self.dir, mmap_mode=None)
+        self.assertNotIsInstance(onsets, np.memmap)
+        self.assertEqual([0.5, 1.0, 1.25], onsets.tolist())
@@ -0,0 +1,156 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from osu.audio.beats_file import read_beats_file
+from osu.audio.beatroot_pool import BeatRootPool
+from osu.audio.process_supervisor import ProcessSupervisor
+
+# Speaks the worker protocol of the streaming driver. What it does with a job depends on the audio it reads:
+# "crash" exits, "crash once" exits unless it crashed before, "hang" never answers and anything else is tracked.
+STUB_WORKER = """
+import os, sys, time
+for line in sys.stdin:
+    job = line.rstrip("\\n").split("\\t")
+    if job[0] == "PING":
+        print("PONG", flush=True)
+    elif job[0] == "QUIT":
+        break
+    elif job[0] == "TRACK":
+        # Give a failing decoder time to exit before the pipe is opened.
+        time.sleep(0.2)
+        with open(job[4], "rb") as f:
+            audio = f.read().decode()
+        marker = os.path.join(os.path.dirname(sys.argv[0]), "crashed")
+        if audio == "crash" or (audio == "crash once" and not os.path.exists(marker)):
+            open(marker, "w").close()
+            sys.exit(1)
+        if audio == "hang":
+            time.sleep(60)
+        if not audio:
+            print("ERROR No audio", flush=True)
+            continue
+        with open(job[5], "w") as f:
+            if job[3] == "0":
+                f.write("0.500,1.000\\n")
+            f.write("0.250,0.500\\n")
+        print("OK", flush=True)
+"""
+
+# Stands in for ffmpeg, copying the input file to the output unless the input is "bad", on which it fails at once.
+STUB_DECODER = """
+import sys
+with open(sys.argv[sys.argv.index("-i") + 1], "rb") as f:
+    audio = f.read()
+if audio == b"bad":
+    sys.exit(1)
+with open(sys.argv[-1], "wb") as f:
+    f.write(audio)
+"""
+
+
+class TestBeatRootPool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.scratch_root = os.path.join(self.dir, "scratch")
+        self.worker_path = self.write_script("worker.py", STUB_WORKER)
+        self.decoder_path = self.write_script("ffmpeg", STUB_DECODER)
+        self.output_path = os.path.join(self.dir, "beats.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_script(self, name, code):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(f"#!{sys.executable}\n{code}")
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return path
+
+    def write_audio(self, contents):
+        path = os.path.join(self.dir, "audio.mp3")
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def pool(self, size=1, timeout=10):
+        supervisor = ProcessSupervisor(timeout=timeout)
+        return BeatRootPool([self.worker_path], self.decoder_path, size, supervisor, self.scratch_root)
+
+    def assert_tracks(self, pool):
+        pool.track(self.write_audio("song"), self.output_path)
+        beats, onsets = read_beats_file(self.output_path)
+        self.assertEqual([0.5, 1.0], beats.tolist())
+        self.assertEqual([0.25, 0.5], onsets.tolist())
+
+    def test_track(self):
+        with self.pool() as pool:
+            self.assertTrue(all(worker.is_healthy()
+                            for worker in pool.workers))
+            self.assert_tracks(pool)
+            pool.track(self.write_audio("song"),
+                       self.output_path, onsets_only=True)
+            _, onsets = read_beats_file(self.output_path, onsets_only=True)
+            self.assertEqual([0.25, 0.5], onsets.tolist())
+            self.assertEqual(
+                {"workers": 1, "jobs": 2, "restarts": 0}, pool.get_stats())
+        # Every job's pipe is removed with its scratch directory.
+        self.assertEqual([], os.listdir(self.scratch_root))
+
+    def test_decoder_fails_at_once(self):
+        with self.pool() as pool:
+            start = time.monotonic()
+            with self.assertRaisesRegex(Exception, "Audio decoding failed."):
+                pool.track(self.write_audio("bad"), self.output_path)
+            # The worker is not left waiting for the job timeout.
+            self.assertLess(time.monotonic() - start, 5)
+            self.assert_tracks(pool)
+            self.assertEqual(0, pool.restarts)
+
+    def test_crashed_worker_restarted(self):
+        with self.pool() as pool:
+            pool.track(self.write_audio("crash once"), self.output_path)
+            self.assertEqual(1, pool.restarts)
+            with self.assertRaisesRegex(Exception, "worker crashed"):
+                pool.track(self.write_audio("crash"), self.output_path)
+            self.assert_tracks(pool)
+
+    def test_timeout(self):
+        with self.pool(timeout=1) as pool:
+            with self.assertRaisesRegex(Exception, "timed out after 1 seconds."):
+                pool.track(self.write_audio("hang"), self.output_path)
+            self.assertEqual(1, pool.restarts)
+            self.assertEqual(1, pool.supervisor.get_stats()[
+                             "worker"]["timeouts"])
+            self.assert_tracks(pool)
+
+    def test_check_health(self):
+        with self.pool(size=2) as pool:
+            pool.workers[0].process.kill()
+            pool.workers[0].process.wait()
+            self.assertEqual(1, pool.check_health())
+            self.assertEqual(0, pool.check_health())
+            self.assert_tracks(pool)
+
+    def test_failed_request_cleaned_up(self):
+        threads = threading.active_count()
+        with self.pool() as pool:
+            def fail(line, timeout):
+                raise ValueError()
+            pool.workers[0].request = fail
+            with self.assertRaises(ValueError):
+                pool.track(self.write_audio("song"), self.output_path)
+        # The decoder blocked on the pipe nobody read was stopped, the watcher thread finished and the pipe removed.
+        self.assertEqual(threads, threading.active_count())
+        self.assertEqual([], os.listdir(self.scratch_root))
+
+    def test_close(self):
+        pool = self.pool(size=2)
+        pool.close()
+        self.assertEqual([0, 0], [worker.process.returncode
+                         for worker in pool.workers])
@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from osu.audio.beats_file import read_beats_file, write_beats_file
+from osu.audio.decode_profile import DECODE_PROFILES, DecodeProfile
+
+
+class TestDecodeProfile(unittest.TestCase):
+    def test_ffmpeg_args(self):
+        profile = DecodeProfile(1, 22050, "f32le", start=10, end=70.5)
+        self.assertEqual(["-ss", "10"], profile.input_args())
+        self.assertEqual(["-t", "60.5", "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", "22050"],
+                         profile.output_args())
+        self.assertEqual(["-t", "60.5", "-acodec", "pcm_f32le", "-ac", "1", "-ar", "22050"],
+                         profile.output_args(raw=False))
+        self.assertEqual([], DECODE_PROFILES["full"].input_args())
+        # Files decoded at full quality keep the channels and sample rate of the source.
+        self.assertEqual([], DECODE_PROFILES["full"].output_args(raw=False))
+        self.assertEqual(["-f", "s16le", "-acodec", "pcm_s16le", "-ac", "2", "-ar", "44100"],
+                         DECODE_PROFILES["full"].output_args())
+        self.assertEqual(["-t", "20", "-acodec", "pcm_s16le", "-ac", "1", "-ar", "22050"],
+                         DECODE_PROFILES["mono_22k"].trimmed(10, 30).output_args(raw=False))
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(Exception, "Unknown sample format: u8."):
+            DecodeProfile(sample_format="u8")
+        with self.assertRaisesRegex(Exception, "Decode profile trim ends before it starts."):
+            DecodeProfile(start=10, end=5)
+
+    def test_keys_distinct(self):
+        profiles = list(DECODE_PROFILES.values()) + \
+            [DecodeProfile(start=5), DecodeProfile(end=5)]
+        self.assertEqual(len(profiles), len(
+            set(profile.key() for profile in profiles)))
+
+    def test_shift_beats_file(self):
+        dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir, "beats.csv")
+            write_beats_file(path, [0.5, 1.0], [0.25, 0.5])
+            DecodeProfile(start=30).shift_beats_file(path)
+            beats, onsets = read_beats_file(path)
+            self.assertEqual([30.5, 31.0], beats.tolist())
+            self.assertEqual([30.25, 30.5], onsets.tolist())
+        finally:
+            shutil.rmtree(dir)
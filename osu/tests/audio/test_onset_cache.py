@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from osu.audio.beats_file import read_beats_file, write_beats_file
+from osu.audio.onset_cache import OnsetCache
+
+BEATS = np.array([0.5, 1.0, 1.5])
+ONSETS = np.array([0.25, 0.5, 1.0, 1.25, 1.5])
+
+
+class TestOnsetCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, "cache")
+        self.output_path = os.path.join(self.dir, "audio.csv")
+        self.tracked = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def audio_file(self, name, contents):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(contents)
+        return path
+
+    def tracker(self, onsets_only):
+        def track(output_path):
+            self.tracked.append(output_path)
+            write_beats_file(output_path, None if onsets_only else BEATS, ONSETS)
+        return track
+
+    def test_hit_matches_tracked(self):
+        cache = OnsetCache(self.cache_dir)
+        # The same audio under another name, as in a remap.
+        for name in ["a.mp3", "b.mp3"]:
+            path = self.audio_file(name, b"song")
+            cache.track(path, self.output_path, "beatroot",
+                        False, self.tracker(False))
+            beats, onsets = read_beats_file(self.output_path)
+            np.testing.assert_allclose(BEATS, beats)
+            np.testing.assert_allclose(ONSETS, onsets)
+        self.assertEqual(1, len(self.tracked))
+        self.assertEqual({"hits": 1, "misses": 1, "evictions": 0,
+                         "hit_rate": 0.5}, cache.get_stats())
+
+    def test_onsets_only_entry_has_no_beats(self):
+        cache = OnsetCache(self.cache_dir)
+        path = self.audio_file("a.mp3", b"song")
+        cache.track(path, self.output_path, "beatroot",
+                    True, self.tracker(True))
+        cache.track(path, self.output_path, "beatroot",
+                    True, self.tracker(True))
+        self.assertEqual(1, len(self.tracked))
+        # Beats have to be tracked after all.
+        cache.track(path, self.output_path, "beatroot",
+                    False, self.tracker(False))
+        self.assertEqual(2, len(self.tracked))
+        # The new entry serves onsets only requests too.
+        cache.track(path, self.output_path, "beatroot",
+                    True, self.tracker(True))
+        _, onsets = read_beats_file(self.output_path, onsets_only=True)
+        np.testing.assert_allclose(ONSETS, onsets)
+        self.assertEqual(2, len(self.tracked))
+
+    def test_backends_kept_apart(self):
+        cache = OnsetCache(self.cache_dir)
+        path = self.audio_file("a.mp3", b"song")
+        for backend in ["beatroot", "numpy"]:
+            cache.track(path, self.output_path, backend,
+                        True, self.tracker(True))
+        self.assertEqual(2, len(self.tracked))
+
+    def test_least_recently_used_evicted(self):
+        cache = OnsetCache(self.cache_dir)
+        paths = [self.audio_file(f"{i}.mp3", bytes([i])) for i in range(3)]
+        for path in paths[:2]:
+            cache.track(path, self.output_path, "beatroot",
+                        True, self.tracker(True))
+        _, entry_size = cache.disk_usage()
+        entry_size //= 2
+
+        # Use the first entry again so the second is the least recently used.
+        time.sleep(0.01)
+        cache = OnsetCache(self.cache_dir, max_bytes=2 * entry_size)
+        cache.track(paths[0], self.output_path, "beatroot",
+                    True, self.tracker(True))
+        time.sleep(0.01)
+        cache.track(paths[2], self.output_path, "beatroot",
+                    True, self.tracker(True))
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(2, cache.disk_usage()[0])
+
+        self.tracked = []
+        for path in [paths[0], paths[2], paths[1]]:
+            cache.track(path, self.output_path, "beatroot",
+                        True, self.tracker(True))
+        self.assertEqual([self.output_path], self.tracked)
+
+    def test_flush_stats(self):
+        path = self.audio_file("a.mp3", b"song")
+        for _ in range(2):
+            cache = OnsetCache(self.cache_dir)
+            for _ in range(2):
+                cache.track(path, self.output_path, "beatroot",
+                            True, self.tracker(True))
+            cache.flush_stats()
+            self.assertEqual(0, cache.get_stats()["hits"])
+        self.assertEqual({"hits": 3, "misses": 1, "evictions": 0},
+                         cache.saved_stats())
+        # Stats survive cleaning.
+        cache.clean(0)
+        self.assertEqual(3, cache.saved_stats()["hits"])
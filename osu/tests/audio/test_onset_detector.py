@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from osu.audio.onset_detector import (DETECTION_SAMPLE_RATE, HOP_TIME, detect_beats_and_onsets,
+                                      spectral_flux)
+from osu.beatmap.beat_normalizer import BEAT_TRACKING_TIMING_OFFSET, get_timing_info
+
+
+def click_track(bpm, seconds, start=1.0):
+    # Alternating low and high clicks on every half beat over quiet noise.
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 0.01, int(seconds * DETECTION_SAMPLE_RATE))
+    click_length = int(0.08 * DETECTION_SAMPLE_RATE)
+    t = np.arange(click_length) / DETECTION_SAMPLE_RATE
+    clicks = np.arange(start, seconds - 0.5, 30 / bpm)
+    for i, click in enumerate(clicks):
+        frequency, amplitude = (80, 1.0) if i % 2 == 0 else (3000, 0.4)
+        first = int(round(click * DETECTION_SAMPLE_RATE))
+        samples[first:first + click_length] += amplitude * \
+            np.exp(-t / 0.01) * np.sin(2 * np.pi * frequency * t)
+    return samples.astype(np.float32), clicks
+
+
+def chunked(samples, chunk_size):
+    return [samples[i:i + chunk_size] for i in range(0, samples.size, chunk_size)]
+
+
+class TestOnsetDetector(unittest.TestCase):
+    def test_onsets(self):
+        samples, clicks = click_track(128, 30)
+        _, onsets = detect_beats_and_onsets(chunked(samples, 1 << 16))
+        onsets -= BEAT_TRACKING_TIMING_OFFSET
+        # Every click is found within a hop, allowing for a spurious onset where the audio starts.
+        self.assertLessEqual(abs(onsets.size - clicks.size), 1)
+        errors = np.abs(clicks[:, np.newaxis] - onsets).min(axis=1)
+        self.assertLess(errors.max(), HOP_TIME)
+
+    def test_chunk_size_independent(self):
+        samples, _ = click_track(128, 10)
+        whole = spectral_flux([samples])
+        for chunk_size in [1000, 4096, 100000]:
+            np.testing.assert_allclose(
+                whole, spectral_flux(chunked(samples, chunk_size)), rtol=1e-4, atol=1e-3)
+
+    def test_timing_info(self):
+        for bpm in [95, 128, 140]:
+            samples, clicks = click_track(bpm, 60)
+            beats, onsets = detect_beats_and_onsets(chunked(samples, 1 << 16))
+            timing_points, map_bpm, _ = get_timing_info(beats, onsets)
+            self.assertAlmostEqual(bpm, map_bpm, delta=1)
+            # The offset lies on the grid of clicks, which may extend before the first click.
+            phase = (timing_points[0][0] / 1000 - clicks[0]) % (30 / bpm)
+            self.assertLess(min(phase, 30 / bpm - phase), 0.01)
+
+    def test_sample_rates(self):
+        samples, clicks = click_track(128, 30)
+        for decimation in [2, 4]:
+            # Averaging neighbouring samples as a crude low pass filter before downsampling.
+            downsampled = samples[:samples.size // decimation * decimation].reshape(
+                -1, decimation).mean(axis=1)
+            _, onsets = detect_beats_and_onsets(
+                chunked(downsampled, 1 << 14), DETECTION_SAMPLE_RATE // decimation)
+            errors = np.abs(clicks[:, np.newaxis] - (onsets - BEAT_TRACKING_TIMING_OFFSET)).min(axis=1)
+            self.assertLess(errors.max(), HOP_TIME)
+
+    def test_empty(self):
+        beats, onsets = detect_beats_and_onsets([])
+        self.assertEqual(0, beats.size)
+        self.assertEqual(0, onsets.size)
@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+from osu.audio.process_supervisor import ProcessSupervisor, resource
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def run_limited(supervisor, code, **kwargs):
+    # The child waits for stdin to close, which happens once popen has returned and so after the limits are set.
+    process = supervisor.popen(python_command(f"import sys; sys.stdin.read()\n{code}"), stdin=subprocess.PIPE,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+    process.stdin.close()
+    return process.wait(timeout=10)
+
+
+class TestProcessSupervisor(unittest.TestCase):
+    def test_run(self):
+        supervisor = ProcessSupervisor(timeout=10)
+        self.assertEqual(0, supervisor.run(python_command("pass")))
+        self.assertEqual(3, supervisor.run(
+            python_command("import sys; sys.exit(3)")))
+        # Tools are counted by their file name.
+        tool = os.path.splitext(os.path.basename(sys.executable))[0]
+        self.assertEqual({"runs": 2, "timeouts": 0},
+                         supervisor.get_stats()[tool])
+
+    def test_timeout(self):
+        supervisor = ProcessSupervisor(timeout=10)
+        start = time.monotonic()
+        with self.assertRaisesRegex(Exception, "timed out after 0.5 seconds."):
+            supervisor.run(python_command(
+                "import time; time.sleep(60)"), timeout=0.5)
+        self.assertLess(time.monotonic() - start, 10)
+        stats = next(iter(supervisor.get_stats().values()))
+        self.assertEqual({"runs": 1, "timeouts": 1}, stats)
+
+    def test_watch_replaces_kill_error(self):
+        supervisor = ProcessSupervisor(timeout=0.5)
+        process = supervisor.popen(python_command(
+            "import time; time.sleep(60)"), stdout=subprocess.PIPE)
+        with self.assertRaisesRegex(Exception, "timed out"):
+            with supervisor.watch(process):
+                # Reading hits the end of the output once the process is killed.
+                if process.stdout.read() == b"":
+                    raise Exception("Unexpected end of output.")
+        process.stdout.close()
+        process.wait()
+
+    @unittest.skipIf(resource is None, "rlimits are unavailable")
+    def test_memory_limit(self):
+        supervisor = ProcessSupervisor(timeout=10, memory_limit=256 << 20)
+        allocate = "bytearray(512 << 20)"
+        self.assertNotEqual(0, run_limited(supervisor, allocate))
+        self.assertEqual(0, run_limited(
+            supervisor, allocate, limit_memory=False))
+
+    @unittest.skipIf(resource is None, "rlimits are unavailable")
+    def test_cpu_limit(self):
+        supervisor = ProcessSupervisor(timeout=10, cpu_limit=1)
+        self.assertNotEqual(0, run_limited(supervisor, "while True: pass"))
+
+    def test_java_command(self):
+        self.assertEqual(["java", "-Xmx512m", "-cp", "a.jar"],
+                         ProcessSupervisor(memory_limit=512 << 20).java_command(["-cp", "a.jar"]))
+        self.assertEqual(["java", "-cp", "a.jar"],
+                         ProcessSupervisor(memory_limit=None).java_command(["-cp", "a.jar"]))
+
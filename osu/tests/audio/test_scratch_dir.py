@@ -0,0 +1,57 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from osu.audio.scratch_dir import SCRATCH_DIR_PREFIX, ScratchDir
+
+
+class TestScratchDir(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_unique_and_removed(self):
+        with ScratchDir("song", self.root) as first, ScratchDir("song", self.root) as second:
+            self.assertNotEqual(first.path, second.path)
+            self.assertEqual(self.root, os.path.dirname(first.path))
+            with open(first.file("audio.wav"), "wb") as f:
+                f.write(b"wav")
+            path = first.path
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual([], os.listdir(self.root))
+
+    def test_removed_on_failure(self):
+        with self.assertRaises(ValueError):
+            with ScratchDir("song", self.root) as scratch:
+                os.makedirs(scratch.file("nested"))
+                raise ValueError()
+        self.assertEqual([], os.listdir(self.root))
+
+    def test_root_created(self):
+        root = os.path.join(self.root, "tmpfs", "scratch")
+        scratch = ScratchDir(root=root).create()
+        self.assertTrue(os.path.isdir(scratch.path))
+        scratch.cleanup()
+        scratch.cleanup()
+        self.assertEqual([], os.listdir(root))
+
+    @unittest.skipIf(os.name != "posix", "process liveness is only checked on POSIX")
+    def test_clean_stale(self):
+        # A process that has exited leaves its directory behind.
+        process = subprocess.Popen([sys.executable, "-c", "pass"])
+        process.wait()
+        stale = os.path.join(
+            self.root, f"{SCRATCH_DIR_PREFIX}{process.pid}-job-abc")
+        os.makedirs(stale)
+        other = os.path.join(self.root, "unrelated")
+        os.makedirs(other)
+        with ScratchDir(root=self.root) as live:
+            self.assertEqual(1, ScratchDir.clean_stale(self.root))
+            self.assertTrue(os.path.exists(live.path))
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(other))
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+from osu.audio.audio_preprocessor import BEATROOT_JAR_PATH
+from osu.audio.beatroot_pool import BeatRootPool
+from osu.audio.beats_file import read_beats_file
+from osu.audio.decode_profile import DecodeProfile
+from osu.audio.process_supervisor import ProcessSupervisor
+from osu.audio.streaming_beatroot import DRIVER_CLASS_NAME, run_streaming_beatroot, streaming_classpath, validate_driver_profile
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+def write_clicks(path, sample_rate=44100, seconds=12, interval=0.5):
+    # A decaying noise burst every interval over quiet noise, in 16 bit stereo.
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 0.005, seconds * sample_rate)
+    click_length = int(0.05 * sample_rate)
+    click = rng.normal(0, 0.3, click_length) * \
+        np.exp(-np.arange(click_length) / (0.01 * sample_rate))
+    for time in np.arange(interval, seconds - 1, interval):
+        first = int(time * sample_rate)
+        samples[first:first + click_length] += click
+    pcm = np.round(np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.repeat(pcm, 2).tobytes())
+
+
+class TestStreamingBeatRootDriver(unittest.TestCase):
+    def test_validate_driver_profile(self):
+        validate_driver_profile(DecodeProfile())
+        with self.assertRaisesRegex(Exception, "BeatRoot only reads s16le audio, not f32le."):
+            validate_driver_profile(DecodeProfile(sample_format="f32le"))
+
+    def test_missing_source(self):
+        self.assertIsNone(streaming_classpath(
+            BEATROOT_JAR_PATH, source_path="missing.java"))
+
+
+@unittest.skipIf(None in (shutil.which("java"), shutil.which("javac"), FFMPEG), "java, javac and ffmpeg are needed to run BeatRoot")
+class TestStreamingBeatRoot(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.audio_path = os.path.join(self.dir, "clicks.wav")
+        write_clicks(self.audio_path)
+        self.classpath = streaming_classpath(
+            BEATROOT_JAR_PATH, classes_dir=os.path.join(self.dir, "classes"))
+        self.assertIsNotNone(self.classpath)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_command_line(self):
+        output_path = os.path.join(self.dir, "cli.csv")
+        subprocess.run(["java", "-Djava.awt.headless=true", "-cp", BEATROOT_JAR_PATH, "at.ofai.music.beatroot.BeatRoot",
+                        "-x", output_path, self.audio_path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        return read_beats_file(output_path)
+
+    def test_matches_command_line(self):
+        beats, onsets = self.run_command_line()
+        output_path = os.path.join(self.dir, "streamed.csv")
+        run_streaming_beatroot(FFMPEG, self.audio_path,
+                               self.classpath, output_path)
+        streamed_beats, streamed_onsets = read_beats_file(output_path)
+        self.assertLess(20, onsets.size)
+        self.assertEqual(beats.tolist(), streamed_beats.tolist())
+        self.assertEqual(onsets.tolist(), streamed_onsets.tolist())
+
+    def test_onsets_only(self):
+        _, onsets = self.run_command_line()
+        output_path = os.path.join(self.dir, "streamed.csv")
+        run_streaming_beatroot(FFMPEG, self.audio_path, self.classpath,
+                               output_path, onsets_only=True)
+        _, streamed_onsets = read_beats_file(output_path, onsets_only=True)
+        self.assertEqual(onsets.tolist(), streamed_onsets.tolist())
+
+    def test_pool(self):
+        beats, onsets = self.run_command_line()
+        supervisor = ProcessSupervisor()
+        command = supervisor.java_command(
+            ["-Djava.awt.headless=true", "-cp", self.classpath, DRIVER_CLASS_NAME, "-w"])
+        output_path = os.path.join(self.dir, "pooled.csv")
+        with BeatRootPool(command, FFMPEG, supervisor=supervisor, scratch_root=self.dir) as pool:
+            for _ in range(2):
+                pool.track(self.audio_path, output_path)
+                pooled_beats, pooled_onsets = read_beats_file(output_path)
+                self.assertEqual(beats.tolist(), pooled_beats.tolist())
+                self.assertEqual(onsets.tolist(), pooled_onsets.tolist())
+            with open(self.audio_path, "wb") as f:
+                f.write(b"not audio")
+            with self.assertRaisesRegex(Exception, "Audio decoding failed."):
+                pool.track(self.audio_path, output_path)
+            self.assertEqual(0, pool.restarts)
+
+    def test_decoding_failure(self):
+        with open(self.audio_path, "wb") as f:
+            f.write(b"not audio")
+        with self.assertRaisesRegex(Exception, "Audio decoding failed."):
+            run_streaming_beatroot(FFMPEG, self.audio_path, self.classpath,
+                                   os.path.join(self.dir, "streamed.csv"))
@@ -142,6 +142,63 @@ class TestBeatNormalizer(unittest.TestCase):
         # Having an average of 0 minimizes the squared differences in offset.
         self.assertEqual(round(sum / count), 0)
 
+    def test_real_beat_data_tempo_search(self):
+        for file in os.listdir(TEST_BEAT_DATA_DIR):
+            beats, onsets, expected_bpm, _ = _read_beats_file(
+                os.path.join(TEST_BEAT_DATA_DIR, file))
+            _, bpm, _ = beat_normalizer.get_timing_info(
+                beats, onsets, tempo_search=True)
+            self.assertEqual(bpm, expected_bpm, msg=f"Failed for {file}.")
+
+    def test_tempo_search_slow_beat_tracking(self):
+        beats, onsets, expected_bpm, _ = _read_beats_file(
+            os.path.join(TEST_BEAT_DATA_DIR, sorted(os.listdir(TEST_BEAT_DATA_DIR))[0]))
+        # Beats tracked at three quarters of the true tempo, which is outside the candidates guessed from the beat tracker's bpm.
+        slow_beats = np.arange(beats[0], beats[-1], 60 / (expected_bpm * 0.75))
+        _, bpm, _ = beat_normalizer.get_timing_info(
+            slow_beats, onsets, tempo_search=True)
+        self.assertEqual(bpm, expected_bpm)
+
+    def test_variable_bpm_single_bpm_unchanged(self):
+        for file in os.listdir(TEST_BEAT_DATA_DIR):
+            beats, onsets, _, _ = _read_beats_file(
+                os.path.join(TEST_BEAT_DATA_DIR, file))
+            self.assertEqual(beat_normalizer.get_timing_info(beats, onsets), beat_normalizer.get_timing_info(
+                beats, onsets, variable_bpm=True), msg=f"Failed for {file}.")
+
+    def test_variable_bpm_consecutive_songs(self):
+        files = sorted(os.listdir(TEST_BEAT_DATA_DIR))
+        first_beats, first_onsets, first_bpm, _ = _read_beats_file(
+            os.path.join(TEST_BEAT_DATA_DIR, files[0]))
+        second_beats, second_onsets, second_bpm, _ = _read_beats_file(
+            os.path.join(TEST_BEAT_DATA_DIR, files[1]))
+        # Play the second song a second after the first ends.
+        shift = max(first_beats[-1], first_onsets[-1]) + 1
+        beats = np.concatenate((first_beats, second_beats + shift))
+        onsets = np.concatenate((first_onsets, second_onsets + shift))
+        timing_points, bpm, _ = beat_normalizer.get_timing_info(
+            beats, onsets, variable_bpm=True)
+        self.assertEqual([first_bpm, second_bpm], [
+                         round(60000 / interval) for _, interval in timing_points])
+        self.assertGreater(timing_points[1][0], shift * 1000)
+        # The beatmap bpm is that of the longer song.
+        longer_bpm = first_bpm if first_beats[-1] - \
+            first_beats[0] > second_beats[-1] - second_beats[0] else second_bpm
+        self.assertEqual(bpm, longer_bpm)
+
+    def test_batch_matches_single(self):
+        songs = []
+        for file in sorted(os.listdir(TEST_BEAT_DATA_DIR)):
+            beats, onsets, _, _ = _read_beats_file(
+                os.path.join(TEST_BEAT_DATA_DIR, file))
+            songs.append((beats, onsets))
+        expected = [beat_normalizer.get_timing_info(
+            beats, onsets) for beats, onsets in songs]
+        self.assertEqual(
+            expected, beat_normalizer.get_timing_info_batch(songs, batch_size=5))
+        self.assertEqual(expected, beat_normalizer.get_timing_info_batch(
+            songs, processes=2, batch_size=5))
+
     def _assert_single_bpm_details(self, beats, onsets, *, offset, interval, last_beat):
         timing_points, bpm, actual_last_beat = beat_normalizer.get_timing_info(
             beats, onsets)
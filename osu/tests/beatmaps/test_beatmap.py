@@ -1,3 +1,4 @@
+import io
 import os
 import unittest
 
@@ -48,6 +49,17 @@ class TestBeatmap(unittest.TestCase):
             ], labels, from_ending=True)
         self.assertEqual(573, len(labels))
 
+    def test_parse_variable_bpm(self):
+        path = os.path.join(TEST_BEATMAPS_DIR, "valid_no_breaks.osu")
+        with open(path, "rb") as f:
+            data = f.read()
+        # A change of bpm after the last hit object leaves the labels unchanged.
+        data = data.replace(b"47078,-100,4,2,11,60,0,0",
+                            b"47078,-100,4,2,11,60,0,0\n999999,300,4,2,11,60,1,0")
+        expected = Beatmap.from_osu_file(path).get_training_labels()
+        labels = Beatmap.from_bytes(data).get_training_labels()
+        self.assertEqual(expected, labels)
+
     def test_parse_breaks(self):
         # Tokyo [Nhawak's Beginner].
         path = os.path.join(TEST_BEATMAPS_DIR, "valid_breaks.osu")
@@ -113,6 +125,51 @@ class TestBeatmap(unittest.TestCase):
                             "late_starting_timing_point.osu")
         Beatmap.from_osu_file(path)
 
+    def test_columnar_matches_objects(self):
+        for file in ["valid_no_breaks.osu", "valid_breaks.osu", "rounding_error.osu", "late_starting_timing_point.osu"]:
+            path = os.path.join(TEST_BEATMAPS_DIR, file)
+            expected = Beatmap.from_osu_file(path).get_training_labels()
+            actual = Beatmap.from_osu_file(
+                path, columnar=True).get_training_labels()
+            self.assertEqual(expected, actual, f"Failed for {file}.")
+
+    def test_columnar_not_on_divisor(self):
+        path = os.path.join(TEST_BEATMAPS_DIR, "not_on_divisor.osu")
+        with self.assertRaises(Exception):
+            Beatmap.from_osu_file(path, columnar=True)
+
+    def test_from_bytes_and_stream(self):
+        path = os.path.join(TEST_BEATMAPS_DIR, "valid_breaks.osu")
+        expected = Beatmap.from_osu_file(path).get_training_labels()
+        with open(path, "rb") as f:
+            data = f.read()
+        beatmap = Beatmap.from_bytes(data)
+        self.assertEqual(801333, beatmap.id)
+        self.assertEqual(expected, beatmap.get_training_labels())
+        beatmap = Beatmap.from_stream(io.BytesIO(data))
+        self.assertEqual(expected, beatmap.get_training_labels())
+
+    def test_lazy(self):
+        path = os.path.join(TEST_BEATMAPS_DIR, "not_on_divisor.osu")
+        beatmap = Beatmap.from_osu_file(path, lazy=True)
+        self.assertAlmostEqual(8.8, beatmap.od)
+        # Hit objects are only validated once the divisor sections are needed.
+        with self.assertRaises(Exception):
+            beatmap.get_training_labels()
+
+        path = os.path.join(TEST_BEATMAPS_DIR, "valid_breaks.osu")
+        beatmap = Beatmap.from_osu_file(path, lazy=True)
+        self.assertEqual(2, len(beatmap.get_training_labels()))
+
+    def test_peek(self):
+        self.assertEqual(1, Beatmap.peek_mode(
+            os.path.join(TEST_BEATMAPS_DIR, "taiko.osu")))
+        metadata = Beatmap.peek_metadata(
+            os.path.join(TEST_BEATMAPS_DIR, "valid_breaks.osu"))
+        self.assertEqual("tokyo.mp3", metadata["General"]["AudioFilename"])
+        self.assertEqual("801333", metadata["Metadata"]["BeatmapID"])
+        self.assertEqual("2.5", metadata["Difficulty"]["CircleSize"])
+
     def assert_expected_labels(self, tuples, actual, from_ending=False):
         index = -1 if from_ending else 0
         for hit_object_type, num in tuples:
@@ -0,0 +1,48 @@
+import unittest
+
+from osu.beatmap.divisor_section import DivisorSection
+from osu.beatmap.hit_object import HitCircle, Slider, Spinner
+from osu.beatmap.timing_point import TimingPoint
+
+# 120 bpm starting at 1000ms, 1/4 beat divisors are 125ms apart.
+TIMING_POINTS = [TimingPoint("1000,500,4,1,0,100,1,0"),
+                 TimingPoint("3000,-50,4,1,0,100,0,0")]
+
+# 120 bpm starting at 1000ms changing to 150 bpm at 3000ms, where 1/4 beat divisors become 100ms apart.
+VARIABLE_TIMING_POINTS = [TimingPoint("1000,500,4,1,0,100,1,0"),
+                          TimingPoint("3000,400,4,1,0,100,1,0")]
+
+
+class TestDivisorSection(unittest.TestCase):
+    def test_labels(self):
+        hit_objects = [HitCircle(0, 0, 1250), Slider(0, 0, 1500, 140),
+                       HitCircle(0, 0, 2501), Spinner(2750, 3250), Slider(0, 0, 3500, 140)]
+        labels = DivisorSection(TIMING_POINTS, hit_objects,
+                                1.4).get_training_labels()
+        # The last slider is under a timing point with double the slider velocity.
+        expected = [1, 0, 2, 2, 2, 2, 0, 0, 0, 0, 1, 0, 3, 3, 3, 3, 0, 0, 2, 2]
+        self.assertEqual(expected, labels)
+
+    def test_not_on_divisor(self):
+        hit_objects = [HitCircle(0, 0, 1250), HitCircle(0, 0, 1300)]
+        with self.assertRaisesRegex(Exception, "doesn't fall on a 1/4 beat divisor, expected ~1375"):
+            DivisorSection(TIMING_POINTS, hit_objects, 1.4)
+
+    def test_intersects_previous(self):
+        hit_objects = [Slider(0, 0, 1250, 140), HitCircle(0, 0, 1375)]
+        with self.assertRaisesRegex(Exception, "intersects with previous hit object"):
+            DivisorSection(TIMING_POINTS, hit_objects, 1.4)
+
+    def test_variable_bpm_labels(self):
+        hit_objects = [HitCircle(0, 0, 1000), HitCircle(0, 0, 2500), HitCircle(0, 0, 3000),
+                       HitCircle(0, 0, 3100), Slider(0, 0, 3200, 140), HitCircle(0, 0, 3700)]
+        labels = DivisorSection(VARIABLE_TIMING_POINTS, hit_objects,
+                                1.4).get_training_labels()
+        # The slider lasts one beat of the second timing point.
+        expected = [1] + [0] * 11 + [1, 0, 0, 0, 1, 1, 2, 2, 2, 2, 0, 1]
+        self.assertEqual(expected, labels)
+
+    def test_variable_bpm_not_on_divisor(self):
+        hit_objects = [HitCircle(0, 0, 2500), HitCircle(0, 0, 3050)]
+        with self.assertRaisesRegex(Exception, "doesn't fall on a 1/4 beat divisor, expected ~3100"):
+            DivisorSection(VARIABLE_TIMING_POINTS, hit_objects, 1.4)
@@ -0,0 +1,51 @@
+import unittest
+
+from osu.beatmap.osu_file import OsuFile
+
+CONTENTS = b"""osu file format v14
+
+[General]
+AudioFilename: audio.mp3
+Mode: 0
+
+[Metadata]
+Title:Some:Title
+BeatmapID:5
+
+[Events]
+//Break Periods
+2,100,200
+
+[HitObjects]
+256,192,1000,1,0,0:0:0:0:
+256,192,2000,1,0,0:0:0:0:
+"""
+
+
+class TestOsuFile(unittest.TestCase):
+    def test_key_value_section(self):
+        f = OsuFile(CONTENTS)
+        self.assertEqual(
+            {"AudioFilename": "audio.mp3", "Mode": "0"}, f.key_value_section("General"))
+        # Only the first colon separates the key from the value.
+        self.assertEqual("Some:Title", f.key_value_section("Metadata")["Title"])
+
+    def test_list_section(self):
+        f = OsuFile(CONTENTS)
+        self.assertEqual(["2,100,200"], f.list_section("Events"))
+        self.assertEqual(2, len(f.list_section("HitObjects", last_section=True)))
+
+    def test_crlf_line_endings(self):
+        f = OsuFile(CONTENTS.replace(b"\n", b"\r\n"))
+        self.assertEqual("0", f.key_value_section("General")["Mode"])
+        self.assertEqual(["2,100,200"], f.list_section("Events"))
+
+    def test_missing_section(self):
+        f = OsuFile(CONTENTS)
+        with self.assertRaisesRegex(Exception, r"searching for \[Difficulty\]"):
+            f.key_value_section("Difficulty")
+
+    def test_unterminated_section(self):
+        f = OsuFile(CONTENTS)
+        with self.assertRaisesRegex(Exception, "end of the section"):
+            f.list_section("HitObjects")
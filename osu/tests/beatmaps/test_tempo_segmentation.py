@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from osu.beatmap.tempo_segmentation import segment_beats
+
+
+class TestTempoSegmentation(unittest.TestCase):
+    def test_constant_tempo(self):
+        # 120 bpm with some noise.
+        beats = np.arange(200) * 0.5 + np.random.default_rng(0).normal(0, 0.01, 200)
+        self.assertEqual([[0, 199]], segment_beats(beats).tolist())
+
+    def test_tempo_change(self):
+        # 120 bpm for 100 beats followed by 150 bpm.
+        beats = np.concatenate(
+            (np.arange(100) * 0.5, 50 + np.arange(100) * 0.4))
+        self.assertEqual([[0, 99], [100, 199]], segment_beats(beats).tolist())
+
+    def test_gap_excluded(self):
+        # 120 bpm, then a 3 second gap, then 180 bpm.
+        beats = np.concatenate(
+            (np.arange(100) * 0.5, 52.5 + np.arange(100) / 3))
+        self.assertEqual([[0, 99], [100, 199]], segment_beats(beats).tolist())
+
+    def test_isolated_beat_tracking_errors(self):
+        # 120 bpm with single beats merged as happens with syncopation.
+        beats = np.arange(200) * 0.5
+        beats = np.delete(beats, [50, 120, 121])
+        self.assertEqual([[0, 196]], segment_beats(beats).tolist())
+
+    def test_short_beat_track(self):
+        beats = np.arange(10) * 0.5
+        self.assertEqual([[0, 9]], segment_beats(beats).tolist())
@@ -0,0 +1,251 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from osu.data_collection.beatmapset_downloader import PARTIAL_FILE_EXT, BeatmapsetDownloader, TokenBucket
+
+# Listing pages keyed by the cursor id requesting them, the first page has none.
+PAGES = {
+    None: {"beatmapsets": [{"id": 3}, {"id": 2}], "cursor": {"approved_date": "2019-01-02", "_id": "2"}},
+    "2": {"beatmapsets": [{"id": 1}], "cursor": None}
+}
+
+
+def archive(beatmapset_id):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as f:
+        # Large enough to arrive in several chunks.
+        f.writestr("audio.mp3", os.urandom(200000))
+        f.writestr(f"{beatmapset_id}.osu", f"beatmapset {beatmapset_id}")
+    return data.getvalue()
+
+
+class StubOsuHandler(BaseHTTPRequestHandler):
+    """Mimics the osu beatmapset search and download endpoints, failing the first downloads of beatmapsets as told.
+
+    A failure is a status code, or "truncate" to close the connection halfway through the archive."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        server = self.server
+        with server.lock:
+            server.paths.append(self.path)
+            server.ranges.append(self.headers.get("Range"))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if parts == ["beatmapsets", "search"]:
+                self.reply(200, json.dumps(
+                    PAGES[query.get("cursor[_id]", [None])[0]]).encode())
+            elif len(parts) == 3 and parts[2] == "download":
+                beatmapset_id = int(parts[1])
+                with server.lock:
+                    failures = server.failures.get(beatmapset_id, [])
+                    status = failures.pop(0) if failures else 200
+                # Hold the connection so concurrent downloads overlap.
+                time.sleep(server.delay)
+                if status not in (200, "truncate"):
+                    self.reply(status, b"", {"Retry-After": "0"}
+                               if status == 429 else {})
+                    return
+                self.send_archive(
+                    server.archives[beatmapset_id], status == "truncate")
+            else:
+                self.reply(404, b"")
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def send_archive(self, data, truncate):
+        ranges = self.headers.get("Range")
+        start = int(ranges[len("bytes="):-1]
+                    ) if ranges and not self.server.ignore_range else 0
+        if start >= len(data):
+            self.reply(416, b"")
+            return
+        self.send_response(206 if start else 200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        if truncate:
+            self.wfile.write(data[start:(start + len(data)) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[start:])
+
+    def reply(self, status, body, headers={}):
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestBeatmapsetDownloader(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOsuHandler)
+        self.server.lock = threading.Lock()
+        self.server.paths = []
+        self.server.ranges = []
+        self.server.archives = {i: archive(i) for i in range(6)}
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.failures = {}
+        self.server.delay = 0
+        self.server.ignore_range = False
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.session = requests.session()
+        self.download_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.download_dir)
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def downloader(self, **kwargs):
+        kwargs.setdefault("rate", 1000)
+        kwargs.setdefault("backoff", 0.01)
+        return BeatmapsetDownloader(self.session, base_url=self.base_url, download_dir=self.download_dir, **kwargs)
+
+    def read_archive(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_search_follows_cursor(self):
+        beatmapsets = list(self.downloader().search())
+        self.assertEqual([3, 2, 1], [b["id"] for b in beatmapsets])
+        self.assertIn("cursor%5B_id%5D=2", self.server.paths[1])
+
+    def test_search_pages(self):
+        pages = list(self.downloader().search_pages())
+        self.assertEqual([(None, PAGES[None]["beatmapsets"], PAGES[None]["cursor"]),
+                          (PAGES[None]["cursor"], PAGES["2"]["beatmapsets"], None)], pages)
+        # Resuming from a cursor skips the pages before it.
+        self.assertEqual([1], [b["id"] for b in self.downloader().search(
+            PAGES[None]["cursor"])])
+
+    def test_search_pages_stop(self):
+        pages = []
+        for page in self.downloader().search_pages(should_stop=lambda: len(pages) > 0):
+            pages.append(page)
+        # The second page is never requested.
+        self.assertEqual(1, len(pages))
+        self.assertEqual(1, len(self.server.paths))
+
+    def test_shared_between_threads(self):
+        self.server.delay = 0.2
+        downloader = self.downloader(concurrency=3)
+        paths = {}
+        threads = [threading.Thread(target=lambda i=i: paths.update({i: downloader.download(i)}))
+                   for i in range(6)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        for i in range(6):
+            self.assertEqual(downloader.archive_path(i), paths[i])
+            self.assertEqual(self.server.archives[i], self.read_archive(paths[i]))
+        # The downloads overlapped instead of running one after another.
+        self.assertEqual(6, self.server.max_active)
+        self.assertLess(elapsed, 1.0)
+
+    def test_retries(self):
+        self.server.failures = {1: [503, 429], 2: [503, 503]}
+        downloader = self.downloader(retries=2)
+        self.assertEqual(self.server.archives[1],
+                         self.read_archive(downloader.download(1)))
+        self.assertEqual(2, downloader.retry_count)
+        downloader = self.downloader(retries=1)
+        with self.assertRaisesRegex(Exception, "after 2 attempts"):
+            downloader.download(2)
+
+    def test_client_error_not_retried(self):
+        self.server.failures = {1: [404]}
+        with self.assertRaisesRegex(Exception, "status 404"):
+            self.downloader().download(1)
+        self.assertEqual(1, len(self.server.paths))
+
+    def test_resume(self):
+        self.server.failures = {1: ["truncate", "truncate"]}
+        downloader = self.downloader(retries=1)
+        with self.assertRaisesRegex(Exception, "after 2 attempts"):
+            downloader.download(1)
+        partial_path = downloader.archive_path(1) + PARTIAL_FILE_EXT
+        self.assertTrue(os.path.exists(partial_path))
+        self.assertFalse(os.path.exists(downloader.archive_path(1)))
+
+        # A later crawl picks up where the last one stopped.
+        progress = []
+        path = self.downloader().download(
+            1, lambda downloaded, total: progress.append((downloaded, total)))
+        data = self.server.archives[1]
+        self.assertEqual(data, self.read_archive(path))
+        self.assertFalse(os.path.exists(partial_path))
+        # Every attempt after the first asks for the rest of the archive only.
+        self.assertIsNone(self.server.ranges[0])
+        offsets = [int(r[len("bytes="):-1]) for r in self.server.ranges[1:]]
+        self.assertEqual(sorted(offsets), offsets)
+        self.assertLess(0, offsets[0])
+        self.assertEqual((len(data), len(data)), progress[-1])
+        self.assertLess(offsets[-1], progress[0][0])
+
+    def test_whole_archive_sent_despite_range(self):
+        downloader = self.downloader()
+        partial_path = downloader.archive_path(1) + PARTIAL_FILE_EXT
+        with open(partial_path, "wb") as f:
+            f.write(b"stale")
+        self.server.ignore_range = True
+        path = downloader.download(1)
+        self.assertEqual(self.server.archives[1], self.read_archive(path))
+
+    def test_corrupt_archive_discarded(self):
+        self.server.archives[1] = b"not a zip" * 1000
+        downloader = self.downloader()
+        with self.assertRaisesRegex(Exception, "not a valid zip file"):
+            downloader.download(1)
+        self.assertEqual([], os.listdir(self.download_dir))
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_rate(self):
+        bucket = TokenBucket(20, capacity=5)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        # The burst is free.
+        self.assertLess(time.monotonic() - start, 0.1)
+        for _ in range(10):
+            bucket.acquire()
+        self.assertGreater(time.monotonic() - start, 0.45)
+
+    def test_shared_between_threads(self):
+        bucket = TokenBucket(50)
+        start = time.monotonic()
+        threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(5)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 20 tokens with the first one free.
+        self.assertGreater(time.monotonic() - start, 19 / 50 - 0.01)
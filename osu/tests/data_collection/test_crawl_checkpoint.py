@@ -0,0 +1,109 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from osu.data_collection.crawl_checkpoint import CrawlCheckpoint
+
+FIRST_CURSOR = {"approved_date": "2019-01-02", "_id": "2"}
+SECOND_CURSOR = {"approved_date": "2019-01-01", "_id": "1"}
+
+
+class TestCrawlCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_cursor_waits_for_oldest_page(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin_walk()
+        checkpoint.add_page(None, [5, 4], FIRST_CURSOR)
+        checkpoint.add_page(FIRST_CURSOR, [3, 2], SECOND_CURSOR)
+        checkpoint.mark_done(5)
+        # Finishing the second page first does not skip beatmapset 4 on resume.
+        checkpoint.mark_done(3)
+        checkpoint.mark_done(2)
+        self.assertIsNone(CrawlCheckpoint(self.path).cursor)
+        checkpoint.mark_done(4)
+        self.assertEqual(SECOND_CURSOR, CrawlCheckpoint(self.path).cursor)
+
+    def test_resume(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin_walk()
+        checkpoint.add_page(None, [5, 4], FIRST_CURSOR)
+        checkpoint.mark_done(5)
+        checkpoint.mark_done(4)
+
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(FIRST_CURSOR, checkpoint.cursor)
+        self.assertTrue(checkpoint.is_done(5))
+        self.assertFalse(checkpoint.is_done(3))
+        checkpoint.begin_walk(checkpoint.cursor)
+        # The last page, with a beatmapset done in an earlier crawl.
+        checkpoint.add_page(FIRST_CURSOR, [3, 5], None)
+        self.assertFalse(checkpoint.complete)
+        checkpoint.mark_done(3)
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertTrue(checkpoint.complete)
+        self.assertIsNone(checkpoint.cursor)
+
+    def test_without_walk_cursor_kept(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin_walk(FIRST_CURSOR)
+        checkpoint.save()
+        # Only looking for newer beatmapsets.
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.add_page(None, [7], FIRST_CURSOR)
+        checkpoint.mark_done(7)
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(FIRST_CURSOR, checkpoint.cursor)
+        self.assertTrue(checkpoint.is_done(7))
+
+    def test_failed_beatmapset_does_not_hold_cursor(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin_walk()
+        checkpoint.add_page(None, [5, 4], FIRST_CURSOR)
+        checkpoint.add_page(FIRST_CURSOR, [3, 2], SECOND_CURSOR)
+        checkpoint.mark_done(5)
+        # Beatmapset 4 can never be downloaded.
+        checkpoint.mark_failed(4)
+        checkpoint.mark_done(3)
+        checkpoint.mark_done(2)
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertEqual(SECOND_CURSOR, checkpoint.cursor)
+        self.assertEqual({4}, checkpoint.failed_ids)
+        # Failed beatmapsets are not done, so a full crawl tries them again.
+        self.assertFalse(checkpoint.is_done(4))
+        checkpoint.begin_walk()
+        checkpoint.add_page(None, [5, 4], FIRST_CURSOR)
+        checkpoint.mark_done(4)
+        self.assertEqual(set(), CrawlCheckpoint(self.path).failed_ids)
+
+    def test_done_not_failed(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.mark_done(5)
+        checkpoint.mark_failed(5)
+        self.assertEqual(set(), checkpoint.failed_ids)
+        self.assertTrue(checkpoint.is_done(5))
+
+    def test_skips_saved_lazily(self):
+        checkpoint = CrawlCheckpoint(self.path)
+        checkpoint.begin_walk()
+        checkpoint.add_page(None, [5, 4], FIRST_CURSOR)
+        checkpoint.mark_done(5, save=False)
+        self.assertFalse(os.path.exists(self.path))
+        # Finishing the page moves the cursor, which is always saved.
+        checkpoint.mark_done(4, save=False)
+        self.assertEqual(FIRST_CURSOR, CrawlCheckpoint(self.path).cursor)
+
+    def test_other_version_ignored(self):
+        with open(self.path, "w") as f:
+            json.dump({"version": 0, "cursor": FIRST_CURSOR,
+                      "complete": False, "done_ids": [1]}, f)
+        checkpoint = CrawlCheckpoint(self.path)
+        self.assertIsNone(checkpoint.cursor)
+        self.assertFalse(checkpoint.is_done(1))
@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+
+from osu.data_collection.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+    def test_stages(self):
+        pipeline = Pipeline(range(20), queue_size=2)
+        pipeline.add_stage("double", lambda x: 2 * x, workers=3)
+        # None filters items out.
+        pipeline.add_stage("odd tens", lambda x: x if x %
+                           20 != 0 else None, workers=2)
+        self.assertEqual(sorted(2 * x for x in range(20) if x % 10 != 0),
+                         sorted(pipeline.run()))
+
+    def test_stages_overlap(self):
+        def slow(x):
+            time.sleep(0.1)
+            return x
+        pipeline = Pipeline(range(4)).add_stage(
+            "first", slow).add_stage("second", slow)
+        start = time.monotonic()
+        self.assertEqual([0, 1, 2, 3], list(pipeline.run()))
+        # Five steps of 0.1 seconds instead of eight.
+        self.assertLess(time.monotonic() - start, 0.75)
+
+    def test_backpressure(self):
+        taken = []
+
+        def source():
+            for i in range(100):
+                taken.append(i)
+                yield i
+        release = threading.Event()
+        pipeline = Pipeline(source(), queue_size=2).add_stage(
+            "blocked", lambda x: release.wait())
+        results = pipeline.run()
+
+        def stop():
+            pipeline.stop()
+            release.set()
+        threading.Timer(0.3, stop).start()
+        list(results)
+        # One item in the stage, two queued and one waiting to be queued.
+        self.assertLessEqual(len(taken), 4)
+
+    def test_stop_drains_in_flight_items(self):
+        started = []
+        finished = []
+        discarded = []
+
+        def work(x):
+            started.append(x)
+            time.sleep(0.1)
+            finished.append(x)
+            return x
+        pipeline = Pipeline(range(100), queue_size=2).add_stage(
+            "work", work, workers=2, discard=discarded.append)
+        results = []
+        for result in pipeline.run(lambda: len(results) >= 2):
+            results.append(result)
+        self.assertEqual(sorted(started), sorted(finished))
+        self.assertEqual(sorted(started), sorted(results))
+        # Whatever was still queued is discarded instead of started.
+        self.assertLessEqual(len(discarded), 2)
+        self.assertFalse(set(discarded) & set(started))
+        self.assertLess(len(started), 10)
+
+    def test_source_told_to_stop(self):
+        def source(should_stop):
+            # Skips items for as long as it is not stopped.
+            while not should_stop():
+                time.sleep(0.01)
+            yield from []
+        pipeline = Pipeline(source).add_stage("work", lambda x: x)
+        threading.Timer(0.3, pipeline.stop).start()
+        start = time.monotonic()
+        self.assertEqual([], list(pipeline.run()))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_error_skips_item(self):
+        errors = []
+
+        def fail(x):
+            if x % 3 == 0:
+                raise Exception(f"Bad item {x}.")
+            return x
+        pipeline = Pipeline(range(10)).add_stage(
+            "fail", fail, workers=2, on_error=lambda x, e: errors.append((x, str(e))))
+        self.assertEqual([1, 2, 4, 5, 7, 8], sorted(pipeline.run()))
+        self.assertEqual([(x, f"Bad item {x}.") for x in [0, 3, 6, 9]], sorted(errors))
+
+    def test_error_stops_pipeline(self):
+        def fail(x):
+            if x == 3:
+                raise Exception("Bad item.")
+            return x
+        pipeline = Pipeline(range(1000)).add_stage("fail", fail)
+        with self.assertRaisesRegex(Exception, "Bad item."):
+            list(pipeline.run())
@@ -0,0 +1,53 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from osu.training.corpus_loader import load_training_corpus
+
+TEST_BEATMAPS_DIR = "osu/tests/resources/beatmaps/"
+
+
+class TestCorpusLoader(unittest.TestCase):
+    def setUp(self):
+        self.training_folder = tempfile.mkdtemp()
+        self._create_beatmapset("2", {"valid_no_breaks.osu": 2060307})
+        self._create_beatmapset(
+            "1", {"valid_breaks.osu": 801333, "taiko.osu": 0})
+        # Marker for a beatmapset that failed during collection.
+        os.makedirs(os.path.join(self.training_folder, "3"))
+        # A stray file next to the beatmapsets.
+        with open(os.path.join(self.training_folder, "notes.txt"), "w") as f:
+            f.write("notes")
+
+    def tearDown(self):
+        shutil.rmtree(self.training_folder)
+
+    def test_serial(self):
+        self._assert_corpus(processes=1)
+
+    def test_pool(self):
+        self._assert_corpus(processes=2)
+
+    def _assert_corpus(self, processes):
+        records, failures = load_training_corpus(
+            self.training_folder, processes)
+        self.assertEqual([("1", 801333), ("2", 2060307)], [
+                         (r.beatmapset_id, r.beatmap_id) for r in records])
+        self.assertEqual(2, len(records[0].labels))
+        self.assertAlmostEqual(2.5, records[0].star_rating)
+        self.assertEqual(2, len(failures))
+        self.assertTrue(failures[0][0].endswith("taiko.osu"))
+        self.assertTrue(failures[1][0].endswith("notes.txt"))
+
+    def _create_beatmapset(self, beatmapset_id, beatmap_ids):
+        beatmapset_path = os.path.join(self.training_folder, beatmapset_id)
+        os.makedirs(beatmapset_path)
+        with open(os.path.join(beatmapset_path, "audio.csv"), "w") as f:
+            f.write("0.5,1.0,1.5\n")
+        with open(os.path.join(beatmapset_path, "difficulty.json"), "w") as f:
+            json.dump({str(beatmap_id): 2.5 for beatmap_id in beatmap_ids.values()}, f)
+        for file in beatmap_ids:
+            shutil.copyfile(os.path.join(TEST_BEATMAPS_DIR, file),
+                            os.path.join(beatmapset_path, file))
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from osu.beatmap.beatmap import Beatmap
+from osu.training.label_cache import LabelCache
+
+TEST_BEATMAPS_DIR = "osu/tests/resources/beatmaps/"
+
+
+class TestLabelCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_hit_matches_parse(self):
+        path = os.path.join(TEST_BEATMAPS_DIR, "valid_breaks.osu")
+        expected = Beatmap.from_osu_file(path)
+        cache = LabelCache(self.cache_dir)
+        cache.load_beatmap(path)
+        beatmap = cache.load_beatmap(path)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertTrue(cache.bytes_read > 0)
+        self.assertEqual((expected.id, expected.audio_path, expected.hp, expected.cs, expected.od, expected.ar),
+                         (beatmap.id, beatmap.audio_path, beatmap.hp, beatmap.cs, beatmap.od, beatmap.ar))
+        self.assertEqual(expected.get_training_labels(),
+                         beatmap.get_training_labels())
+
+    def test_failure_cached(self):
+        path = os.path.join(TEST_BEATMAPS_DIR, "taiko.osu")
+        cache = LabelCache(self.cache_dir)
+        for _ in range(2):
+            with self.assertRaisesRegex(Exception, "Not an osu standard beatmap."):
+                cache.load_beatmap(path)
+        self.assertEqual(1, cache.hits)
+
+    def test_clean(self):
+        cache = LabelCache(self.cache_dir)
+        for file in ["valid_breaks.osu", "valid_no_breaks.osu"]:
+            cache.load_beatmap(os.path.join(TEST_BEATMAPS_DIR, file))
+        os.makedirs(os.path.join(self.cache_dir, "v0"))
+        _, num_bytes = cache.disk_usage()
+        self.assertEqual(1, cache.clean(max_bytes=num_bytes - 1))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, "v0")))
+        self.assertEqual(1, cache.disk_usage()[0])
+
+    def test_clean_old_versions_and_leftovers(self):
+        cache = LabelCache(self.cache_dir)
+        path = os.path.join(TEST_BEATMAPS_DIR, "valid_breaks.osu")
+        cache.load_beatmap(path)
+        cache.version -= 1
+        cache.load_beatmap(path)
+        cache.version += 1
+        # A stray file next to the version directories and temporary files left by writers.
+        stray_path = os.path.join(self.cache_dir, "notes.txt")
+        open(stray_path, "w").close()
+        entry_path = cache._entry_path("ab" * 20)
+        orphaned_path = cache._temp_path(entry_path)
+        open(orphaned_path, "w").close()
+        an_hour_ago = time.time() - 60 * 60 - 1
+        os.utime(orphaned_path, (an_hour_ago, an_hour_ago))
+        writing_path = f"{entry_path}.0.0.tmp"
+        open(writing_path, "w").close()
+
+        # Only the entry of the old version is removed.
+        self.assertEqual(1, cache.clean())
+        self.assertEqual(1, cache.disk_usage()[0])
+        self.assertTrue(os.path.exists(stray_path))
+        self.assertFalse(os.path.exists(orphaned_path))
+        self.assertTrue(os.path.exists(writing_path))
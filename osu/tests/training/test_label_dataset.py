@@ -0,0 +1,40 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from osu.training.corpus_loader import TrainingRecord
+from osu.training.label_dataset import export_label_dataset, LabelDataset
+
+
+class TestLabelDataset(unittest.TestCase):
+    def setUp(self):
+        self.dataset_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dataset_dir)
+
+    def test_round_trip(self):
+        records = [
+            TrainingRecord("10", 100, None, 2.5, [
+                           np.array([1, 0, 2, 2], dtype=np.uint8), np.array([3, 3, 0], dtype=np.uint8)]),
+            TrainingRecord("11", 110, None, 4.0, [[1, 0, 0, 1]])
+        ]
+        self.assertEqual(3, export_label_dataset(records, self.dataset_dir))
+
+        dataset = LabelDataset(self.dataset_dir)
+        self.assertEqual(3, len(dataset))
+        self.assertIsInstance(dataset.labels, np.memmap)
+        self.assertEqual([3, 3, 0], dataset[1].tolist())
+        self.assertEqual([1, 0, 0, 1], dataset[2].tolist())
+        self.assertEqual([[1, 0, 2, 2], [3, 3, 0]], [
+                         s.tolist() for s in dataset.beatmap_sections(100)])
+        entry = dataset.index[2]
+        self.assertEqual((11, 110, 0), (entry["beatmapset_id"],
+                                        entry["beatmap_id"], entry["section"]))
+        self.assertAlmostEqual(4.0, entry["star_rating"])
+
+    def test_empty(self):
+        export_label_dataset([], self.dataset_dir)
+        self.assertEqual(0, len(LabelDataset(self.dataset_dir)))
@@ -0,0 +1,91 @@
+from functools import partial
+from multiprocessing import Pool
+import os
+
+from osu.audio.audio_preprocessor import AudioPreprocessor
+from osu.beatmap.beatmap import Beatmap
+from osu.difficulty.difficulty_properties import DifficultyProperties
+from osu.training.label_cache import LabelCache
+from osu.training.utils import is_osu_file, training_path
+
+
+class TrainingRecord:
+    def __init__(self, beatmapset_id, beatmap_id, onsets, star_rating, labels):
+        self.beatmapset_id = beatmapset_id
+        self.beatmap_id = beatmap_id
+        self.onsets = onsets
+        self.star_rating = star_rating
+        self.labels = labels
+
+
+def load_training_corpus(training_folder=None, processes=None, cache=None):
+    """Labels every beatmap of the training data, spreading beatmapsets across a pool of processes.
+
+    If a LabelCache is given, parsed beatmaps are read from and saved to it and its statistics include the work of every process.
+    Returns the training records ordered by beatmapset and file name along with a list of (path, error) tuples for the files that failed."""
+    if training_folder is None:
+        training_folder = training_path()
+    beatmapset_paths = [os.path.join(training_folder, beatmapset)
+                        for beatmapset in sorted(os.listdir(training_folder))]
+    label = partial(label_beatmapset,
+                    cache_dir=None if cache is None else cache.cache_dir)
+
+    if processes == 1:
+        return _merge_results(map(label, beatmapset_paths), cache)
+    with Pool(processes) as pool:
+        # imap keeps the results in the order of the beatmapsets.
+        return _merge_results(pool.imap(label, beatmapset_paths), cache)
+
+
+def label_beatmapset(beatmapset_path, cache_dir=None):
+    records = []
+    failures = []
+    cache = None if cache_dir is None else LabelCache(cache_dir)
+    stats = None if cache is None else cache.get_stats()
+    try:
+        # Stray files in the training folder are reported rather than read as beatmapsets.
+        files = sorted(os.listdir(beatmapset_path))
+    except OSError as e:
+        failures.append((beatmapset_path, str(e)))
+        return records, failures, stats
+    # Skip markers for beatmapsets that failed during collection.
+    if len(files) == 0:
+        return records, failures, stats
+
+    beatmapset_id = os.path.basename(beatmapset_path)
+    try:
+        # Records outlive the beatmapset, and every memory map holds a file descriptor open.
+        onsets = AudioPreprocessor.read_training_audio(
+            beatmapset_path, mmap_mode=None)
+        star_difficulties = DifficultyProperties.read_training_star_difficulties(
+            beatmapset_path)
+    except Exception as e:
+        failures.append((beatmapset_path, str(e)))
+        return records, failures, stats
+
+    for file in files:
+        if not is_osu_file(file):
+            continue
+        osu_file = os.path.join(beatmapset_path, file)
+        try:
+            if cache is None:
+                beatmap = Beatmap.from_osu_file(osu_file, columnar=True)
+            else:
+                beatmap = cache.load_beatmap(osu_file)
+            star_rating = star_difficulties[str(beatmap.id)]
+            records.append(TrainingRecord(beatmapset_id, beatmap.id,
+                                          onsets, star_rating, beatmap.get_training_labels()))
+        except Exception as e:
+            failures.append((osu_file, str(e)))
+    return records, failures, None if cache is None else cache.get_stats()
+
+
+def _merge_results(results, cache):
+    records = []
+    failures = []
+    for beatmapset_records, beatmapset_failures, stats in results:
+        records.extend(beatmapset_records)
+        failures.extend(beatmapset_failures)
+        if cache is not None:
+            cache.add_stats(stats)
+    return records, failures
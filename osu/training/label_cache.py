@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from osu.beatmap.beatmap import Beatmap
+from osu.npz_cache import NpzCache
+
+DEFAULT_CACHE_DIR = "osu/label_cache"
+
+# Bump whenever the parser or labeler output changes so stale entries are never read.
+LABEL_CACHE_VERSION = 2
+
+
+class CachedBeatmap:
+    """Metadata and training labels of a beatmap restored from the label cache."""
+
+    def __init__(self, metadata, labels):
+        self.id = metadata["id"]
+        self.audio_path = metadata["audio_path"]
+        self.hp = metadata["hp"]
+        self.cs = metadata["cs"]
+        self.od = metadata["od"]
+        self.ar = metadata["ar"]
+        self.labels = labels
+
+    def get_training_labels(self):
+        return [labels.tolist() for labels in self.labels]
+
+
+class LabelCache(NpzCache):
+    """Caches parsed beatmaps and their training labels on disk keyed by the .osu file contents.
+
+    Every entry is a small .npz sidecar holding the labels of all sections concatenated into one uint8 array.
+    Beatmaps that fail to parse are cached as well so they are not parsed again."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        super().__init__(cache_dir, LABEL_CACHE_VERSION)
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def load_beatmap(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        entry_path = self._entry_path(hashlib.sha1(data).hexdigest())
+        entry = self._read_entry(entry_path)
+        if entry is not None:
+            self.hits += 1
+            metadata, sections = entry
+            error = metadata.get("error")
+            if error is not None:
+                raise Exception(error)
+            return CachedBeatmap(metadata, sections)
+        self.misses += 1
+
+        try:
+            beatmap = Beatmap.from_bytes(data, columnar=True)
+        except Exception as e:
+            self._write_entry(entry_path, {"error": str(e)}, [])
+            raise
+        metadata = {"id": beatmap.id, "audio_path": beatmap.audio_path,
+                    "hp": beatmap.hp, "cs": beatmap.cs, "od": beatmap.od, "ar": beatmap.ar}
+        self._write_entry(entry_path, metadata,
+                          beatmap.get_training_labels())
+        return beatmap
+
+    def add_stats(self, stats):
+        self.hits += stats["hits"]
+        self.misses += stats["misses"]
+        self.bytes_read += stats["bytes_read"]
+        self.bytes_written += stats["bytes_written"]
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "bytes_read": self.bytes_read, "bytes_written": self.bytes_written}
+
+    def _read_entry(self, entry_path):
+        try:
+            with np.load(entry_path) as entry:
+                metadata = json.loads(str(entry["metadata"]))
+                labels = entry["labels"]
+                section_lengths = entry["section_lengths"]
+        except FileNotFoundError:
+            return None
+        self.bytes_read += os.path.getsize(entry_path)
+        self._mark_used(entry_path)
+        return metadata, np.split(labels, np.cumsum(section_lengths)[:-1])
+
+    def _write_entry(self, entry_path, metadata, sections):
+        labels = np.concatenate(sections) if sections else np.empty(
+            0, dtype=np.uint8)
+        section_lengths = np.array([len(s) for s in sections], dtype=np.int64)
+        temp_path = self._temp_path(entry_path)
+        with open(temp_path, "wb") as f:
+            np.savez(f, metadata=np.array(json.dumps(metadata)),
+                     labels=labels.astype(np.uint8), section_lengths=section_lengths)
+        os.replace(temp_path, entry_path)
+        self.bytes_written += os.path.getsize(entry_path)
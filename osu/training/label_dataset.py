@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+LABELS_FILE_NAME = "labels.bin"
+INDEX_FILE_NAME = "index.npy"
+
+# One row per divisor section locating its labels within the packed labels file.
+INDEX_DTYPE = np.dtype([
+    ("beatmapset_id", np.int64),
+    ("beatmap_id", np.int64),
+    ("section", np.int32),
+    ("star_rating", np.float32),
+    ("start", np.int64),
+    ("length", np.int64)
+])
+
+
+def export_label_dataset(records, output_dir):
+    """Writes the labels of all training records as one contiguous uint8 file plus an index of every divisor section.
+
+    Returns the number of sections written."""
+    os.makedirs(output_dir, exist_ok=True)
+    index = []
+    start = 0
+    with open(os.path.join(output_dir, LABELS_FILE_NAME), "wb") as f:
+        for record in records:
+            for section, labels in enumerate(record.labels):
+                labels = np.asarray(labels, dtype=np.uint8)
+                f.write(labels.tobytes())
+                index.append((int(record.beatmapset_id), record.beatmap_id,
+                              section, record.star_rating, start, labels.size))
+                start += labels.size
+    np.save(os.path.join(output_dir, INDEX_FILE_NAME),
+            np.array(index, dtype=INDEX_DTYPE))
+    return len(index)
+
+
+class LabelDataset:
+    """Read-only view of an exported label dataset.
+
+    The labels are memory-mapped so opening the dataset is instant and only the sections accessed are paged in."""
+
+    def __init__(self, dataset_dir):
+        self.index = np.load(os.path.join(dataset_dir, INDEX_FILE_NAME))
+        labels_path = os.path.join(dataset_dir, LABELS_FILE_NAME)
+        # Memory-mapping an empty file is not allowed.
+        if os.path.getsize(labels_path) == 0:
+            self.labels = np.empty(0, dtype=np.uint8)
+        else:
+            self.labels = np.memmap(labels_path, dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return self.index.size
+
+    def __getitem__(self, i):
+        entry = self.index[i]
+        start = entry["start"]
+        return self.labels[start:start + entry["length"]]
+
+    def beatmap_sections(self, beatmap_id):
+        """Returns the labels of every divisor section of a beatmap in order."""
+        indices = np.flatnonzero(self.index["beatmap_id"] == beatmap_id)
+        return [self[i] for i in indices]
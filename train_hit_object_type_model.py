@@ -1,21 +1,37 @@
-import os
+import argparse
 
-from osu.audio.audio_preprocessor import AudioPreprocessor
-from osu.beatmap.beatmap import Beatmap
-from osu.difficulty.difficulty_properties import DifficultyProperties
-from osu.training.utils import is_osu_file, training_path
+from osu.training.corpus_loader import load_training_corpus
+from osu.training.label_cache import DEFAULT_CACHE_DIR, LabelCache
+from osu.training.label_dataset import export_label_dataset
 
-training_folder = training_path()
-for beatmapset in os.listdir(training_folder):
-    beatmapset_path = os.path.join(training_folder, beatmapset)
-    files = os.listdir(beatmapset_path)
-    # Check that this is not just a marker for a failed beatmapset during collection.
-    if len(files) > 0:
-        onsets = AudioPreprocessor.read_training_audio(beatmapset_path)
-        difficulty_json = DifficultyProperties.read_training_star_difficulties(
-            beatmapset_path)
-        for file in files:
-            if is_osu_file(file):
-                osu_file = os.path.join(beatmapset_path, file)
-                beatmap = Beatmap.from_osu_file(osu_file)
-                labels = beatmap.get_training_labels()
+
+def set_and_parse_args():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--processes", help="number of worker processes used to label the training data, defaults to the number of cores",
+                        type=int, default=None)
+    parser.add_argument("--cache-dir", help="directory of the parsed beatmap and label cache",
+                        default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--no-cache", help="always parse and label every beatmap",
+                        action="store_true")
+    parser.add_argument("--export-dataset", help="directory to export the labels to as a packed, memory-mappable dataset",
+                        default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = set_and_parse_args()
+    cache = None if args.no_cache else LabelCache(args.cache_dir)
+    records, failures = load_training_corpus(
+        processes=args.processes, cache=cache)
+    for path, error in failures:
+        print(f"Skipped [{path}]: {error}")
+    print(f"Loaded {len(records)} beatmaps, skipped {len(failures)} files.")
+    if cache is not None:
+        stats = cache.get_stats()
+        print(
+            f"Label cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes_read']} bytes read, {stats['bytes_written']} bytes written.")
+    if args.export_dataset is not None:
+        num_sections = export_label_dataset(records, args.export_dataset)
+        print(
+            f"Exported {num_sections} sections to {args.export_dataset}.")